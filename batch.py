@@ -0,0 +1,239 @@
+import contextlib
+import io
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import List
+from book import ValidationError as BookValidationError
+from models import Book
+from user import ValidationError as UserValidationError
+
+
+@dataclass(slots=True)
+class OperationResult:
+    """
+    The outcome of one operation of a batch.
+
+    Attributes:
+    - line (int): The line of the script holding the operation.
+    - operation (str): The operation as written in the script.
+    - succeeded (bool): Whether the operation succeeded.
+    - message (str): The last message the managers printed, or the reason the operation was rejected.
+    """
+
+    line: int
+    operation: str
+    succeeded: bool
+    message: str
+
+
+@dataclass(slots=True)
+class BatchReport:
+    """
+    The outcome of a batch.
+
+    Attributes:
+    - operations (int): The number of operations run.
+    - succeeded (int): The number of operations that succeeded.
+    - failures (list): The OperationResult of each failed operation.
+    - elapsed (float): The time in seconds spent running the operations.
+    - commit_time (float): The time in seconds spent writing their changes.
+    """
+
+    operations: int = 0
+    succeeded: int = 0
+    failures: List[OperationResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    commit_time: float = 0.0
+
+
+class BatchRunner:
+    """
+    Runs scripts of library operations against the managers in one process.
+
+    A script holds one operation per line, written like a shell command: the words are
+    split with shlex, so arguments containing spaces are quoted, and "#" starts a comment.
+    The operations are:
+
+    - add-book TITLE AUTHOR ISBN
+    - update-book ISBN [TITLE [AUTHOR [NEW_ISBN]]], where a missing or empty field keeps its value
+    - delete-book ISBN
+    - add-user NAME USER_ID
+    - update-user USER_ID NAME
+    - delete-user USER_ID
+    - checkout USER_ID ISBN
+    - checkin USER_ID ISBN
+
+    The changes of a batch are written once, when it ends: the storage should queue saves
+    until it is flushed, like a BufferedStorage without a max_delay or max_batch does. With
+    shared data files the batch holds the storage transaction throughout, so no other
+    process changes the data between its operations.
+
+    Attributes:
+    - book_manager (BookManager): The manager of the books.
+    - user_manager (UserManager): The manager of the users.
+    - check_manager (CheckManager): The manager of the checkouts.
+    - storage (BaseStorage): The storage backend flushed at the end of each batch.
+    """
+
+    OPERATIONS = {
+        "add-book": ("_add_book", ("TITLE", "AUTHOR", "ISBN"), ()),
+        "update-book": ("_update_book", ("ISBN",), ("TITLE", "AUTHOR", "NEW_ISBN")),
+        "delete-book": ("_delete_book", ("ISBN",), ()),
+        "add-user": ("_add_user", ("NAME", "USER_ID"), ()),
+        "update-user": ("_update_user", ("USER_ID", "NAME"), ()),
+        "delete-user": ("_delete_user", ("USER_ID",), ()),
+        "checkout": ("_checkout", ("USER_ID", "ISBN"), ()),
+        "checkin": ("_checkin", ("USER_ID", "ISBN"), ()),
+    }
+
+    def __init__(self, book_manager, user_manager, check_manager, storage):
+        """
+        Initializes a BatchRunner object.
+
+        Args:
+        - book_manager (BookManager): The manager of the books.
+        - user_manager (UserManager): The manager of the users.
+        - check_manager (CheckManager): The manager of the checkouts.
+        - storage (BaseStorage): The storage backend flushed at the end of each batch.
+        """
+        self.book_manager = book_manager
+        self.user_manager = user_manager
+        self.check_manager = check_manager
+        self.storage = storage
+
+    def run(self, lines, stop_on_error=False, verbose=True):
+        """
+        Runs the operations of a script and commits their changes once.
+
+        Operations that fail do not stop the batch unless stop_on_error is set; the
+        changes of the operations run before are committed either way.
+
+        Args:
+        - lines (iterable): The lines of the script.
+        - stop_on_error (bool): Whether to stop at the first failed operation (default is False).
+        - verbose (bool): Whether to print the result of every operation rather than only of
+          the failed ones (default is True).
+
+        Returns:
+        - BatchReport: The outcome of the batch.
+        """
+        report = BatchReport()
+        start = time.perf_counter()
+        with self.storage.transaction():
+            # The checkouts decide which books the users hold, so lazily created managers
+            # must load them before any user is checked for loans.
+            len(self.check_manager.checkouts)
+            for number, line in enumerate(lines, 1):
+                try:
+                    words = shlex.split(line, comments=True)
+                except ValueError as e:
+                    result = OperationResult(number, line.strip(), False, f"Invalid line: {e}.")
+                else:
+                    if not words:
+                        continue
+                    result = self.execute(words, number)
+                report.operations += 1
+                if result.succeeded:
+                    report.succeeded += 1
+                else:
+                    report.failures.append(result)
+                if verbose or not result.succeeded:
+                    print_operation_result(result)
+                if stop_on_error and not result.succeeded:
+                    break
+            report.elapsed = time.perf_counter() - start
+            self.storage.flush()
+        report.commit_time = time.perf_counter() - start - report.elapsed
+        return report
+
+    def execute(self, words, line=1):
+        """
+        Runs a single operation, capturing what the managers print about it.
+
+        Args:
+        - words (list): The operation name followed by its arguments.
+        - line (int): The line of the script holding the operation (default is 1).
+
+        Returns:
+        - OperationResult: The outcome of the operation.
+        """
+        operation = shlex.join(words)
+        name, arguments = words[0], words[1:]
+        if name not in self.OPERATIONS:
+            return OperationResult(line, operation, False, f"Unknown operation '{name}'.")
+        method, required, optional = self.OPERATIONS[name]
+        if not len(required) <= len(arguments) <= len(required) + len(optional):
+            usage = " ".join([name, *required, *(f"[{argument}]" for argument in optional)])
+            return OperationResult(line, operation, False, f"Usage: {usage}")
+
+        self.check_manager.refresh()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                succeeded = getattr(self, method)(*arguments) is not False
+                message = ""
+            except (BookValidationError, UserValidationError) as e:
+                succeeded, message = False, e.message
+        lines = output.getvalue().strip().splitlines()
+        return OperationResult(line, operation, succeeded, message or (lines[-1] if lines else ""))
+
+    def _add_book(self, title, author, isbn):
+        self.book_manager.add_book(title, author, isbn)
+
+    def _update_book(self, isbn, title="", author="", new_isbn=""):
+        book = self.book_manager.get_book_by_isbn(isbn)
+        if book is None:
+            print(f"Book with ISBN '{isbn}' not found.")
+            return False
+        return self.book_manager.update_book(book, Book(title or book.title, author or book.author,
+                                                        new_isbn or book.isbn))
+
+    def _delete_book(self, isbn):
+        return self.book_manager.delete_book(isbn)
+
+    def _add_user(self, name, user_id):
+        self.user_manager.add_user(name, user_id)
+
+    def _update_user(self, user_id, name):
+        return self.user_manager.update_user(user_id, name)
+
+    def _delete_user(self, user_id):
+        return self.user_manager.delete_user(user_id)
+
+    def _checkout(self, user_id, isbn):
+        return self.check_manager.checkout_book(user_id, isbn)
+
+    def _checkin(self, user_id, isbn):
+        return self.check_manager.checkin_book(user_id, isbn)
+
+
+def print_operation_result(result):
+    """
+    Prints the outcome of one operation of a batch.
+
+    Args:
+    - result (OperationResult): The outcome of the operation.
+    """
+    status = "ok" if result.succeeded else "FAILED"
+    print(f"line {result.line}: {status}: {result.operation}" + (f" -> {result.message}" if result.message else ""))
+
+
+def print_batch_report(report, limit=20):
+    """
+    Prints the outcome of a batch.
+
+    Args:
+    - report (BatchReport): The outcome of the batch.
+    - limit (int): The maximum number of failed operations to list (default is 20).
+    """
+    rate = report.operations / report.elapsed if report.elapsed else 0
+    print(f"Ran {report.operations} operations in {report.elapsed:.3f} s ({rate:.0f} operations/s) "
+          f"and committed them in {report.commit_time:.3f} s.")
+    print(f"{report.succeeded} succeeded, {len(report.failures)} failed.")
+    if report.failures:
+        print("Failed operations:")
+        for result in report.failures[:limit]:
+            print(f"- line {result.line}: {result.operation}: {result.message}")
+        if len(report.failures) > limit:
+            print(f"- ... and {len(report.failures) - limit} more")
@@ -0,0 +1,772 @@
+import argparse
+import contextlib
+import dataclasses
+import gc
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from book import BookManager
+from book import MappedBookManager
+from catalog import ColumnarCatalog
+from mapped_catalog import write_mapped_catalog
+from sharded_storage import ShardedStorage
+from check import CheckManager
+from models import Book, User
+from query import Query
+from server import LibraryServer
+from stats import collect_stats
+from storage import Storage
+from user import UserManager
+from writer import BufferedStorage
+
+
+def generate_dataset(directory, num_books, num_users, loans_per_user):
+    """
+    Writes a synthetic catalog in the pre-normalisation file layout, where users embed
+    their borrowed books and checkouts embed full user and book copies.
+
+    Args:
+    - directory (str): The directory to write books.json, users.json, and checkouts.json to.
+    - num_books (int): The number of books.
+    - num_users (int): The number of users.
+    - loans_per_user (int): The number of books checked out by each user.
+    """
+    rng = random.Random(0)
+    books = [{"title": f"Title {i}", "author": f"Author {i % 5000}", "isbn": f"978{i:010d}", "available": True}
+             for i in range(num_books)]
+    loaned = iter(rng.sample(range(num_books), min(num_books, num_users * loans_per_user)))
+    users, checkouts = [], []
+    for i in range(num_users):
+        user = {"name": f"User {i}", "user_id": f"u{i}", "borrowed_books": []}
+        for _ in range(loans_per_user):
+            book = books[next(loaned)]
+            book["available"] = False
+            user["borrowed_books"].append(dict(book))
+            checkouts.append([user, dict(book)])
+        users.append(user)
+    for name, data in (("books.json", books), ("users.json", users), ("checkouts.json", checkouts)):
+        with open(os.path.join(directory, name), "w") as file:
+            json.dump(data, file)
+
+
+def load_with_copies(directory):
+    """
+    Loads a dataset the way Storage did before identity mapping: every borrowed book and
+    every checkout gets its own Book (and User) copies.
+
+    Args:
+    - directory (str): The dataset directory.
+
+    Returns:
+    - tuple: The books, users, and checkouts.
+    """
+    def read(name):
+        with open(os.path.join(directory, name)) as file:
+            return json.load(file)
+
+    def user_from(data):
+        return User(data["name"], data["user_id"], [Book(**book) for book in data["borrowed_books"]])
+
+    books = [Book(**data) for data in read("books.json")]
+    users = [user_from(data) for data in read("users.json")]
+    checkouts = [(user_from(user), Book(**book)) for user, book in read("checkouts.json")]
+    return books, users, checkouts
+
+
+def load_with_identity_map(directory):
+    """
+    Loads a dataset through the managers, so every book exists once.
+
+    Args:
+    - directory (str): The dataset directory.
+
+    Returns:
+    - tuple: The book, user, and check managers.
+    """
+    storage = Storage(*(os.path.join(directory, name) for name in ("books.json", "users.json", "checkouts.json")))
+    book_manager = BookManager(storage)
+    user_manager = UserManager(storage, book_manager)
+    return book_manager, user_manager, CheckManager(book_manager, user_manager, storage)
+
+
+def count_books(*roots):
+    """
+    Counts the distinct Book objects reachable from the given lists, users, and tuples.
+
+    Returns:
+    - int: The number of distinct Book instances.
+    """
+    seen = set()
+    stack = list(roots)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Book):
+            seen.add(id(item))
+        elif isinstance(item, User):
+            stack.extend(item.borrowed_books)
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return len(seen)
+
+
+def measure(loader, directory):
+    """
+    Runs a loader under tracemalloc.
+
+    Args:
+    - loader (callable): The loader to run.
+    - directory (str): The dataset directory.
+
+    Returns:
+    - tuple: The loader result, the seconds taken, and the retained and peak bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loader(directory)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def bench_identity(args):
+    """
+    Compares startup time, memory, and Book instance counts with and without identity mapping.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, args.loans)
+        print(f"{'loader':<14}{'seconds':>10}{'retained MiB':>15}{'peak MiB':>11}{'Book objects':>15}")
+
+        (books, users, checkouts), elapsed, retained, peak = measure(load_with_copies, directory)
+        instances = count_books(books, users, checkouts)
+        print(f"{'copies':<14}{elapsed:>10.3f}{retained / 2**20:>15.1f}{peak / 2**20:>11.1f}{instances:>15}")
+        del books, users, checkouts
+
+        (book_manager, user_manager, check_manager), elapsed, retained, peak = measure(load_with_identity_map, directory)
+        instances = count_books(book_manager.books, user_manager.users)
+        print(f"{'identity map':<14}{elapsed:>10.3f}{retained / 2**20:>15.1f}{peak / 2**20:>11.1f}{instances:>15}")
+
+
+def bench_load(args):
+    """
+    Compares the time and peak memory of loading the books from a JSON array file and from
+    a line-delimited file, and the time until a lazily created BookManager is ready.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        books = Storage(os.path.join(directory, "books.json")).load_books()
+        print(f"{'layout':<16}{'load seconds':>14}{'peak MiB':>11}")
+        for layout, line_delimited in (("JSON array", False), ("line-delimited", True)):
+            storage = Storage(os.path.join(directory, f"{layout}.json"), line_delimited=line_delimited)
+            storage.save_books(books)
+            _, elapsed, _, peak = measure(lambda _: storage.load_books(), directory)
+            print(f"{layout:<16}{elapsed:>14.3f}{peak / 2**20:>11.1f}")
+
+        start = time.perf_counter()
+        BookManager(Storage(os.path.join(directory, "line-delimited.json")), lazy=True)
+        print(f"lazy BookManager ready in {time.perf_counter() - start:.6f} seconds")
+
+
+def bench_memory(args):
+    """
+    Compares the memory retained by the books held as dataclasses with a per-instance
+    __dict__, as slotted Book objects, and in a ColumnarCatalog.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    DictBook = dataclasses.make_dataclass("DictBook", [("title", str), ("author", str), ("isbn", str),
+                                                       ("available", bool)])
+
+    def read(directory):
+        with open(os.path.join(directory, "books.json")) as file:
+            return json.load(file)
+
+    loaders = (
+        ("dataclass", lambda directory: [DictBook(**data) for data in read(directory)]),
+        ("slots", lambda directory: [Book(**data) for data in read(directory)]),
+        ("columnar", lambda directory: ColumnarCatalog(Book(**data) for data in read(directory))),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        print(f"{'layout':<12}{'seconds':>10}{'retained MiB':>15}{'bytes/book':>12}")
+        for layout, loader in loaders:
+            books, elapsed, retained, _ = measure(loader, directory)
+            print(f"{layout:<12}{elapsed:>10.3f}{retained / 2**20:>15.1f}{retained / len(books):>12.0f}")
+            del books
+
+
+def bench_snapshot(args):
+    """
+    Compares the save and load times and the file sizes of the JSON, line-delimited JSON,
+    and binary snapshot data file formats.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    formats = (
+        ("JSON", {}),
+        ("JSON lines", {"line_delimited": True}),
+        ("binary", {"binary": True}),
+        ("binary+zlib", {"binary": True, "compress": True}),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, args.loans)
+        source = Storage(*(os.path.join(directory, name) for name in ("books.json", "users.json", "checkouts.json")))
+        books = source.load_books()
+        users = source.load_users({book.isbn: book for book in books})
+        checkouts = source.load_checkouts()
+        print(f"{'format':<14}{'save seconds':>14}{'load seconds':>14}{'size MiB':>10}")
+        for index, (name, options) in enumerate(formats):
+            paths = [os.path.join(directory, f"{index}-{kind}") for kind in ("books", "users", "checkouts")]
+            storage = Storage(*paths, **options)
+            start = time.perf_counter()
+            storage.save_books(books)
+            storage.save_users(users)
+            storage.save_checkouts(checkouts)
+            saved = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded_books = storage.load_books()
+            storage.load_users({book.isbn: book for book in loaded_books})
+            storage.load_checkouts()
+            loaded = time.perf_counter() - start
+            size = sum(os.path.getsize(path) for path in paths)
+            print(f"{name:<14}{saved:>14.3f}{loaded:>14.3f}{size / 2**20:>10.1f}")
+
+
+def bench_mapped(args):
+    """
+    Compares opening the books with BookManager and with MappedBookManager: the time and
+    memory taken until lookups can be served, and the time of an ISBN lookup.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        books_path = os.path.join(directory, "books.json")
+        map_path = os.path.join(directory, "books.map")
+        write_mapped_catalog(map_path, Storage(books_path).load_books())
+        isbns = [f"978{i:010d}" for i in random.Random(1).sample(range(args.books), min(args.books, 10000))]
+        openers = (
+            ("BookManager", lambda _: BookManager(Storage(books_path))),
+            ("mapped", lambda _: MappedBookManager(map_path)),
+        )
+        print(f"{'manager':<14}{'open seconds':>14}{'retained MiB':>15}{'lookup us':>11}")
+        for name, opener in openers:
+            manager, elapsed, retained, _ = measure(opener, directory)
+            start = time.perf_counter()
+            for isbn in isbns:
+                manager.get_book_by_isbn(isbn)
+            lookup = (time.perf_counter() - start) / len(isbns) * 1e6
+            print(f"{name:<14}{elapsed:>14.3f}{retained / 2**20:>15.1f}{lookup:>11.2f}")
+            del manager
+
+
+def bench_sharded(args):
+    """
+    Compares the time of single-book saves, and the data rewritten by each, between a
+    Storage rewriting its whole books file and ShardedStorage with different shard counts.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        books = Storage(os.path.join(directory, "books.json")).load_books()
+        changed = random.Random(2).sample(books, min(len(books), args.updates))
+        backends = [("Storage", Storage(os.path.join(directory, "whole.json"), line_delimited=True), 1)]
+        backends += [(f"{shards} shards", ShardedStorage(os.path.join(directory, f"sharded-{shards}"), shards), shards)
+                     for shards in args.shards]
+        print(f"{'backend':<14}{'ms/save':>10}{'KiB rewritten/save':>20}")
+        for name, storage, shards in backends:
+            storage.save_books(books)
+            start = time.perf_counter()
+            for book in changed:
+                book.available = not book.available
+                storage.save_books(books, upserts=[book])
+            elapsed = (time.perf_counter() - start) / len(changed) * 1000
+            path = storage.books_file_path
+            if os.path.isdir(path):
+                rewritten = sum(os.path.getsize(os.path.join(path, shard)) for shard in os.listdir(path)
+                                if "." not in shard)
+            else:
+                rewritten = os.path.getsize(path)
+            print(f"{name:<14}{elapsed:>10.2f}{rewritten / shards / 1024:>20.1f}")
+
+
+def bench_writer(args):
+    """
+    Compares a burst of availability changes saved synchronously by Storage with the same
+    burst queued to a BufferedStorage: the time until the changes are made and the time
+    until they are written.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        books_path = os.path.join(directory, "books.json")
+        backends = (
+            ("Storage", lambda: Storage(books_path)),
+            ("BufferedStorage", lambda: BufferedStorage(Storage(books_path), args.max_delay)),
+        )
+        print(f"{'backend':<17}{'ms/change':>11}{'seconds to durable':>20}")
+        for name, opener in backends:
+            storage = opener()
+            manager = BookManager(storage)
+            changed = random.Random(3).sample(manager.books, min(len(manager.books), args.updates))
+            start = time.perf_counter()
+            for book in changed:
+                manager.set_availability(book, not book.available)
+            elapsed = time.perf_counter() - start
+            storage.flush()
+            durable = time.perf_counter() - start
+            storage.close()
+            print(f"{name:<17}{elapsed / len(changed) * 1000:>11.3f}{durable:>20.3f}")
+
+
+def bench_pages(args):
+    """
+    Compares taking a page of books in title order from the sorted index with sorting a
+    copy of all books for every page, for the first page and for a page deep in the
+    listing.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, 0, 0)
+        manager = BookManager(Storage(os.path.join(directory, "books.json")))
+        depth = args.books // 2
+
+        def sort_per_page(start):
+            books = sorted(manager.books, key=lambda book: (book.title.lower(), book.isbn))
+            return books[start:start + args.page_size]
+
+        cursor = manager.page_books("title", None, depth)[1]
+        assert manager.page_books("title", cursor, args.page_size)[0] == sort_per_page(depth)
+        methods = (
+            ("sort per page", lambda: sort_per_page(0), lambda: sort_per_page(depth)),
+            ("sorted index", lambda: manager.page_books("title", None, args.page_size),
+             lambda: manager.page_books("title", cursor, args.page_size)),
+        )
+        print(f"{'method':<15}{'first page ms':>15}{'deep page ms':>15}")
+        for name, first, deep in methods:
+            timings = []
+            for take in (first, deep):
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    take()
+                timings.append((time.perf_counter() - start) / args.repeat * 1000)
+            print(f"{name:<15}{timings[0]:>15.3f}{timings[1]:>15.3f}")
+
+
+def bench_query(args):
+    """
+    Compares running queries through the planner with filtering and sorting every book,
+    and prints the path the planner chose for each.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, args.loans)
+        storage = Storage(os.path.join(directory, "books.json"), os.path.join(directory, "users.json"),
+                          os.path.join(directory, "checkouts.json"))
+        book_manager = BookManager(storage)
+        check_manager = CheckManager(book_manager, UserManager(storage), storage)
+        queries = (
+            ([("author", "=", "Author 42")], "title", 20),
+            ([("title", "contains", "12345")], None, None),
+            ([("available", "=", "false")], "title", 20),
+            ([("title", "prefix", "title 99")], "author", 20),
+            ([("author", "contains", "author 7"), ("available", "=", "true")], "isbn", 50),
+        )
+        print(f"{'query':<72}{'full scan ms':>14}{'planned ms':>12}  path")
+        for conditions, order, limit in queries:
+            query = Query.books(book_manager, check_manager)
+            for condition in conditions:
+                query.where(*condition)
+            if order:
+                query.order_by(order)
+
+            def full_scan():
+                found = [book for book in book_manager.books
+                         if all(condition.matches(query.source.value(book, condition.field))
+                                for condition in query.conditions)]
+                if order:
+                    found.sort(key=query.source.sort_key(order))
+                return found[:limit]
+
+            if order:
+                assert query.run(limit) == full_scan()
+            else:
+                assert sorted(query.run(limit), key=query.source.sort_key("isbn")) == \
+                    sorted(full_scan(), key=query.source.sort_key("isbn"))
+            timings = []
+            for run in (full_scan, lambda: query.run(limit)):
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    run()
+                timings.append((time.perf_counter() - start) / args.repeat * 1000)
+            plan = query.explain(limit).splitlines()[1].removeprefix("Read: ")
+            description = " and ".join(" ".join(condition) for condition in conditions)
+            description += (f" order by {order}" if order else "") + (f" limit {limit}" if limit else "")
+            print(f"{description:<72}{timings[0]:>14.3f}{timings[1]:>12.3f}  {plan}")
+
+
+def bench_stats(args):
+    """
+    Compares collecting the library's counts from the maintained counters with counting
+    them by iterating the books and the users' borrowed books.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, args.loans)
+        storage = Storage(os.path.join(directory, "books.json"), os.path.join(directory, "users.json"),
+                          os.path.join(directory, "checkouts.json"))
+        book_manager = BookManager(storage)
+        user_manager = UserManager(storage)
+        check_manager = CheckManager(book_manager, user_manager, storage)
+
+        def iterate():
+            authors, available = {}, 0
+            for book in book_manager.books:
+                authors[book.author.lower()] = authors.get(book.author.lower(), 0) + 1
+                available += book.available
+            loans = {user.user_id: len(user.borrowed_books) for user in user_manager.users if user.borrowed_books}
+            return available, sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:10], loans
+
+        stats = collect_stats(book_manager, user_manager, check_manager)
+        available, top_authors, loans = iterate()
+        assert stats.available == available and stats.borrowers == len(loans)
+        assert [(author.lower(), count) for author, count in stats.top_authors] == top_authors
+        print(f"{'method':<20}{'ms per dashboard':>18}")
+        for name, collect in (("iterate", iterate),
+                              ("counters", lambda: collect_stats(book_manager, user_manager, check_manager))):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                collect()
+            print(f"{name:<20}{(time.perf_counter() - start) / args.repeat * 1000:>18.3f}")
+
+
+def bench_search(args):
+    """
+    Compares a kiosk workload, i.e. repeated searches from a small set of popular
+    queries mixed with checkouts and checkins, with and without the search cache.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, 0)
+        rng = random.Random(0)
+        queries = [("Title 1", None), ("Title 12", None), (None, "Author 42"), ("Title 7", "Author 7"),
+                   ("itle 99", None), (None, "Author 1")][:args.queries]
+        print(f"{'cache':<10}{'searches/s':>12}{'hit rate':>10}")
+        for cache_size in (0, 256):
+            storage = BufferedStorage(Storage(os.path.join(directory, "books.json"), os.path.join(directory, "users.json"),
+                                              os.path.join(directory, "checkouts.json"), journaled=True), max_delay=None,
+                                      max_batch=None)
+            book_manager = BookManager(storage, cache_size=cache_size)
+            user_manager = UserManager(storage, book_manager, cache_size=cache_size)
+            check_manager = CheckManager(book_manager, user_manager, storage)
+            isbns = [book.isbn for book in rng.sample(list(book_manager.books), 100)]
+            elapsed = 0.0
+            with contextlib.redirect_stdout(io.StringIO()):
+                for operation in range(args.searches):
+                    if operation % args.checkout_every == 0:
+                        isbn = rng.choice(isbns)
+                        checkout = check_manager.get_checkout_by_isbn(isbn)
+                        if checkout:
+                            check_manager.checkin_book(checkout.user_id, isbn)
+                        else:
+                            check_manager.checkout_book(f"u{rng.randrange(args.users)}", isbn)
+                    title, author = rng.choice(queries)
+                    start = time.perf_counter()
+                    book_manager.find_books(title, author)
+                    elapsed += time.perf_counter() - start
+            storage.close()
+            stats = book_manager.search_cache.stats()
+            print(f"{cache_size:<10}{args.searches / elapsed:>12.0f}{stats.hit_rate:>10.1%}")
+
+
+def check_loans(book_manager, user_manager, check_manager):
+    """
+    Checks that the books, users, and checkouts agree, i.e. that no book is lent twice.
+
+    Args:
+    - book_manager (BookManager): The books.
+    - user_manager (UserManager): The users.
+    - check_manager (CheckManager): The checkouts.
+
+    Returns:
+    - list: A description of each inconsistency found.
+    """
+    problems = []
+    lent = {book.isbn for book in book_manager.books if not book.available}
+    if lent != set(check_manager.checkouts):
+        problems.append(f"{len(lent ^ set(check_manager.checkouts))} books disagree with the checkouts")
+    holders = {}
+    for user in user_manager.users:
+        for book in user.borrowed_books:
+            holders.setdefault(book.isbn, []).append(user.user_id)
+    for isbn, user_ids in holders.items():
+        checkout = check_manager.checkouts.get(isbn)
+        if len(user_ids) > 1:
+            problems.append(f"ISBN {isbn} is lent to {len(user_ids)} users")
+        elif checkout is None or checkout.user_id != user_ids[0]:
+            problems.append(f"ISBN {isbn} is borrowed by {user_ids[0]} without a matching checkout")
+    missing = set(check_manager.checkouts) - set(holders)
+    if missing:
+        problems.append(f"{len(missing)} checkouts are missing from the users' borrowed books")
+    return problems
+
+
+def bench_stress(args):
+    """
+    Runs random checkouts and checkins of a small set of books from many threads sharing
+    one set of managers, and checks that no book was lent twice: the successful checkouts
+    minus checkins must equal the checkouts held, and the books, users, checkouts, and the
+    reloaded data files must agree.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, 0)
+        storage = Storage(*(os.path.join(directory, name) for name in ("books.json", "users.json", "checkouts.json")),
+                          journaled=True, fsync="never")
+        book_manager = BookManager(storage)
+        user_manager = UserManager(storage, book_manager)
+        check_manager = CheckManager(book_manager, user_manager, storage)
+        isbns = [book.isbn for book in book_manager.books]
+        user_ids = [user.user_id for user in user_manager.users]
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(args.operations):
+                user_id, isbn = rng.choice(user_ids), rng.choice(isbns)
+                if rng.random() < 0.5:
+                    check_manager.checkout_book(user_id, isbn)
+                else:
+                    checkout = check_manager.get_checkout_by_isbn(isbn)
+                    check_manager.checkin_book(checkout.user_id if checkout else user_id, isbn)
+
+        output = io.StringIO()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        elapsed = time.perf_counter() - start
+
+        log = output.getvalue()
+        loans = log.count("checked out successfully")
+        returns = log.count("checked in successfully")
+        operations = args.threads * args.operations
+        print(f"{operations} operations from {args.threads} threads in {elapsed:.2f} s "
+              f"({operations / elapsed:.0f} operations/s)")
+        print(f"{loans} checkouts and {returns} checkins succeeded; {len(check_manager.checkouts)} books are lent out")
+        problems = check_loans(book_manager, user_manager, check_manager)
+        if loans - returns != len(check_manager.checkouts):
+            problems.append(f"{loans - returns - len(check_manager.checkouts)} more books were lent than are checked out")
+        reloaded = {checkout.isbn: checkout.user_id for checkout in storage.load_checkouts()}
+        if reloaded != {isbn: checkout.user_id for isbn, checkout in check_manager.checkouts.items()}:
+            problems.append("the saved checkouts differ from the managed ones")
+        for problem in problems:
+            print(f"FAILED: {problem}")
+        if problems:
+            sys.exit(1)
+        print("No book was lent twice.")
+
+
+def bench_server(args):
+    """
+    Measures the requests per second of the HTTP server with keep-alive clients sending
+    a mix of book lookups, searches, checkouts, and checkins, with every change written
+    to the journaled data files through the background writer before it is answered.
+
+    Args:
+    - args (argparse.Namespace): The parsed command-line arguments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(directory, args.books, args.users, 0)
+        storage = BufferedStorage(Storage(*(os.path.join(directory, name)
+                                            for name in ("books.json", "users.json", "checkouts.json")),
+                                          journaled=True, line_delimited=True), max_delay=0.005)
+        book_manager = BookManager(storage)
+        user_manager = UserManager(storage, book_manager)
+        check_manager = CheckManager(book_manager, user_manager, storage)
+        isbns = [book.isbn for book in book_manager.books]
+        user_ids = [user.user_id for user in user_manager.users]
+        server = LibraryServer(book_manager, user_manager, check_manager, storage, port=0, workers=args.workers)
+        results = []
+
+        def client(seed):
+            rng = random.Random(seed)
+            statuses = {}
+            connection = http.client.HTTPConnection(server.host, server.port)
+            for _ in range(args.requests):
+                isbn = rng.choice(isbns)
+                roll = rng.random()
+                if roll < 0.6:
+                    connection.request("GET", f"/books/{isbn}")
+                elif roll < 0.8:
+                    connection.request("GET", f"/books?title={isbn[-3:]}&limit=10")
+                else:
+                    path = "/checkouts" if roll < 0.9 else "/checkins"
+                    body = json.dumps({"user_id": rng.choice(user_ids), "isbn": isbn})
+                    connection.request("POST", path, body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            connection.close()
+            results.append(statuses)
+
+        clients = [threading.Thread(target=client, args=(seed,)) for seed in range(args.clients)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            thread = threading.Thread(target=server.run)
+            thread.start()
+            server.started.wait()
+            start = time.perf_counter()
+            for client_thread in clients:
+                client_thread.start()
+            for client_thread in clients:
+                client_thread.join()
+            elapsed = time.perf_counter() - start
+            server.shutdown()
+            thread.join()
+        storage.close()
+
+        statuses = {}
+        for client_statuses in results:
+            for status, count in client_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        requests = args.clients * args.requests
+        print(f"{requests} requests from {args.clients} keep-alive clients in {elapsed:.2f} s "
+              f"({requests / elapsed:.0f} requests/s)")
+        print("Responses: " + ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items())))
+
+
+def parse_args(argv=None):
+    """
+    Parse the command-line arguments.
+
+    Args:
+    - argv (list): The arguments to parse (default is sys.argv[1:]).
+
+    Returns:
+    - argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for the library management system.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    identity = commands.add_parser("identity", help="compare startup memory with and without identity-mapped loading")
+    identity.add_argument("--books", type=int, default=100000)
+    identity.add_argument("--users", type=int, default=20000)
+    identity.add_argument("--loans", type=int, default=3, help="books checked out per user")
+    identity.set_defaults(func=bench_identity)
+
+    load = commands.add_parser("load", help="compare loading JSON array and line-delimited data files")
+    load.add_argument("--books", type=int, default=200000)
+    load.set_defaults(func=bench_load)
+
+    memory = commands.add_parser("memory", help="compare the memory used by dataclass, slotted, and columnar books")
+    memory.add_argument("--books", type=int, default=500000)
+    memory.set_defaults(func=bench_memory)
+
+    snapshot = commands.add_parser("snapshot", help="compare saving and loading JSON and binary snapshot data files")
+    snapshot.add_argument("--books", type=int, default=200000)
+    snapshot.add_argument("--users", type=int, default=50000)
+    snapshot.add_argument("--loans", type=int, default=2, help="books checked out per user")
+    snapshot.set_defaults(func=bench_snapshot)
+
+    mapped = commands.add_parser("mapped", help="compare a loaded BookManager with a memory-mapped catalog")
+    mapped.add_argument("--books", type=int, default=200000)
+    mapped.set_defaults(func=bench_mapped)
+
+    sharded = commands.add_parser("sharded", help="compare single-book saves with and without sharding")
+    sharded.add_argument("--books", type=int, default=200000)
+    sharded.add_argument("--updates", type=int, default=200)
+    sharded.add_argument("--shards", type=int, nargs="+", default=[64, 256])
+    sharded.set_defaults(func=bench_sharded)
+
+    writer = commands.add_parser("writer", help="compare synchronous saves with a background writer")
+    writer.add_argument("--books", type=int, default=20000)
+    writer.add_argument("--updates", type=int, default=200)
+    writer.add_argument("--max-delay", type=float, default=0.05)
+    writer.set_defaults(func=bench_writer)
+
+    pages = commands.add_parser("pages", help="compare paging books from a sorted index with sorting them per page")
+    pages.add_argument("--books", type=int, default=200000)
+    pages.add_argument("--page-size", type=int, default=20)
+    pages.add_argument("--repeat", type=int, default=20)
+    pages.set_defaults(func=bench_pages)
+
+    query = commands.add_parser("query", help="compare planned queries with filtering and sorting every book")
+    query.add_argument("--books", type=int, default=200000)
+    query.add_argument("--users", type=int, default=2000)
+    query.add_argument("--loans", type=int, default=5, help="books checked out by each user")
+    query.add_argument("--repeat", type=int, default=10)
+    query.set_defaults(func=bench_query)
+
+    stats = commands.add_parser("stats", help="compare maintained counters with counting by iteration")
+    stats.add_argument("--books", type=int, default=200000)
+    stats.add_argument("--users", type=int, default=2000)
+    stats.add_argument("--loans", type=int, default=5, help="books checked out by each user")
+    stats.add_argument("--repeat", type=int, default=10)
+    stats.set_defaults(func=bench_stats)
+
+    search = commands.add_parser("search", help="compare repeated searches with and without the search cache")
+    search.add_argument("--books", type=int, default=100000)
+    search.add_argument("--users", type=int, default=100)
+    search.add_argument("--searches", type=int, default=2000)
+    search.add_argument("--queries", type=int, default=6, help="the number of distinct popular queries (at most 6)")
+    search.add_argument("--checkout-every", type=int, default=10, help="searches between checkouts or checkins")
+    search.set_defaults(func=bench_search)
+
+    stress = commands.add_parser("stress", help="check that concurrent checkouts never lend a book twice")
+    stress.add_argument("--books", type=int, default=50, help="few books, so the threads contend for them")
+    stress.add_argument("--users", type=int, default=20)
+    stress.add_argument("--threads", type=int, default=8)
+    stress.add_argument("--operations", type=int, default=2000, help="checkouts and checkins per thread")
+    stress.set_defaults(func=bench_stress)
+
+    server = commands.add_parser("server", help="measure the requests per second of the HTTP server")
+    server.add_argument("--books", type=int, default=10000)
+    server.add_argument("--users", type=int, default=1000)
+    server.add_argument("--clients", type=int, default=16)
+    server.add_argument("--requests", type=int, default=500, help="requests per client")
+    server.add_argument("--workers", type=int, default=8)
+    server.set_defaults(func=bench_server)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)
@@ -1,5 +1,18 @@
 
+import heapq
+import threading
+from contextlib import contextmanager
+from operator import attrgetter
+from types import MappingProxyType
+from cache import ResultCache
+from catalog import ColumnarCatalog
+from completion import PrefixIndex
+from locks import StripedLock
+from mapped_catalog import MappedCatalog
 from models import Book
+from ordering import SortedIndex, paginate
+from search import FuzzyIndex, TextIndex
+from writer import PendingSaves
 class ValidationError(Exception):
     """
     Exception raised for validation errors.
@@ -17,17 +30,289 @@ class BookManager:
 
     Attributes:
     - storage (Storage): An instance of the Storage class for data storage.
-    - books (List[Book]): A list of books managed by the BookManager.
+    - columnar (bool): Whether the books are kept in a ColumnarCatalog instead of a list of Book objects.
+    - books (List[Book]): A list of books managed by the BookManager, or a ColumnarCatalog of them.
+    - _books_by_isbn (Dict[str, Book]): An index of the managed books keyed by ISBN.
+    - _text_index (TextIndex): An inverted index of the titles and authors.
+    - _fuzzy_index (FuzzyIndex): A typo-tolerant index of the titles and authors.
+    - _completions (Dict[str, PrefixIndex]): Prefix-completion indexes of the titles, authors, and ISBNs.
+    - _orderings (Dict[str, SortedIndex]): The ISBNs sorted by title, by author, and by ISBN, for listing.
+    - _author_counts (Dict[str, int]): The number of books by each author, keyed by the lowercase author.
+    - _version (int): The storage version of the managed books, or None if the storage does not track versions.
+    - search_cache (ResultCache): The results of recent searches, dropped when the books they may contain change.
+    - locks (StripedLock): The per-ISBN locks, held while a book is checked for and changed.
+    - _lock (RLock): The lock of the managed collections and indexes.
+    - _unsaved (PendingSaves): The availability changes not saved yet, and the save lock.
+
+    A lazily created BookManager loads the books on the first access to any of these collections.
+    A columnar BookManager hands out BookView objects, which behave like Book objects.
+    Changes refresh the books from the storage first, so with a shared storage the
+    manager picks up the changes saved by other processes before making its own.
+
+    A BookManager may be used by several threads. Changes to a book hold its ISBN lock,
+    which CheckManager also holds while lending the book out, and every change to the
+    collections and indexes holds the manager lock. Availability changes are saved after
+    the manager lock is released, so lending books out does not hold up other threads
+    while the disk is written; the changes that add or remove books hold the save lock
+    before the manager lock, so the books are not added or removed while being saved.
     """
-    def __init__(self , storage):
+
+    COMPLETION_FIELDS = ("title", "author", "isbn")
+    SORT_KEYS = ("title", "author", "isbn", "availability")
+    CURSOR_TYPES = {"title": (str, str), "author": (str, str, str), "isbn": (str,), "availability": (bool, str, str)}
+    LAZY_ATTRIBUTES = ("books", "_books_by_isbn", "_text_index", "_fuzzy_index", "_completions", "_orderings",
+                       "_author_counts")
+
+    def __init__(self , storage, lazy=False, columnar=False, cache_size=256):
         """
         Initializes a BookManager object.
 
         Args:
         - storage (Storage): An instance of the Storage class for data storage.
+        - lazy (bool): Whether to defer loading the books until they are first used (default is False).
+        - columnar (bool): Whether to keep the books in a compact ColumnarCatalog (default is False).
+        - cache_size (int): The number of search results cached; 0 disables the cache (default is 256).
         """
         self.storage  = storage
-        self.books = self.storage.load_books()
+        self.columnar = columnar
+        self.search_cache = ResultCache(cache_size)
+        self.locks = StripedLock()
+        self._lock = threading.RLock()
+        self._unsaved = PendingSaves(attrgetter("isbn"))
+        if not lazy:
+            self.load_books()
+
+    def __getattr__(self, name):
+        """
+        Loads the books when a collection of a lazily created BookManager is first accessed.
+        """
+        if name in BookManager.LAZY_ATTRIBUTES and name not in self.__dict__:
+            with self.storage.transaction(), self._lock:
+                if name not in self.__dict__:
+                    self.load_books()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the manager lock, loading the books first if they are not loaded yet, so
+        the storage is never waited for while the lock is held.
+        """
+        if "books" not in self.__dict__:
+            self.__getattr__("books")
+        with self._lock:
+            yield
+
+    def load_books(self):
+        """
+        Loads books from storage and rebuilds the indexes. The new collections are built
+        first and then replace the old ones, so threads reading without the manager lock
+        never see them half loaded.
+        """
+        with self.storage.transaction(), self._lock:
+            self._version = self.storage.version("books")
+            books = self.storage.load_books()
+            if self.columnar:
+                books = ColumnarCatalog(books)
+                books_by_isbn = books.by_isbn
+            else:
+                books_by_isbn = {}
+            text_index = TextIndex(("title", "author"))
+            fuzzy_index = FuzzyIndex(("title", "author"))
+            author_counts = {}
+            for book in books:
+                books_by_isbn[book.isbn] = book
+                values = self._text_values(book)
+                text_index.add(book.isbn, values)
+                fuzzy_index.add(book.isbn, values)
+                author = book.author.lower()
+                author_counts[author] = author_counts.get(author, 0) + 1
+            completions = {field: PrefixIndex() for field in self.COMPLETION_FIELDS}
+            for field, index in completions.items():
+                index.add_many(getattr(book, field) for book in books)
+            orderings = self._create_orderings(books_by_isbn)
+            self._text_index, self._fuzzy_index, self._completions = text_index, fuzzy_index, completions
+            self._orderings, self._author_counts = orderings, author_counts
+            self._books_by_isbn = books_by_isbn
+            self.books = books
+            self.search_cache.clear()
+
+    def refresh(self):
+        """
+        Applies the changes other processes saved to the books since they were loaded or
+        last refreshed. Only the changed books are reloaded when the storage can list them;
+        managed books are updated in place, so users and checkouts keep referring to them.
+
+        Returns:
+        - bool: Whether the books had changed.
+        """
+        if "books" not in self.__dict__:
+            return False
+        with self.storage.transaction(), self._lock:
+            version = self.storage.version("books")
+            if version == self._version:
+                return False
+            changes = self.storage.changes_since("books", self._version)
+            if changes is None:
+                books = self.storage.load_books()
+                isbns = {book.isbn for book in books}
+                changes = version, books, [isbn for isbn in self._books_by_isbn if isbn not in isbns]
+            self._version, upserts, deletes = changes
+            for isbn in deletes:
+                book = self._books_by_isbn.get(isbn)
+                if book is not None:
+                    self._unindex_book(book)
+                    self.books.remove(book)
+            for new_book in upserts:
+                book = self._books_by_isbn.get(new_book.isbn)
+                if book is None:
+                    book = self._store_book(new_book)
+                    self._index_book(book)
+                elif (book.title, book.author) != (new_book.title, new_book.author):
+                    self._unindex_book(book)
+                    book.title, book.author = new_book.title, new_book.author
+                    self._index_book(book)
+                book.available = new_book.available
+            return True
+
+    def _save_books(self, upserts=None, deletes=None):
+        """
+        Saves the changed books and records the storage version of the save. Must be
+        called with the save lock held, as the storage may read the whole collection.
+
+        Args:
+        - upserts (list): The books added or changed (default is None).
+        - deletes (list): The ISBNs of the books deleted (default is None).
+        """
+        self.storage.save_books(self.books, upserts=upserts, deletes=deletes)
+        self._version = self.storage.version("books")
+
+    def _index_book(self, book, bulk=False):
+        """
+        Adds a book to the indexes.
+
+        Args:
+        - book (Book): The book to index.
+        - bulk (bool): Whether the book is part of a bulk load, which fills the completion
+          and sorted indexes and clears the search cache separately (default is False).
+        """
+        self._books_by_isbn[book.isbn] = book
+        values = self._text_values(book)
+        self._text_index.add(book.isbn, values)
+        self._fuzzy_index.add(book.isbn, values)
+        author = book.author.lower()
+        self._author_counts[author] = self._author_counts.get(author, 0) + 1
+        if not bulk:
+            for field, index in self._completions.items():
+                index.add(getattr(book, field))
+            for ordering in self._orderings.values():
+                ordering.add(book.isbn)
+            self._invalidate_searches(book)
+
+    def _unindex_book(self, book):
+        """
+        Removes a book from the indexes. Must be called before the book's indexed fields change.
+
+        Args:
+        - book (Book): The book to remove.
+        """
+        for ordering in self._orderings.values():
+            ordering.remove(book.isbn)
+        del self._books_by_isbn[book.isbn]
+        values = self._text_values(book)
+        self._text_index.remove(book.isbn, values)
+        self._fuzzy_index.remove(book.isbn, values)
+        for field, index in self._completions.items():
+            index.remove(getattr(book, field))
+        author = book.author.lower()
+        count = self._author_counts.pop(author) - 1
+        if count:
+            self._author_counts[author] = count
+        self._invalidate_searches(book)
+
+    def _invalidate_searches(self, book):
+        """
+        Drops the cached searches whose results may include a book, as it is or as it was
+        before a change. Must be called after the book is added to or removed from the indexes.
+
+        Fuzzy searches rank every book, so any change drops them all.
+
+        Args:
+        - book (Book): The book added, removed, or about to change.
+        """
+        title, author, isbn = book.title.lower(), book.author.lower(), book.isbn
+        self.search_cache.invalidate(lambda key: key[0] == "fuzzy" or self._search_matches(key, title, author, isbn))
+
+    @staticmethod
+    def _search_matches(key, title, author, isbn):
+        """
+        Returns whether a book matches a cached search.
+
+        Args:
+        - key (tuple): The key of the search, as built by find_books.
+        - title (str): The lowercase title of the book.
+        - author (str): The lowercase author of the book.
+        - isbn (str): The ISBN of the book.
+
+        Returns:
+        - bool: Whether the book matches all the criteria of the search.
+        """
+        _, title_text, author_text, isbn_text = key
+        return ((not isbn_text or isbn_text == isbn) and (not title_text or title_text in title)
+                and (not author_text or author_text in author))
+
+    def _store_book(self, book):
+        """
+        Adds a new book to the managed books.
+
+        Args:
+        - book (Book): The book to add.
+
+        Returns:
+        - Book: The managed book, which is the book itself or its view in a ColumnarCatalog.
+        """
+        if self.columnar:
+            return self.books.append(book)
+        self.books.append(book)
+        return book
+
+    @staticmethod
+    def _create_orderings(books_by_isbn):
+        """
+        Creates the sorted indexes of the books.
+
+        Args:
+        - books_by_isbn (Dict[str, Book]): The ISBN index the sort keys are read from.
+
+        Returns:
+        - Dict[str, SortedIndex]: The ISBNs sorted by title, by author, and by ISBN.
+        """
+        def by_title(isbn):
+            return books_by_isbn[isbn].title.lower(), isbn
+
+        def by_author(isbn):
+            book = books_by_isbn[isbn]
+            return book.author.lower(), book.title.lower(), isbn
+
+        def by_isbn(isbn):
+            return isbn,
+
+        return {name: SortedIndex(sort_key, books_by_isbn)
+                for name, sort_key in (("title", by_title), ("author", by_author), ("isbn", by_isbn))}
+
+    @staticmethod
+    def _text_values(book):
+        """
+        Returns the text fields of a book indexed by the text index.
+
+        Args:
+        - book (Book): The book.
+
+        Returns:
+        - dict: The title and author of the book.
+        """
+        return {"title": book.title, "author": book.author}
 
     def add_book(self, title, author, isbn):
         """
@@ -41,49 +326,334 @@ class BookManager:
         Raises:
         - ValidationError: If title, author, or ISBN is empty or if a book with the same ISBN already exists.
         """
-        if not title.strip() or not author.strip() or not isbn.strip():
-            raise ValidationError("Title, author, and ISBN are required.")
-        
-        if any(book.isbn == isbn.strip() for book in self.books):
-            raise ValidationError("A book with the same ISBN already exists.")
-        
-        
-        book = Book(title, author, isbn)
-        self.books.append(book)
-        self.storage.save_books(self.books)
-        print(f"Book '{title}' added successfully.")
+        with self.storage.transaction(), self._unsaved.lock, self._locked():
+            self.refresh()
+            if not title.strip() or not author.strip() or not isbn.strip():
+                raise ValidationError("Title, author, and ISBN are required.")
 
-    def list_books(self):
+            if isbn.strip() in self._books_by_isbn:
+                raise ValidationError("A book with the same ISBN already exists.")
+
+
+            book = self._store_book(Book(title, author, isbn))
+            self._index_book(book)
+            self._save_books(upserts=[book])
+            print(f"Book '{title}' added successfully.")
+
+    def add_books(self, records):
+        """
+        Adds many books in one pass and saves them once.
+
+        Each record is validated like in add_book; invalid records and records whose ISBN
+        is already in the library (or earlier in the same input) are rejected.
+
+        Args:
+        - records (iterable): Dictionaries with "title", "author", and "isbn" keys.
+
+        Returns:
+        - tuple: The added books, and (row number, reason) pairs of the rejected records.
+        """
+        with self.storage.transaction(), self._unsaved.lock, self._locked():
+            self.refresh()
+            added, rejected = [], []
+            for row, record in enumerate(records, start=1):
+                if not isinstance(record, dict):
+                    rejected.append((row, "Malformed record."))
+                    continue
+                title, author, isbn = (str(record.get(key) or "").strip() for key in ("title", "author", "isbn"))
+                if not title or not author or not isbn:
+                    rejected.append((row, "Title, author, and ISBN are required."))
+                    continue
+                if isbn in self._books_by_isbn:
+                    rejected.append((row, "A book with the same ISBN already exists."))
+                    continue
+                book = self._store_book(Book(title, author, isbn))
+                self._index_book(book, bulk=True)
+                added.append(book)
+
+            if added:
+                for field, completions in self._completions.items():
+                    completions.add_many(getattr(book, field) for book in added)
+                for ordering in self._orderings.values():
+                    ordering.add_many(book.isbn for book in added)
+                self.search_cache.clear()
+                self._save_books(upserts=added)
+            return added, rejected
+
+    def page_books(self, sort="title", cursor=None, limit=20):
+        """
+        Returns one page of the books, in the order of a sort key, from the sorted indexes.
+
+        Args:
+        - sort (str): "title", "author" (then title), "isbn", or "availability" (available
+          books first, each group by title) (default is "title").
+        - cursor (tuple): The cursor returned with the previous page, or None for the first page.
+        - limit (int): The maximum number of books on the page (default is 20).
+
+        Returns:
+        - tuple: The books of the page, and the cursor of the next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the sort key is unknown or the limit is not positive.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'. Use {', '.join(self.SORT_KEYS)}.")
+        with self._locked():
+            if sort == "availability":
+                return paginate(self._by_availability(cursor), limit)
+            books_by_isbn = self._books_by_isbn
+            return paginate(((key, books_by_isbn[isbn]) for key, isbn in self._orderings[sort].items(cursor)), limit)
+
+    def _by_availability(self, cursor):
+        """
+        Yields the books with their sort keys, available books first and each group by
+        title, starting after a cursor. Availability changes with every loan, so it is not
+        indexed; each group is read from the title index instead.
+
+        Args:
+        - cursor (tuple): The sort key to start after, or None to start at the first book.
+
+        Yields:
+        - tuple: The sort key and the book.
+        """
+        checked_out, after = (cursor[0], cursor[1:]) if cursor else (False, None)
+        for group in (False, True):
+            if group < checked_out:
+                continue
+            for key, isbn in self._orderings["title"].items(after if group == checked_out else None):
+                book = self._books_by_isbn[isbn]
+                if book.available != group:
+                    yield (group, *key), book
+
+    def iter_books(self, sort="title", page_size=256):
+        """
+        Iterates over all the books in the order of a sort key, taking them a page at a
+        time, so the manager lock is only held while a page is taken. Books added, removed,
+        or moved in the order during the iteration may or may not be seen at their new place.
+
+        Args:
+        - sort (str): The sort key, as for page_books (default is "title").
+        - page_size (int): The number of books taken at a time (default is 256).
+
+        Yields:
+        - Book: Each book.
+        """
+        cursor = None
+        while True:
+            books, cursor = self.page_books(sort, cursor, page_size)
+            yield from books
+            if cursor is None:
+                return
+
+    def list_books(self, sort="title"):
         """
         Lists all the books in the library.
+
+        Args:
+        - sort (str): The sort key, as for page_books (default is "title").
         """
         print("List of books:")
-        if not self.books:
+        found = False
+        for book in self.iter_books(sort):
+            print(book)
+            found = True
+        if not found:
             print("No books found.")
-        else:
-            for book in self.books:
-                print(book)
 
-    def search_books(self, title=None, author=None, isbn=None):
+    def find_books(self, title=None, author=None, isbn=None):
         """
-        Searches for books in the library based on title, author, or ISBN.
+        Finds the books matching all of the given criteria. Title and author match
+        case-insensitive substrings and ISBN matches exactly. Repeated searches are
+        answered from the search cache.
 
         Args:
         - title (str): The title to search for.
         - author (str): The author to search for.
         - isbn (str): The ISBN to search for.
+
+        Returns:
+        - List[Book]: The matching books, ordered by title and ISBN.
+        """
+        key = ("find", title.lower() if title else None, author.lower() if author else None, isbn or None)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        with self._locked():
+            generation = self.search_cache.generation
+            if isbn:
+                book = self._books_by_isbn.get(isbn)
+                candidates = [book] if book else []
+            elif title or author:
+                keys = None
+                for field, text in (("title", title), ("author", author)):
+                    if text:
+                        field_keys = self._text_index.candidates(field, text)
+                        keys = field_keys if keys is None else keys & field_keys
+                candidates = [self._books_by_isbn[key] for key in keys]
+            else:
+                candidates = list(self.books)
+
+        matching_books = [book for book in candidates
+                          if (not title or title.lower() in book.title.lower())
+                          and (not author or author.lower() in book.author.lower())]
+        matching_books.sort(key=lambda book: (book.title.lower(), book.isbn))
+        self.search_cache.put(key, tuple(matching_books), generation)
+        return matching_books
+
+    def fuzzy_find_books(self, text, fields=("title", "author"), limit=10):
         """
-        matching_books = [book for book in self.books
-                        if (not title or title.lower() in book.title.lower())
-                        or (not author or author.lower() in book.author.lower())
-                        or (not isbn or isbn == book.isbn)]
+        Finds the books whose title or author best match a text, tolerating typos.
+
+        Args:
+        - text (str): The text to search for.
+        - fields (tuple): The fields to search (default is title and author).
+        - limit (int): The maximum number of results (default is 10).
+
+        Returns:
+        - List[Book]: The best matching books, closest first.
+        """
+        key = ("fuzzy", text.lower(), tuple(fields), limit)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        with self._locked():
+            books = [self._books_by_isbn[isbn] for isbn, _ in self._fuzzy_index.search(text, fields, limit)]
+            self.search_cache.put(key, tuple(books), self.search_cache.generation)
+            return books
+
+    def search_books(self, title=None, author=None, isbn=None, fuzzy=False):
+        """
+        Searches for books in the library based on title, author, and ISBN, and prints the matches.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+        - fuzzy (bool): Whether to print the closest title or author matches when nothing matches exactly (default is False).
+        """
+        matching_books = self.find_books(title, author, isbn)
         if not matching_books:
             print("No books found.")
+            closest_books = []
+            if fuzzy and not isbn and (title or author):
+                fields = tuple(field for field, text in (("title", title), ("author", author)) if text)
+                closest_books = self.fuzzy_find_books(" ".join(filter(None, (title, author))), fields)
+            if closest_books:
+                print("Closest matches:")
+                for book in closest_books:
+                    print(book)
         else:
             print("Matching books:")
             for book in matching_books:
                 print(book)
 
+    def complete(self, field, prefix, limit=10):
+        """
+        Completes a prefix of a title, author, or ISBN.
+
+        Args:
+        - field (str): One of "title", "author", or "isbn".
+        - prefix (str): The prefix typed so far.
+        - limit (int): The maximum number of completions (default is 10).
+
+        Returns:
+        - List[str]: The matching values in alphabetical order.
+        """
+        with self._locked():
+            return self._completions[field].complete(prefix, limit)
+
+    def count_books(self, author=None):
+        """
+        Counts the books, or the books by an author, from the maintained counts.
+
+        Args:
+        - author (str): The author, matched ignoring case, or None to count all books (default is None).
+
+        Returns:
+        - int: The number of books.
+        """
+        if author is None:
+            return len(self._books_by_isbn)
+        return self._author_counts.get(author.lower(), 0)
+
+    def count_authors(self):
+        """
+        Counts the distinct authors, ignoring case.
+
+        Returns:
+        - int: The number of authors.
+        """
+        return len(self._author_counts)
+
+    def top_authors(self, limit=10):
+        """
+        Returns the authors with the most books, from the maintained counts.
+
+        Args:
+        - limit (int): The maximum number of authors (default is 10).
+
+        Returns:
+        - list: (author, number of books) pairs, most books first, then by author.
+        """
+        with self._locked():
+            top = heapq.nsmallest(limit, self._author_counts.items(), key=lambda item: (-item[1], item[0]))
+            return [(self._author_name(author), count) for author, count in top]
+
+    def _author_name(self, author):
+        """
+        Returns an author as written in the first of their books in author order.
+
+        Args:
+        - author (str): The lowercase author.
+
+        Returns:
+        - str: The author as written in a book.
+        """
+        for _, isbn in self._orderings["author"].range((author,), (author + "\0",)):
+            return self._books_by_isbn[isbn].author
+        return author
+
+    def set_availability(self, book, available):
+        """
+        Marks a book as available or checked out and saves the change, holding its ISBN lock.
+
+        Args:
+        - book (Book): The managed book.
+        - available (bool): Whether the book is available.
+        """
+        with self.storage.transaction(), self.locks.locked(book.isbn):
+            with self._locked():
+                self.refresh()
+                self._set_availability(book, available)
+            self._save_unsaved()
+
+    def _set_availability(self, book, available):
+        """
+        Marks a book as available or checked out and records the change for _save_unsaved().
+        Must be called with the manager lock held.
+
+        Args:
+        - book (Book): The managed book.
+        - available (bool): Whether the book is available.
+        """
+        book.available = available
+        self._unsaved.add(upserts=[book])
+
+    def _save_unsaved(self):
+        """
+        Saves the availability changes recorded so far. Must be called without the manager lock held.
+        """
+        self._unsaved.save(self._save_books)
+
+    def get_books_by_isbn(self):
+        """
+        Returns a read-only view of the ISBN index, the identity map of the managed books.
+
+        Returns:
+        - Mapping[str, Book]: The managed books keyed by ISBN.
+        """
+        return MappingProxyType(self._books_by_isbn)
+
     def get_book_by_isbn(self, isbn):
         """
         Retrieves a book from the library based on its ISBN.
@@ -94,10 +664,7 @@ class BookManager:
         Returns:
         - Book or None: The book object if found, None otherwise.
         """
-        for book in self.books:
-            if book.isbn == isbn:
-                return book
-        return None
+        return self._books_by_isbn.get(isbn)
 
     def delete_book(self, isbn):
         """
@@ -105,36 +672,167 @@ class BookManager:
 
         Args:
         - isbn (str): The ISBN of the book to delete.
+
+        Returns:
+        - bool: Whether the book was deleted.
         """
-        book = self.get_book_by_isbn(isbn)
-        if not book:
-            print(f"Book with ISBN '{isbn}' not found.")
-            return
+        with self.storage.transaction(), self.locks.locked(isbn), self._unsaved.lock, self._locked():
+            self.refresh()
+            book = self.get_book_by_isbn(isbn)
+            if not book:
+                print(f"Book with ISBN '{isbn}' not found.")
+                return False
 
-        if not book.available:
-            print(f"Book '{book.title}' (ISBN: {isbn}) is currently checked out and cannot be deleted.")
-            return
+            if not book.available:
+                print(f"Book '{book.title}' (ISBN: {isbn}) is currently checked out and cannot be deleted.")
+                return False
 
-        self.books.remove(book)
-        self.storage.save_books(self.books)
-        print(f"Book '{book.title}' (ISBN: {isbn}) deleted successfully.")
+            self.books.remove(book)
+            self._unindex_book(book)
+            self._save_books(deletes=[book.isbn])
+            print(f"Book '{book.title}' (ISBN: {isbn}) deleted successfully.")
+            return True
     
     def update_book(self, old_book, new_book):
         """
         Updates a book in the library.
 
+        The managed book object is updated in place, so users and checkouts holding it
+        keep referring to the same instance.
+
         Args:
         - old_book (Book): The old book object to update.
         - new_book (Book): The new book object with updated information.
 
+        Returns:
+        - bool: Whether the book was updated.
+
         Raises:
-        - ValidationError: If the old book is not found.
+        - ValidationError: If the new ISBN is already used by another book.
         """
-        if old_book in self.books:
-            index = self.books.index(old_book)
-            self.books[index] = new_book
-            self.storage.save_books(self.books)
-            print(f"Book '{old_book.title}' (ISBN: {old_book.isbn}) updated successfully.")
-        else:
+        with self.storage.transaction(), self.locks.locked(old_book.isbn, new_book.isbn), self._unsaved.lock, self._locked():
+            self.refresh()
+            current = self._books_by_isbn.get(old_book.isbn)
+            if current is not None and current == old_book:
+                old_title, old_isbn = current.title, current.isbn
+                if new_book.isbn != old_isbn:
+                    if new_book.isbn in self._books_by_isbn:
+                        raise ValidationError("A book with the same ISBN already exists.")
+                    if not current.available:
+                        print(f"Book '{old_title}' (ISBN: {old_isbn}) is currently checked out and its ISBN cannot be changed.")
+                        return False
+                self._unindex_book(current)
+                current.title = new_book.title
+                current.author = new_book.author
+                current.isbn = new_book.isbn
+                self._index_book(current)
+                deletes = [old_isbn] if current.isbn != old_isbn else []
+                self._save_books(upserts=[current], deletes=deletes)
+                print(f"Book '{old_title}' (ISBN: {old_isbn}) updated successfully.")
+                return True
             print(f"Book with ISBN '{old_book.isbn}' not found.")
-    
\ No newline at end of file
+            return False
+
+
+class MappedBookManager:
+    """
+    A read-only book manager over a memory-mapped catalog, for lookup workers.
+
+    Opening the manager parses nothing, and every worker mapping the same file shares one
+    copy of it in the page cache. ISBN lookups are binary searches over the mapped file;
+    title and author searches scan it. Rebuild the file to publish changes, and open a new
+    manager to see them.
+
+    Attributes:
+    - catalog (MappedCatalog): The mapped catalog.
+    """
+
+    def __init__(self, file_path):
+        """
+        Initializes a MappedBookManager object.
+
+        Args:
+        - file_path (str): A catalog file written by mapped_catalog.write_mapped_catalog.
+
+        Raises:
+        - MappedCatalogError: If the file is not a mapped catalog.
+        """
+        self.catalog = MappedCatalog(file_path)
+
+    def get_book_by_isbn(self, isbn):
+        """
+        Retrieves a book from the catalog based on its ISBN.
+
+        Args:
+        - isbn (str): The ISBN of the book to retrieve.
+
+        Returns:
+        - Book or None: The book object if found, None otherwise.
+        """
+        return self.catalog.get(isbn)
+
+    def get_books_by_isbn(self):
+        """
+        Returns the catalog as a read-only mapping of the books keyed by ISBN.
+
+        Returns:
+        - Mapping[str, Book]: The books keyed by ISBN.
+        """
+        return self.catalog
+
+    def find_books(self, title=None, author=None, isbn=None):
+        """
+        Finds the books matching all of the given criteria, like BookManager.find_books.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+
+        Returns:
+        - List[Book]: The matching books, ordered by title and ISBN.
+        """
+        if isbn:
+            book = self.catalog.get(isbn)
+            candidates = [book] if book else []
+        else:
+            candidates = self.catalog.books()
+        matching_books = [book for book in candidates
+                          if (not title or title.lower() in book.title.lower())
+                          and (not author or author.lower() in book.author.lower())]
+        matching_books.sort(key=lambda book: (book.title.lower(), book.isbn))
+        return matching_books
+
+    def search_books(self, title=None, author=None, isbn=None):
+        """
+        Searches for books in the catalog based on title, author, and ISBN, and prints the matches.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+        """
+        matching_books = self.find_books(title, author, isbn)
+        if not matching_books:
+            print("No books found.")
+        else:
+            print("Matching books:")
+            for book in matching_books:
+                print(book)
+
+    def list_books(self):
+        """
+        Lists all the books in the catalog, in ISBN order.
+        """
+        print("List of books:")
+        if not len(self.catalog):
+            print("No books found.")
+        else:
+            for book in self.catalog.books():
+                print(book)
+
+    def close(self):
+        """
+        Unmaps the catalog.
+        """
+        self.catalog.close()
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class CacheStats:
+    """
+    The hit and miss counts of a ResultCache.
+
+    Attributes:
+    - size (int): The number of cached results.
+    - capacity (int): The maximum number of cached results.
+    - hits (int): The number of lookups answered from the cache.
+    - misses (int): The number of lookups not answered from the cache.
+    - evictions (int): The number of results dropped to make room for newer ones.
+    - invalidations (int): The number of results dropped because the records changed.
+    """
+
+    size: int = 0
+    capacity: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self):
+        """
+        Returns the share of lookups answered from the cache, between 0 and 1.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache:
+    """
+    A bounded cache of query results, keyed by the normalised query, which drops the
+    least recently used result when full.
+
+    When records change, their manager invalidates the results the change may affect,
+    chosen by a predicate over the keys, so results of unrelated queries stay cached.
+    Every invalidation also advances a generation counter: a result computed from the
+    records as they were before the change is refused when it is put, so a search that
+    ran while another thread changed the records cannot cache a stale result.
+
+    A ResultCache may be used by several threads.
+
+    Attributes:
+    - capacity (int): The maximum number of cached results; 0 disables the cache.
+    - generation (int): The number of invalidations so far.
+    """
+
+    def __init__(self, capacity=256):
+        """
+        Initializes an empty ResultCache.
+
+        Args:
+        - capacity (int): The maximum number of cached results; 0 disables the cache (default is 256).
+        """
+        self.capacity = capacity
+        self.generation = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = self._invalidations = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """
+        Returns the cached result of a query, marking it as recently used.
+
+        Args:
+        - key (tuple): The normalised query.
+
+        Returns:
+        - The cached result, or None if the query is not cached.
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+            self._results.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def put(self, key, result, generation):
+        """
+        Caches the result of a query, unless the records changed while it was computed.
+
+        Args:
+        - key (tuple): The normalised query.
+        - result: The result, which must not be None.
+        - generation (int): The generation read before the result was computed.
+        """
+        with self._lock:
+            if generation != self.generation or not self.capacity:
+                return
+            self._results[key] = result
+            self._results.move_to_end(key)
+            if len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, affected):
+        """
+        Drops the results of the queries a change may affect.
+
+        Args:
+        - affected (callable): Returns whether a change may affect the result of a query, given its key.
+        """
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._results if affected(key)]
+            for key in stale:
+                del self._results[key]
+            self._invalidations += len(stale)
+
+    def clear(self):
+        """
+        Drops every cached result, e.g. after the records were reloaded.
+        """
+        with self._lock:
+            self.generation += 1
+            self._invalidations += len(self._results)
+            self._results.clear()
+
+    def stats(self):
+        """
+        Returns the hit and miss counts of the cache.
+
+        Returns:
+        - CacheStats: The counts.
+        """
+        with self._lock:
+            return CacheStats(len(self._results), self.capacity, self._hits, self._misses,
+                              self._evictions, self._invalidations)
@@ -0,0 +1,219 @@
+import sys
+from collections.abc import MutableMapping
+from models import Book
+
+
+class BookView:
+    """
+    A book stored in a ColumnarCatalog, presented with the attributes and methods of a Book.
+
+    A view only holds its catalog and row number, so reading or assigning an attribute
+    reads or writes the catalog's columns, and every view of a row sees the same book.
+    Views of a removed book keep their values until the row is reused.
+    """
+
+    __slots__ = ("_catalog", "_row")
+    __hash__ = None
+
+    def __init__(self, catalog, row):
+        """
+        Initializes a BookView object.
+
+        Args:
+        - catalog (ColumnarCatalog): The catalog holding the book.
+        - row (int): The row of the book in the catalog.
+        """
+        self._catalog = catalog
+        self._row = row
+
+    @property
+    def title(self):
+        return self._catalog.titles[self._row]
+
+    @title.setter
+    def title(self, title):
+        self._catalog.titles[self._row] = title
+
+    @property
+    def author(self):
+        return self._catalog.authors[self._row]
+
+    @author.setter
+    def author(self, author):
+        self._catalog.authors[self._row] = sys.intern(author)
+
+    @property
+    def isbn(self):
+        return self._catalog.isbns[self._row]
+
+    @isbn.setter
+    def isbn(self, isbn):
+        self._catalog.isbns[self._row] = isbn
+
+    @property
+    def available(self):
+        return self._catalog.is_available(self._row)
+
+    @available.setter
+    def available(self, available):
+        self._catalog.set_available(self._row, available)
+
+    to_dict = Book.to_dict
+    check_out = Book.check_out
+    check_in = Book.check_in
+    update = Book.update
+
+    def __eq__(self, other):
+        if isinstance(other, BookView) and other._catalog is self._catalog and other._row == self._row:
+            return True
+        if isinstance(other, (Book, BookView)):
+            return ((self.title, self.author, self.isbn, self.available)
+                    == (other.title, other.author, other.isbn, other.available))
+        return NotImplemented
+
+    def __repr__(self):
+        return (f"Book(title={self.title!r}, author={self.author!r}, isbn={self.isbn!r}, "
+                f"available={self.available!r})")
+
+
+class ColumnarCatalog:
+    """
+    A compact store of books kept as parallel columns instead of one object per book.
+
+    Titles and ISBNs are kept in lists, authors in a list of interned strings so each
+    distinct author is stored once, and availability in a bit array. Books are handed out
+    as BookView objects created on demand. Rows of removed books are reused by later
+    additions. The catalog behaves like the list of books a BookManager keeps: it supports
+    len(), iteration, append(), and remove().
+
+    Attributes:
+    - titles (List[str]): The title of the book in each row.
+    - authors (List[str]): The interned author of the book in each row.
+    - isbns (List[str]): The ISBN of the book in each row.
+    - by_isbn (CatalogIndex): A mapping from ISBN to BookView, kept up to date by the owner of the catalog.
+    """
+
+    def __init__(self, books=()):
+        """
+        Initializes a ColumnarCatalog object.
+
+        Args:
+        - books (iterable): The Book objects to store (default is none).
+        """
+        self.titles = []
+        self.authors = []
+        self.isbns = []
+        self._available = bytearray()
+        self._free_rows = set()
+        self.by_isbn = CatalogIndex(self)
+        for book in books:
+            self.append(book)
+
+    def __len__(self):
+        return len(self.titles) - len(self._free_rows)
+
+    def __iter__(self):
+        for row in range(len(self.titles)):
+            if row not in self._free_rows:
+                yield BookView(self, row)
+
+    def append(self, book):
+        """
+        Stores a book in a free row, or in a new row if there is none.
+
+        Args:
+        - book (Book): The book to store.
+
+        Returns:
+        - BookView: The view of the stored book.
+        """
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self.titles[row] = book.title
+            self.authors[row] = sys.intern(book.author)
+            self.isbns[row] = book.isbn
+        else:
+            row = len(self.titles)
+            self.titles.append(book.title)
+            self.authors.append(sys.intern(book.author))
+            self.isbns.append(book.isbn)
+            if row >> 3 == len(self._available):
+                self._available.append(0)
+        self.set_available(row, book.available)
+        return BookView(self, row)
+
+    def remove(self, book):
+        """
+        Removes a book, freeing its row for reuse.
+
+        Args:
+        - book (BookView): A view of the book to remove.
+
+        Raises:
+        - ValueError: If the book is not stored in this catalog.
+        """
+        if not isinstance(book, BookView) or book._catalog is not self or book._row in self._free_rows:
+            raise ValueError("The book is not in the catalog.")
+        self._free_rows.add(book._row)
+
+    def is_available(self, row):
+        """
+        Returns whether the book in a row is available.
+
+        Args:
+        - row (int): The row of the book.
+
+        Returns:
+        - bool: The availability bit of the row.
+        """
+        return bool(self._available[row >> 3] & (1 << (row & 7)))
+
+    def set_available(self, row, available):
+        """
+        Sets whether the book in a row is available.
+
+        Args:
+        - row (int): The row of the book.
+        - available (bool): Whether the book is available.
+        """
+        if available:
+            self._available[row >> 3] |= 1 << (row & 7)
+        else:
+            self._available[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+
+
+class CatalogIndex(MutableMapping):
+    """
+    A mapping from ISBN to the books of a ColumnarCatalog that stores row numbers and
+    creates the BookView objects on lookup.
+    """
+
+    def __init__(self, catalog):
+        """
+        Initializes an empty CatalogIndex.
+
+        Args:
+        - catalog (ColumnarCatalog): The catalog whose books are indexed.
+        """
+        self._catalog = catalog
+        self._rows = {}
+
+    def __getitem__(self, isbn):
+        return BookView(self._catalog, self._rows[isbn])
+
+    def __setitem__(self, isbn, book):
+        if not isinstance(book, BookView) or book._catalog is not self._catalog:
+            raise ValueError("Only books stored in the catalog can be indexed.")
+        self._rows[isbn] = book._row
+
+    def __delitem__(self, isbn):
+        del self._rows[isbn]
+
+    def __contains__(self, isbn):
+        return isbn in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
@@ -1,3 +1,12 @@
+import heapq
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from models import Checkout
+from operator import attrgetter
+from ordering import SortedIndex, paginate
+from writer import PendingSaves
+
 class CheckManager:
 
     """
@@ -7,11 +16,34 @@ class CheckManager:
     - book_manager (BookManager): An instance of BookManager for managing books.
     - user_manager (UserManager): An instance of UserManager for managing users.
     - storage (Storage): An instance of Storage for loading and saving checkouts data.
-    - checkouts (list): A list to store tuples of checked-out books and users.
+    - checkouts (Dict[str, Checkout]): The current checkouts, keyed by the ISBN of the checked-out book.
+    - _checkouts_by_user (Dict[str, Dict[str, Checkout]]): The checkouts of each user, keyed by user ID and ISBN.
+    - _orderings (Dict[str, SortedIndex]): The ISBNs of the checked-out books sorted by date, by user, and by ISBN.
+    - _version (int): The storage version of the checkouts, or None if the storage does not track versions.
+    - _lock (RLock): The lock of the checkouts and the user index.
+    - _unsaved (PendingSaves): The checkouts added and removed but not saved yet, and the save lock.
+
+    A lazily created CheckManager loads the checkouts on the first access to either collection.
+    Checking books out and in refreshes the books, users, and checkouts from the storage
+    first, so with a shared storage two processes cannot lend out the same book.
+
+    A CheckManager may be used by several threads. Checking a book out or in holds the
+    lock of the user in the UserManager and then the lock of the ISBN in the BookManager,
+    so loans of different books to different users proceed in parallel, while two threads
+    lending the same book, or lending to the same user, take turns. The manager locks are
+    only held to change the checkouts, with the book and user they involve; the changes
+    are saved once they are released, so loans of other books go on while the disk is
+    written, and loans made meanwhile are saved together. Locks are taken in this order:
+    the storage transaction, the user locks, the ISBN locks, the save locks, the
+    CheckManager, UserManager, and BookManager locks, and the storage's own lock, so
+    threads cannot deadlock.
     """
 
+    SORT_KEYS = ("date", "user", "isbn")
+    CURSOR_TYPES = {"date": (str, str), "user": (str, str, str), "isbn": (str,)}
+    LAZY_ATTRIBUTES = ("checkouts", "_checkouts_by_user", "_orderings")
 
-    def __init__(self, book_manager, user_manager, storage):
+    def __init__(self, book_manager, user_manager, storage, lazy=False):
 
         """
         Initializes a CheckManager instance with book_manager, user_manager, and storage.
@@ -20,25 +52,269 @@ class CheckManager:
         - book_manager (BookManager): An instance of BookManager for managing books.
         - user_manager (UserManager): An instance of UserManager for managing users.
         - storage (Storage): An instance of Storage for loading and saving checkouts data.
+        - lazy (bool): Whether to defer loading the checkouts until they are first used (default is False).
         """
 
         self.book_manager = book_manager
         self.user_manager = user_manager
+        self.user_manager.check_manager = self
         self.storage = storage
-        self.checkouts = []
-        self.load_checkouts()
+        self._lock = threading.RLock()
+        self._unsaved = PendingSaves(attrgetter("isbn"))
+        if not lazy:
+            self.load_checkouts()
+
+    def __getattr__(self, name):
+        """
+        Loads the checkouts when a collection of a lazily created CheckManager is first accessed.
+        """
+        if name in CheckManager.LAZY_ATTRIBUTES and name not in self.__dict__:
+            with self.storage.transaction(), self._lock:
+                if name not in self.__dict__:
+                    self.load_checkouts()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the manager lock, loading the checkouts first if they are not loaded yet, so
+        the storage is never waited for while the lock is held.
+        """
+        if "checkouts" not in self.__dict__:
+            self.__getattr__("checkouts")
+        with self._lock:
+            yield
 
     def load_checkouts(self):
         """
-        Loads checkouts data from storage and populates the checkouts list.
+        Loads checkouts data from storage and resolves it against the managed users and books.
+
+        The checkouts are the record of which books are lent out: the availability of the
+        books and the users' borrowed_books lists are rebuilt from them. Checkouts of
+        unknown users or books are dropped. The checkouts are replaced once they are all
+        resolved, so threads reading without the manager lock never see them half loaded.
+        """
+        with self.storage.transaction(), self._lock:
+            self.book_manager.refresh()
+            self.user_manager.refresh()
+            self._version = self.storage.version("checkouts")
+            checkouts = self.storage.load_checkouts()
+            checkouts_by_isbn = {}
+            checkouts_by_user = {}
+            for book in self.book_manager.books:
+                book.available = True
+            for user in self.user_manager.users:
+                user.borrowed_books = []
+            for checkout in checkouts:
+                user = self.user_manager.get_user_by_id(checkout.user_id)
+                book = self.book_manager.get_book_by_isbn(checkout.isbn)
+                if not user or not book:
+                    print(f"Warning: Ignoring checkout of ISBN '{checkout.isbn}' by user '{checkout.user_id}'.")
+                    continue
+                book.available = False
+                user.borrowed_books.append(book)
+                checkouts_by_isbn[checkout.isbn] = checkout
+                checkouts_by_user.setdefault(checkout.user_id, {})[checkout.isbn] = checkout
+            self._orderings = self._create_orderings(checkouts_by_isbn)
+            self._checkouts_by_user = checkouts_by_user
+            self.checkouts = checkouts_by_isbn
+
+    def refresh(self):
+        """
+        Applies the changes other processes saved to the books, users, and checkouts since
+        they were loaded or last refreshed. Only the changed checkouts are reloaded when the
+        storage can list them.
+
+        Returns:
+        - bool: Whether anything had changed.
+        """
+        with self.storage.transaction():
+            changed = self.book_manager.refresh()
+            changed = self.user_manager.refresh() or changed
+            if "checkouts" not in self.__dict__:
+                return changed
+            version = self.storage.version("checkouts")
+            if version == self._version:
+                return changed
+            changes = self.storage.changes_since("checkouts", self._version)
+            if changes is None:
+                self.load_checkouts()
+                return True
+            with self._lock:
+                self._version, upserts, deletes = changes
+                for isbn in deletes:
+                    checkout = self.checkouts.get(isbn)
+                    if checkout is not None:
+                        self._release_checkout(checkout)
+                for checkout in upserts:
+                    current = self.checkouts.get(checkout.isbn)
+                    if current is not None:
+                        self._release_checkout(current)
+                    user = self.user_manager.get_user_by_id(checkout.user_id)
+                    book = self.book_manager.get_book_by_isbn(checkout.isbn)
+                    if not user or not book:
+                        print(f"Warning: Ignoring checkout of ISBN '{checkout.isbn}' by user '{checkout.user_id}'.")
+                        continue
+                    book.available = False
+                    if book not in user.borrowed_books:
+                        user.borrowed_books.append(book)
+                    self._index_checkout(checkout)
+            return True
+
+    def _release_checkout(self, checkout):
+        """
+        Removes a checkout ended by another process, making its book available again.
+
+        Args:
+        - checkout (Checkout): The checkout to remove.
+        """
+        self._unindex_checkout(checkout)
+        book = self.book_manager.get_book_by_isbn(checkout.isbn)
+        user = self.user_manager.get_user_by_id(checkout.user_id)
+        if book is not None:
+            book.available = True
+            if user is not None and book in user.borrowed_books:
+                user.borrowed_books.remove(book)
+
+    def _index_checkout(self, checkout):
+        """
+        Adds a checkout to the checkouts and the user index. Must be called with the manager lock held.
+
+        Args:
+        - checkout (Checkout): The checkout to add.
+        """
+        self.checkouts[checkout.isbn] = checkout
+        self._checkouts_by_user.setdefault(checkout.user_id, {})[checkout.isbn] = checkout
+        for ordering in self._orderings.values():
+            ordering.add(checkout.isbn)
+
+    def _unindex_checkout(self, checkout):
+        """
+        Removes a checkout from the checkouts and the user index. Must be called with the manager lock held.
+
+        Args:
+        - checkout (Checkout): The checkout to remove.
+        """
+        for ordering in self._orderings.values():
+            ordering.remove(checkout.isbn)
+        del self.checkouts[checkout.isbn]
+        user_checkouts = self._checkouts_by_user[checkout.user_id]
+        del user_checkouts[checkout.isbn]
+        if not user_checkouts:
+            del self._checkouts_by_user[checkout.user_id]
+
+    @staticmethod
+    def _create_orderings(checkouts):
+        """
+        Creates the sorted indexes of the checkouts.
+
+        Args:
+        - checkouts (Dict[str, Checkout]): The checkouts keyed by ISBN, which the sort keys are read from.
+
+        Returns:
+        - Dict[str, SortedIndex]: The ISBNs sorted by date, by user ID (then date), and by ISBN.
+          Legacy checkouts without a timestamp sort before all dated ones.
+        """
+        def by_date(isbn):
+            return checkouts[isbn].timestamp or "", isbn
+
+        def by_user(isbn):
+            checkout = checkouts[isbn]
+            return checkout.user_id, checkout.timestamp or "", isbn
+
+        def by_isbn(isbn):
+            return isbn,
+
+        return {name: SortedIndex(sort_key, checkouts)
+                for name, sort_key in (("date", by_date), ("user", by_user), ("isbn", by_isbn))}
+
+    def get_checkouts(self, user_id=None):
+        """
+        Retrieves the checkouts of a user, or all checkouts.
+
+        Args:
+        - user_id (str): The ID of the user, or None for all checkouts (default is None).
+
+        Returns:
+        - list: The Checkout objects.
         """
-        self.checkouts = self.storage.load_checkouts()
+        with self._locked():
+            if user_id is None:
+                return list(self.checkouts.values())
+            return list(self._checkouts_by_user.get(user_id, {}).values())
 
-    def save_checkouts(self):
+    def get_checkout_by_isbn(self, isbn):
         """
-        Saves checkouts data to storage.
+        Retrieves the checkout holding a book.
+
+        Args:
+        - isbn (str): The ISBN of the book.
+
+        Returns:
+        - Checkout or None: The checkout if the book is checked out, None otherwise.
         """
-        self.storage.save_checkouts(self.checkouts)
+        return self.checkouts.get(isbn)
+
+    def count_loans(self, user_id=None):
+        """
+        Counts the books lent to a user, or all books lent out, from the checkouts.
+
+        Args:
+        - user_id (str): The ID of the user, or None to count all loans (default is None).
+
+        Returns:
+        - int: The number of books lent out.
+        """
+        if user_id is None:
+            return len(self.checkouts)
+        return len(self._checkouts_by_user.get(user_id, ()))
+
+    def count_borrowers(self):
+        """
+        Counts the users holding at least one book.
+
+        Returns:
+        - int: The number of borrowers.
+        """
+        return len(self._checkouts_by_user)
+
+    def top_borrowers(self, limit=10):
+        """
+        Returns the users holding the most books.
+
+        Args:
+        - limit (int): The maximum number of users (default is 10).
+
+        Returns:
+        - list: (user ID, number of books) pairs, most books first, then by user ID.
+        """
+        with self._locked():
+            return heapq.nsmallest(limit, ((user_id, len(checkouts)) for user_id, checkouts
+                                           in self._checkouts_by_user.items()),
+                                   key=lambda item: (-item[1], item[0]))
+
+    def save_checkouts(self, upserts=None, deletes=None):
+        """
+        Saves checkouts data to storage. Must be called with the save lock held and the
+        manager lock released; the storage is given a copy of the checkouts.
+
+        Args:
+        - upserts (list): The checkouts added since the last save (default is None).
+        - deletes (list): The ISBNs of the books checked in since the last save (default is None).
+        """
+        with self._lock:
+            checkouts = list(self.checkouts.values())
+        self.storage.save_checkouts(checkouts, upserts=upserts, deletes=deletes)
+        self._version = self.storage.version("checkouts")
+
+    def _save_unsaved(self):
+        """
+        Saves the checkouts and book availability changes recorded so far, while the user and
+        ISBN locks are still held. Must be called without the manager locks held.
+        """
+        self._unsaved.save(self.save_checkouts)
+        self.book_manager._save_unsaved()
 
     def checkout_book(self, user_id, isbn):
         """
@@ -47,23 +323,34 @@ class CheckManager:
         Args:
         - user_id (str): The ID of the user checking out the book.
         - isbn (str): The ISBN of the book to be checked out.
+
+        Returns:
+        - bool: Whether the book was checked out.
         """
-        user = self.user_manager.get_user_by_id(user_id)
-        book = self.book_manager.get_book_by_isbn(isbn)
+        with self.storage.transaction():
+            self.refresh()
+            with self.user_manager.locks.locked(user_id), self.book_manager.locks.locked(isbn):
+                user = self.user_manager.get_user_by_id(user_id)
+                book = self.book_manager.get_book_by_isbn(isbn)
 
-        if user and book:
-            if book.available:
-                book.available = False
-                user.borrowed_books.append(book)
-                self.checkouts.append((user, book))
-                self.save_checkouts()
-                print(f"Book '{book.title}' checked out successfully by {user.name}.")
-            else:
-                print(f"Book '{book.title}' is not available for checkout.")
-        elif not user:
-            print(f"User with ID '{user_id}' not found.")
-        elif not book:
-            print(f"Book with ISBN '{isbn}' not found.")
+                if user and book:
+                    if book.available and book.isbn not in self.checkouts:
+                        checkout = Checkout(user.user_id, book.isbn, datetime.now().isoformat(timespec="seconds"))
+                        with self._lock, self.book_manager._lock:
+                            # The checkout is recorded first, so a failure leaves the book and user unchanged.
+                            self._index_checkout(checkout)
+                            self.book_manager._set_availability(book, False)
+                            user.borrowed_books.append(book)
+                            self._unsaved.add(upserts=[checkout])
+                        self._save_unsaved()
+                        print(f"Book '{book.title}' checked out successfully by {user.name}.")
+                        return True
+                    print(f"Book '{book.title}' is not available for checkout.")
+                elif not user:
+                    print(f"User with ID '{user_id}' not found.")
+                elif not book:
+                    print(f"Book with ISBN '{isbn}' not found.")
+                return False
 
     def checkin_book(self, user_id, isbn):
         """
@@ -72,51 +359,121 @@ class CheckManager:
         Args:
         - user_id (str): The ID of the user checking in the book.
         - isbn (str): The ISBN of the book to be checked in.
+
+        Returns:
+        - bool: Whether the book was checked in.
         """
-        user = self.user_manager.get_user_by_id(user_id)
-        book = self.book_manager.get_book_by_isbn(isbn)
+        with self.storage.transaction():
+            self.refresh()
+            with self.user_manager.locks.locked(user_id), self.book_manager.locks.locked(isbn):
+                user = self.user_manager.get_user_by_id(user_id)
+                book = self.book_manager.get_book_by_isbn(isbn)
 
-        if user and book:
-            checkout = (user, book)
-            if checkout in self.checkouts:
-                self.checkouts.remove(checkout)
-                book.available = True
-                user.borrowed_books.remove(book)
-                self.save_checkouts()
-                print(f"Book '{book.title}' checked in successfully by {user.name}.")
-            else:
-                print(f"Book '{book.title}' is not checked out by {user.name}.")
-        elif not user:
-            print(f"User with ID '{user_id}' not found.")
-        elif not book:
-            print(f"Book with ISBN '{isbn}' not found.")
+                if user and book:
+                    checkout = self.checkouts.get(book.isbn)
+                    if checkout is not None and checkout.user_id == user.user_id:
+                        with self._lock, self.book_manager._lock:
+                            self._unindex_checkout(checkout)
+                            self.book_manager._set_availability(book, True)
+                            user.borrowed_books.remove(book)
+                            self._unsaved.add(deletes=[book.isbn])
+                        self._save_unsaved()
+                        print(f"Book '{book.title}' checked in successfully by {user.name}.")
+                        return True
+                    print(f"Book '{book.title}' is not checked out by {user.name}.")
+                elif not user:
+                    print(f"User with ID '{user_id}' not found.")
+                elif not book:
+                    print(f"Book with ISBN '{isbn}' not found.")
+                return False
+
+    def page_checkouts(self, user_id=None, sort="date", cursor=None, limit=20):
+        """
+        Returns one page of the checkouts of a user, or of all checkouts, in the order of a
+        sort key. All checkouts are paged from the sorted indexes; the few checkouts of a
+        user are sorted when the page is taken.
+
+        Args:
+        - user_id (str): The ID of the user, or None for all checkouts (default is None).
+        - sort (str): "date", "user" (then date), or "isbn" (default is "date").
+        - cursor (tuple): The cursor returned with the previous page, or None for the first page.
+        - limit (int): The maximum number of checkouts on the page (default is 20).
+
+        Returns:
+        - tuple: The checkouts of the page, and the cursor of the next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the sort key is unknown or the limit is not positive.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'. Use {', '.join(self.SORT_KEYS)}.")
+        with self._locked():
+            checkouts, ordering = self.checkouts, self._orderings[sort]
+            if user_id is None:
+                return paginate(((key, checkouts[isbn]) for key, isbn in ordering.items(cursor)), limit)
+            keys = sorted((ordering.sort_key(isbn), isbn) for isbn in self._checkouts_by_user.get(user_id, ()))
+            return paginate(((key, checkouts[isbn]) for key, isbn in keys if cursor is None or key > cursor), limit)
+
+    def iter_checkouts(self, user_id=None, sort="date", page_size=256):
+        """
+        Iterates over the checkouts of a user, or over all checkouts, in the order of a sort
+        key, taking them a page at a time, so the manager lock is only held while a page is taken.
+
+        Args:
+        - user_id (str): The ID of the user, or None for all checkouts (default is None).
+        - sort (str): The sort key, as for page_checkouts (default is "date").
+        - page_size (int): The number of checkouts taken at a time (default is 256).
+
+        Yields:
+        - Checkout: Each checkout.
+        """
+        cursor = None
+        while True:
+            checkouts, cursor = self.page_checkouts(user_id, sort, cursor, page_size)
+            yield from checkouts
+            if cursor is None:
+                return
+
+    def format_checkout(self, checkout, with_user=True):
+        """
+        Formats a checkout as a line of a listing.
+
+        Args:
+        - checkout (Checkout): The checkout.
+        - with_user (bool): Whether to name the user holding the book (default is True).
+
+        Returns:
+        - str: The title and author of the book, and the name of the user.
+        """
+        book = self.book_manager.get_book_by_isbn(checkout.isbn)
+        line = f"- {book.title} by {book.author}" if book else f"- ISBN {checkout.isbn}"
+        if with_user:
+            user = self.user_manager.get_user_by_id(checkout.user_id)
+            line += f" (checked out by {user.name if user else checkout.user_id})"
+        return line
 
-    def list_checkouts(self, user_id=None):
+    def list_checkouts(self, user_id=None, sort="date"):
         """
         Lists all checkouts or checkouts for a specific user.
 
         Args:
         - user_id (str): The ID of the user to list checkouts for (default is None).
+        - sort (str): The sort key, as for page_checkouts (default is "date").
         """
         if user_id:
             user = self.user_manager.get_user_by_id(user_id)
-            if user:
-                print(f"Checkouts for {user.name}:")
-                user_checkouts = [checkout for checkout in self.checkouts if checkout[0] == user]
-                if not user_checkouts:
-                    print("No checkouts found.")
-                else:
-                    for checkout in user_checkouts:
-                        print(f"- {checkout[1].title} by {checkout[1].author}")
-            else:
+            if not user:
                 print(f"User with ID '{user_id}' not found.")
+                return
+            print(f"Checkouts for {user.name}:")
         else:
             print("All checkouts:")
-            if not self.checkouts:
-                print("No checkouts found.")
-            else:
-                for checkout in self.checkouts:
-                    print(f"- {checkout[1].title} by {checkout[1].author} (checked out by {checkout[0].name})")
+        found = False
+        for checkout in self.iter_checkouts(user_id or None, sort):
+            print(self.format_checkout(checkout, with_user=not user_id))
+            found = True
+        if not found:
+            print("No checkouts found.")
 
     def get_user_by_id(self, user_id):
         """
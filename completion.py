@@ -0,0 +1,98 @@
+from bisect import bisect_left, insort
+
+
+class PrefixIndex:
+    """
+    A prefix-completion index over a multiset of strings, kept as a sorted array of the
+    distinct lowercase terms. A completion is a binary search for the prefix followed by
+    a walk over the adjacent terms, so it costs O(log n + limit).
+
+    Attributes:
+    - _terms (List[str]): The distinct lowercase terms, sorted.
+    - _counts (Dict[str, int]): The number of indexed strings per term.
+    - _display (Dict[str, str]): The original spelling returned for each term.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty PrefixIndex.
+        """
+        self._terms = []
+        self._counts = {}
+        self._display = {}
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, text):
+        """
+        Adds a string.
+
+        Args:
+        - text (str): The string to add.
+        """
+        term = text.lower()
+        count = self._counts.get(term, 0)
+        self._counts[term] = count + 1
+        if not count:
+            self._display[term] = text
+            insort(self._terms, term)
+
+    def add_many(self, texts):
+        """
+        Adds many strings, sorting the terms once instead of inserting them one by one.
+
+        Args:
+        - texts (iterable): The strings to add.
+        """
+        added = False
+        for text in texts:
+            term = text.lower()
+            count = self._counts.get(term, 0)
+            self._counts[term] = count + 1
+            if not count:
+                self._display[term] = text
+                added = True
+        if added:
+            self._terms = sorted(self._counts)
+
+    def remove(self, text):
+        """
+        Removes one occurrence of a string.
+
+        Args:
+        - text (str): The string to remove.
+        """
+        term = text.lower()
+        count = self._counts.get(term)
+        if count is None:
+            return
+        if count > 1:
+            self._counts[term] = count - 1
+            return
+        del self._counts[term]
+        del self._display[term]
+        index = bisect_left(self._terms, term)
+        del self._terms[index]
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns the indexed strings starting with a prefix, case-insensitively.
+
+        Args:
+        - prefix (str): The prefix to complete.
+        - limit (int): The maximum number of completions (default is 10).
+
+        Returns:
+        - List[str]: Up to limit completions in alphabetical order.
+        """
+        prefix = prefix.lower()
+        completions = []
+        index = bisect_left(self._terms, prefix)
+        while index < len(self._terms) and len(completions) < limit:
+            term = self._terms[index]
+            if not term.startswith(prefix):
+                break
+            completions.append(self._display[term])
+            index += 1
+        return completions
@@ -0,0 +1,55 @@
+import csv
+import json
+import os
+
+
+def read_records(path):
+    """
+    Streams the records of a CSV file (with a header row) or a JSON Lines file, one at a time.
+
+    Args:
+    - path (str): The file to read. Files ending in ".csv" are read as CSV, files ending in
+      ".jsonl" or ".ndjson" as JSON Lines.
+
+    Yields:
+    - dict or None: Each record, or None for a line that is not a JSON object.
+
+    Raises:
+    - ValueError: If the file extension is not supported.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+    elif extension in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unsupported file type '{extension}'. Use .csv, .jsonl, or .ndjson.")
+
+
+def print_import_report(kind, path, added, rejected, limit=20):
+    """
+    Prints the outcome of an import.
+
+    Args:
+    - kind (str): What was imported, e.g. "books".
+    - path (str): The imported file.
+    - added (list): The added objects.
+    - rejected (list): (row number, reason) pairs of the rejected records.
+    - limit (int): The maximum number of rejections to list (default is 20).
+    """
+    print(f"Imported {len(added)} {kind} from '{path}'.")
+    if rejected:
+        print(f"Rejected {len(rejected)} rows:")
+        for row, reason in rejected[:limit]:
+            print(f"- row {row}: {reason}")
+        if len(rejected) > limit:
+            print(f"- ... and {len(rejected) - limit} more")
@@ -0,0 +1,128 @@
+import threading
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    An exclusive lock shared between processes through a lock file.
+
+    The lock is held with flock() on POSIX systems and msvcrt.locking() on Windows, so the
+    operating system releases it if the holding process dies. Within a process the lock is
+    reentrant for the thread holding it, and other threads wait for it like other processes do.
+
+    Attributes:
+    - file_path (str): The lock file, created if needed.
+    """
+
+    def __init__(self, file_path):
+        """
+        Initializes a FileLock object. The lock file is opened when the lock is acquired.
+
+        Args:
+        - file_path (str): The lock file.
+        """
+        self.file_path = file_path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self):
+        """
+        Blocks until the lock is held by the calling thread.
+        """
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                file = open(self.file_path, "a+b")
+                try:
+                    self._lock_file(file)
+                except BaseException:
+                    file.close()
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._file = file
+        self._depth += 1
+
+    def release(self):
+        """
+        Releases one acquisition of the lock, and the lock file with the last one.
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            file, self._file = self._file, None
+            try:
+                self._unlock_file(file)
+            finally:
+                file.close()
+        self._thread_lock.release()
+
+    @staticmethod
+    def _lock_file(file):
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            return
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    @staticmethod
+    def _unlock_file(file):
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            return
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class StripedLock:
+    """
+    A fixed set of reentrant locks that keys are spread over by hash, so operations on
+    different keys usually proceed in parallel while operations on the same key serialise,
+    without keeping a lock per key.
+
+    Attributes:
+    - stripes (int): The number of locks.
+    """
+
+    def __init__(self, stripes=64):
+        """
+        Initializes a StripedLock object.
+
+        Args:
+        - stripes (int): The number of locks (default is 64).
+        """
+        self.stripes = stripes
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    @contextmanager
+    def locked(self, *keys):
+        """
+        Holds the locks of one or more keys. The locks are taken in stripe order, so
+        threads locking several keys cannot deadlock each other.
+
+        Args:
+        - keys (str): The keys to lock.
+        """
+        with ExitStack() as stack:
+            for stripe in sorted({hash(key) % self.stripes for key in keys}):
+                stack.enter_context(self._locks[stripe])
+            yield
@@ -1,18 +1,48 @@
+import argparse
+import shlex
 import sys
-from book import BookManager
+from batch import BatchRunner, print_batch_report
+from book import BookManager, ValidationError
 from user import UserManager
 from check import CheckManager
 from models import Book, User
-from storage import Storage
+from importer import print_import_report, read_records
+from mapped_catalog import write_mapped_catalog
+from query import Query, QueryError, parse_condition
+from server import LibraryServer
+from storage import Storage, StorageError
+from sharded_storage import ShardedStorage
+from sqlite_storage import SQLiteStorage
+from stats import collect_stats, print_stats
+from writer import BufferedStorage
+
+try:
+    import readline
+except ImportError:
+    readline = None
+
+SNAPSHOT_FILES = ("books.snap", "users.snap", "checkouts.snap")
+SHARDED_DIRECTORY = "library_data"
+PAGE_SIZE = 20
 
 class LibraryManagementSystem:
     """A simple library management system."""
-    def __init__(self):
-        """Initialize the library management system."""
-        self.storage = Storage()
-        self.book_manager = BookManager(self.storage)
-        self.user_manager = UserManager(self.storage)
-        self.check_manager = CheckManager(self.book_manager, self.user_manager , self.storage)
+    def __init__(self, storage=None, columnar=False, cache_size=256):
+        """
+        Initialize the library management system.
+
+        Args:
+        - storage (BaseStorage): The storage backend to use (default is journaled, line-delimited JSON files).
+        - columnar (bool): Whether to keep the books in a compact columnar catalog (default is False).
+        - cache_size (int): The number of book and of user search results cached; 0 disables caching (default is 256).
+
+        The managers are created lazily, so the menu is shown at once and each collection is
+        loaded when it is first used.
+        """
+        self.storage = storage or Storage(journaled=True, line_delimited=True)
+        self.book_manager = BookManager(self.storage, lazy=True, columnar=columnar, cache_size=cache_size)
+        self.user_manager = UserManager(self.storage, self.book_manager, lazy=True, cache_size=cache_size)
+        self.check_manager = CheckManager(self.book_manager, self.user_manager , self.storage, lazy=True)
         
 
     def display_menu(self):
@@ -25,9 +55,103 @@ class LibraryManagementSystem:
         print("1. Book Management")
         print("2. User Management")
         print("3. Check out/in Book")
-        print("4. Exit")
+        print("4. Statistics")
+        print("5. Exit")
         print("-"*100)
 
+    def ask(self, prompt, complete=None):
+        """
+        Ask for a value, completing it with the Tab key when readline is available.
+
+        Args:
+        - prompt (str): The prompt.
+        - complete (callable): Returns the completions of the text typed so far, or None
+          for no completion (default is None).
+
+        Returns:
+        - str: The answer.
+        """
+        if readline is None or complete is None:
+            return input(prompt)
+        completions = []
+
+        def completer(text, state):
+            if state == 0:
+                completions[:] = complete(text)
+            return completions[state] if state < len(completions) else None
+
+        previous_completer, previous_delims = readline.get_completer(), readline.get_completer_delims()
+        readline.set_completer(completer)
+        readline.set_completer_delims("")
+        readline.parse_and_bind("bind ^I rl_complete" if "libedit" in (readline.__doc__ or "") else "tab: complete")
+        try:
+            return input(prompt)
+        finally:
+            readline.set_completer(previous_completer)
+            readline.set_completer_delims(previous_delims)
+
+    def complete_book(self, field):
+        """
+        Returns a completion function for a book field.
+
+        Args:
+        - field (str): One of "title", "author", or "isbn".
+
+        Returns:
+        - callable: Returns the completions of a prefix.
+        """
+        return lambda prefix: self.book_manager.complete(field, prefix)
+
+    def complete_user(self, field):
+        """
+        Returns a completion function for a user field.
+
+        Args:
+        - field (str): One of "user_id" or "name".
+
+        Returns:
+        - callable: Returns the completions of a prefix.
+        """
+        return lambda prefix: self.user_manager.complete(field, prefix)
+
+    def ask_sort(self, sort_keys):
+        """
+        Ask for the order of a listing.
+
+        Args:
+        - sort_keys (tuple): The sort keys offered; the first is the default.
+
+        Returns:
+        - str or None: The chosen sort key, or None if the answer is not one of them.
+        """
+        sort = input(f"Sort by ({', '.join(sort_keys)}) [{sort_keys[0]}]: ").strip().lower() or sort_keys[0]
+        if sort not in sort_keys:
+            print("Invalid sort key. Please try again.")
+            return None
+        return sort
+
+    def show_pages(self, page, format_item=str):
+        """
+        Print a listing a page at a time, asking before each further page.
+
+        Args:
+        - page (callable): Takes a cursor and a page size and returns a page and the next cursor.
+        - format_item (callable): Formats an item as a line (default is str).
+
+        Returns:
+        - int: The number of items printed.
+        """
+        cursor, shown = None, 0
+        while True:
+            items, cursor = page(cursor, PAGE_SIZE)
+            for item in items:
+                print(format_item(item))
+            shown += len(items)
+            if cursor is None:
+                return shown
+            if input(f"-- {shown} shown. Press Enter for more, or q to stop: ").strip().lower() == "q":
+                return shown
+
     def book_management(self):
         """
             Manage books in the library.
@@ -42,6 +166,7 @@ class LibraryManagementSystem:
             print("6. Back to Main Menu")
             print("-" * 100)
             choice = input("Enter your choice (1-6): ")
+            self.check_manager.refresh()
 
             if choice == '1':
                 title = input("Enter book title: ")
@@ -51,19 +176,22 @@ class LibraryManagementSystem:
                 self.book_manager.add_book(title, author, isbn)
                 print("-" * 100) 
             elif choice == '2':
-                isbn = input("Enter the ISBN of the book to update: ")
+                isbn = self.ask("Enter the ISBN of the book to update: ", self.complete_book("isbn"))
                 book = self.book_manager.get_book_by_isbn(isbn)
                 if book:
                     new_title = input("Enter new book title (leave blank to keep current): ") or book.title
                     new_author = input("Enter new book author (leave blank to keep current): ") or book.author
                     new_isbn = input("Enter new book ISBN (leave blank to keep current): ") or book.isbn
                     print("-" * 100)
-                    self.book_manager.update_book(book, Book(new_title, new_author, new_isbn))
+                    try:
+                        self.book_manager.update_book(book, Book(new_title, new_author, new_isbn))
+                    except ValidationError as e:
+                        print(f"Error: {e.message}")
                     print("-" * 100)
                 else:
                     print(f"Book with ISBN '{isbn}' not found.")
             elif choice == '3':
-                isbn = input("Enter the ISBN of the book to delete: ")
+                isbn = self.ask("Enter the ISBN of the book to delete: ", self.complete_book("isbn"))
                 book = self.book_manager.get_book_by_isbn(isbn)
                 if book:
                     print("-" * 100)
@@ -72,14 +200,22 @@ class LibraryManagementSystem:
                 else:
                     print(f"Book with ISBN '{isbn}' not found.")
             elif choice == '4':
-                print("-" * 100)
-                self.book_manager.list_books()
-                print("-" * 100)
+                sort = self.ask_sort(BookManager.SORT_KEYS)
+                if sort:
+                    print("-" * 100)
+                    print("List of books:")
+                    if not self.show_pages(lambda cursor, limit: self.book_manager.page_books(sort, cursor, limit)):
+                        print("No books found.")
+                    print("-" * 100)
             elif choice == '5':
                 attribute = input("Enter the attribute to search (title, author, isbn): ")
-                value = input(f"Enter the {attribute} to search: ")
+                complete = self.complete_book(attribute) if attribute in ('title', 'author', 'isbn') else None
+                value = self.ask(f"Enter the {attribute} to search: ", complete)
                 print("-" * 100)
-                self.book_manager.search_books(attribute, value)
+                if attribute in ('title', 'author', 'isbn'):
+                    self.book_manager.search_books(**{attribute: value}, fuzzy=True)
+                else:
+                    print("Invalid attribute. Please try again.")
                 print("-" * 100)
             elif choice == '6':
                 break
@@ -102,6 +238,7 @@ class LibraryManagementSystem:
             print("-" * 100)
 
             choice = input("Enter your choice (1-6): ")
+            self.check_manager.refresh()
             print("-" * 100)
             if choice == '1':
                 name = input("Enter user name: ")
@@ -110,7 +247,7 @@ class LibraryManagementSystem:
                 self.user_manager.add_user(name, user_id)
                 print("-" * 100)
             elif choice == '2':
-                user_id = input("Enter the user ID of the user to update: ")
+                user_id = self.ask("Enter the user ID of the user to update: ", self.complete_user("user_id"))
                 print("-" * 100)
                 user = self.user_manager.get_user_by_id(user_id)
                 print("-" * 100)
@@ -123,7 +260,7 @@ class LibraryManagementSystem:
                     print(f"User with ID '{user_id}' not found.")
                     print("-" * 100)
             elif choice == '3':
-                user_id = input("Enter the user ID of the user to delete: ")
+                user_id = self.ask("Enter the user ID of the user to delete: ", self.complete_user("user_id"))
                 print("-" * 100)
                 user = self.user_manager.get_user_by_id(user_id)
                 print("-" * 100)
@@ -134,16 +271,22 @@ class LibraryManagementSystem:
                     print(f"User with ID '{user_id}' not found.")
                     print("-" * 100)
             elif choice == '4':
-                print("-" * 100)
-                self.user_manager.list_users()
-                print("-" * 100)
+                sort = self.ask_sort(UserManager.SORT_KEYS)
+                if sort:
+                    print("-" * 100)
+                    print("List of users:")
+                    if not self.show_pages(lambda cursor, limit: self.user_manager.page_users(sort, cursor, limit),
+                                           lambda user: f"- {user.name} (ID: {user.user_id})"):
+                        print("No users found.")
+                    print("-" * 100)
             elif choice == '5':
                 print("-" * 100)
                 attribute = input("Enter the attribute to search (name, user_id): ")
-                value = input(f"Enter the {attribute} to search: ")
+                complete = self.complete_user(attribute) if attribute in ('name', 'user_id') else None
+                value = self.ask(f"Enter the {attribute} to search: ", complete)
                 if attribute == 'name':
 
-                    self.user_manager.search_users(name=value)
+                    self.user_manager.search_users(name=value, fuzzy=True)
                     print("-" * 100)
                 elif attribute == 'user_id':
                     self.user_manager.search_users(user_id=value)
@@ -170,36 +313,135 @@ class LibraryManagementSystem:
             print("-" * 100)
 
             choice = input("Enter your choice (1-4): ")
+            self.check_manager.refresh()
             print("-" * 100)
             if choice == '1':
-                user_id = input("Enter your user ID: ")
-                isbn = input("Enter the ISBN of the book: ")
+                user_id = self.ask("Enter your user ID: ", self.complete_user("user_id"))
+                isbn = self.ask("Enter the ISBN of the book: ", self.complete_book("isbn"))
                 print("-" * 100)
                 self.check_manager.checkout_book(user_id, isbn)
                 print("-" * 100)
             elif choice == '2':
-                user_id = input("Enter your user ID: ")
-                isbn = input("Enter the ISBN of the book: ")
+                user_id = self.ask("Enter your user ID: ", self.complete_user("user_id"))
+                isbn = self.ask("Enter the ISBN of the book: ", self.complete_book("isbn"))
                 print("-" * 100)
                 self.check_manager.checkin_book(user_id, isbn)
                 print("-" * 100)
             elif choice == '3':
-                user_id = input("Enter your user ID: ")
+                user_id = self.ask("Enter your user ID: ", self.complete_user("user_id"))
                 print("-" * 100)
-                self.check_manager.list_checkouts(user_id)
+                user = self.user_manager.get_user_by_id(user_id)
+                if user:
+                    print(f"Checkouts for {user.name}:")
+                    if not self.show_pages(
+                            lambda cursor, limit: self.check_manager.page_checkouts(user_id, "date", cursor, limit),
+                            lambda checkout: self.check_manager.format_checkout(checkout, with_user=False)):
+                        print("No checkouts found.")
+                else:
+                    print(f"User with ID '{user_id}' not found.")
                 print("-" * 100)
             elif choice == '4':
                 break
             else:
                 print("Invalid choice. Please try again.")
 
+    def import_file(self, kind, path):
+        """
+        Bulk import books or users from a CSV or JSON Lines file.
+
+        Args:
+        - kind (str): Either "books" or "users".
+        - path (str): The file to import.
+        """
+        manager_add = self.book_manager.add_books if kind == "books" else self.user_manager.add_users
+        try:
+            added, rejected = manager_add(read_records(path))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return
+        print_import_report(kind, path, added, rejected)
+
+    def run_batch(self, lines, stop_on_error=False, verbose=True):
+        """
+        Run a script of operations and commit their changes once.
+
+        Args:
+        - lines (iterable): The lines of the script, one operation per line.
+        - stop_on_error (bool): Whether to stop at the first failed operation (default is False).
+        - verbose (bool): Whether to print the result of every operation (default is True).
+
+        Returns:
+        - bool: Whether every operation succeeded.
+        """
+        runner = BatchRunner(self.book_manager, self.user_manager, self.check_manager, self.storage)
+        report = runner.run(lines, stop_on_error, verbose)
+        print_batch_report(report)
+        return not report.failures
+
+    def run_query(self, kind, conditions, order=None, limit=None, offset=0, explain=False):
+        """
+        Run a query and print its results, or the plan chosen for it.
+
+        Args:
+        - kind (str): "books", "users", or "checkouts".
+        - conditions (list): The conditions, each written as "FIELD OPERATOR VALUE".
+        - order (str): The order of the results, or None (default is None).
+        - limit (int): The maximum number of results, or None for all (default is None).
+        - offset (int): The number of matching records skipped first (default is 0).
+        - explain (bool): Whether to print the plan instead of the results (default is False).
+
+        Returns:
+        - bool: Whether the query was valid.
+        """
+        if kind == "books":
+            query, format_record = Query.books(self.book_manager, self.check_manager), str
+        elif kind == "users":
+            query, format_record = Query.users(self.user_manager), lambda user: f"- {user.name} (ID: {user.user_id})"
+        else:
+            query, format_record = Query.checkouts(self.check_manager), self.check_manager.format_checkout
+        try:
+            for condition in conditions:
+                query.where(*parse_condition(condition))
+            if order:
+                query.order_by(order)
+        except QueryError as e:
+            print(f"Error: {e.message}")
+            return False
+        if explain:
+            print(query.explain(limit, offset))
+            return True
+        records = query.run(limit, offset)
+        for record in records:
+            print(format_record(record))
+        print(f"{len(records)} {kind} found.")
+        return True
+
+    def show_stats(self, authors=(), user_ids=(), top=10):
+        """
+        Print the dashboard of the library's counts, and the counts asked for.
+
+        Args:
+        - authors (iterable): The authors whose number of books to print (default is none).
+        - user_ids (iterable): The IDs of the users whose number of loans to print (default is none).
+        - top (int): The number of top authors and borrowers listed (default is 10).
+        """
+        print_stats(collect_stats(self.book_manager, self.user_manager, self.check_manager, top))
+        for author in authors:
+            print(f"Books by {author}: {self.book_manager.count_books(author)}")
+        for user_id in user_ids:
+            user = self.user_manager.get_user_by_id(user_id)
+            if user is None:
+                print(f"User with ID '{user_id}' not found.")
+            else:
+                print(f"Books held by {user.name} (ID: {user_id}): {self.check_manager.count_loans(user_id)}")
+
     def run(self):
         """
             Run the library management system.
         """
         while True:
             self.display_menu()
-            choice = input("Enter your choice (1-4): ")
+            choice = input("Enter your choice (1-5): ")
 
             if choice == '1':
                 self.book_management()
@@ -208,11 +450,223 @@ class LibraryManagementSystem:
             elif choice == '3':
                 self.check_management()
             elif choice == '4':
+                self.show_stats()
+            elif choice == '5':
                 print("Exiting the Library Management System.")
+                self.storage.flush()
+                self.storage.close()
                 sys.exit(0)
             else:
                 print("Invalid choice. Please try again.")
 
+def open_format(data_format, compress=False):
+    """
+    Open the storage backend of a data file format.
+
+    Args:
+    - data_format (str): "json" for the JSON files, "binary" for the binary snapshots, or
+      "sharded" for the sharded files in SHARDED_DIRECTORY.
+    - compress (bool): Whether to compress binary snapshots (default is False).
+
+    Returns:
+    - Storage: The storage backend.
+    """
+    if data_format == "binary":
+        return Storage(*SNAPSHOT_FILES, binary=True, compress=compress)
+    if data_format == "sharded":
+        return ShardedStorage(SHARDED_DIRECTORY)
+    return Storage(journaled=True, line_delimited=True)
+
+def convert_data(to_format, from_format=None, compress=False):
+    """
+    Convert the data files between the JSON files, the binary snapshots, and the sharded files.
+
+    Args:
+    - to_format (str): The format to convert to: "json", "binary", or "sharded".
+    - from_format (str): The format to convert from (default is "json", or "binary" when converting to JSON).
+    - compress (bool): Whether to compress binary snapshots (default is False).
+    """
+    from_format = from_format or ("binary" if to_format == "json" else "json")
+    if from_format == to_format:
+        print("Error: The source and target formats are the same.")
+        return
+    books, users, checkouts = open_format(from_format).copy_to(open_format(to_format, compress))
+    print(f"Converted {books} books, {users} users, and {checkouts} checkouts to {to_format}.")
+
+def build_mapped_catalog(storage, path):
+    """
+    Write the books to a memory-mapped catalog file for read-only lookup workers.
+
+    Args:
+    - storage (BaseStorage): The storage backend to read the books from.
+    - path (str): The catalog file to write.
+    """
+    books = storage.load_books()
+    try:
+        write_mapped_catalog(path, books)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    print(f"Wrote {len(books)} books to '{path}'.")
+
+def create_storage(args):
+    """
+    Create the storage backend selected on the command line.
+
+    Args:
+    - args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+    - BaseStorage: The selected backend, by default the journaled, line-delimited JSON files.
+
+    The server always saves through a background writer, unless the data files are
+    shared, so concurrent requests commit their changes in groups. Batches hold their
+    changes until they end, so each batch is committed once.
+    """
+    if args.sqlite:
+        storage = SQLiteStorage(args.sqlite, fsync=args.fsync)
+    elif args.binary:
+        storage = Storage(*SNAPSHOT_FILES, journaled=True, binary=True, fsync=args.fsync, shared=args.shared)
+    elif args.sharded:
+        storage = ShardedStorage(args.sharded, fsync=args.fsync, shared=args.shared)
+    else:
+        storage = Storage(journaled=True, line_delimited=True, fsync=args.fsync, shared=args.shared)
+    if args.command in ("batch", "run") and not args.shared:
+        storage = BufferedStorage(storage, max_delay=None, max_batch=None)
+    elif args.write_behind or (args.command == "serve" and not args.shared):
+        storage = BufferedStorage(storage, args.max_delay, args.max_batch)
+    return storage
+
+def parse_args(argv=None):
+    """
+    Parse the command-line arguments.
+
+    Args:
+    - argv (list): The arguments to parse (default is sys.argv[1:]).
+
+    Returns:
+    - argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="A simple library management system.")
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="store data in the given SQLite database instead of JSON files")
+    parser.add_argument("--binary", action="store_true",
+                        help=f"store data in binary snapshots ({', '.join(SNAPSHOT_FILES)}) instead of JSON files")
+    parser.add_argument("--sharded", metavar="DIRECTORY", nargs="?", const=SHARDED_DIRECTORY,
+                        help=f"store data in sharded files in DIRECTORY (default is {SHARDED_DIRECTORY}), "
+                             "so saves only rewrite the shards holding the changes")
+    parser.add_argument("--columnar", action="store_true",
+                        help="keep the books in a compact columnar catalog to reduce memory use")
+    parser.add_argument("--cache-size", type=int, default=256, metavar="RESULTS",
+                        help="the number of book and of user search results cached, 0 to disable (default is 256)")
+    parser.add_argument("--fsync", choices=("always", "batched", "never"), default="batched",
+                        help="when writes are synced to disk: on every save, on every data file rewrite and "
+                             "at most once a second for journal appends (the default), or never")
+    parser.add_argument("--shared", action="store_true",
+                        help="lock and version the data files so several front-ends can use them at once")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="save in a background writer that groups bursts of changes into one write")
+    parser.add_argument("--max-delay", type=float, default=0.5, metavar="SECONDS",
+                        help="with --write-behind, the longest time a change waits to be written (default is 0.5)")
+    parser.add_argument("--max-batch", type=int, default=1000, metavar="CHANGES",
+                        help="with --write-behind, the number of queued changes written at once (default is 1000)")
+    commands = parser.add_subparsers(dest="command", title="commands",
+                                     description="run a command instead of the interactive menu")
+    import_parser = commands.add_parser("import", help="bulk import books or users from a CSV or JSON Lines file")
+    import_parser.add_argument("kind", choices=("books", "users"))
+    import_parser.add_argument("path", help="a .csv file with a header row, or a .jsonl/.ndjson file")
+    convert_parser = commands.add_parser("convert", help="convert the data files between JSON, binary snapshots, "
+                                                         "and sharded files")
+    convert_parser.add_argument("format", choices=("binary", "json", "sharded"), help="the format to convert to")
+    convert_parser.add_argument("--source", choices=("binary", "json", "sharded"),
+                                help="the format to convert from (default is json, or binary when converting to json)")
+    convert_parser.add_argument("--compress", action="store_true", help="compress the binary snapshots")
+    map_parser = commands.add_parser("build-map", help="write the books to a memory-mapped catalog for lookup workers")
+    map_parser.add_argument("path", nargs="?", default="books.map", help="the catalog file (default is books.map)")
+    serve_parser = commands.add_parser("serve", help="serve the library as an HTTP/JSON API")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="the address to listen on (default is 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8080, help="the port to listen on (default is 8080)")
+    serve_parser.add_argument("--workers", type=int, default=8,
+                              help="the number of threads running requests (default is 8)")
+    serve_parser.add_argument("--no-wait-for-writes", dest="wait_for_writes", action="store_false",
+                              help="answer changes before they are written, trading durability for latency")
+    batch_parser = commands.add_parser("batch", help="run a script of operations, one per line, and commit "
+                                                     "their changes once")
+    batch_parser.add_argument("path", nargs="?", default="-",
+                              help="the script (default is -, the standard input)")
+    batch_parser.add_argument("--stop-on-error", action="store_true", help="stop at the first failed operation")
+    batch_parser.add_argument("--quiet", action="store_true", help="only print the failed operations and the summary")
+    run_parser = commands.add_parser("run", help="run a single operation, e.g. run checkout USER_ID ISBN")
+    run_parser.add_argument("operation", choices=sorted(BatchRunner.OPERATIONS))
+    run_parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    query_parser = commands.add_parser("query", help="find books, users, or checkouts by several conditions")
+    query_parser.add_argument("kind", choices=("books", "users", "checkouts"))
+    query_parser.add_argument("--where", action="append", default=[], metavar="CONDITION",
+                              help="a condition written as FIELD OPERATOR VALUE, e.g. \"author contains 'le guin'\"; "
+                                   "operators are =, !=, <, <=, >, >=, contains, and prefix (repeatable)")
+    query_parser.add_argument("--order", help="the order of the results, e.g. title, author, or isbn for books")
+    query_parser.add_argument("--limit", type=int, help="the maximum number of results")
+    query_parser.add_argument("--offset", type=int, default=0, help="the number of matching results skipped first")
+    query_parser.add_argument("--explain", action="store_true", help="print the plan chosen instead of the results")
+    stats_parser = commands.add_parser("stats", help="print the dashboard of the library's counts")
+    stats_parser.add_argument("--author", action="append", default=[], dest="authors",
+                              help="also print the number of books by this author (repeatable)")
+    stats_parser.add_argument("--user", action="append", default=[], dest="user_ids", metavar="USER_ID",
+                              help="also print the number of books this user holds (repeatable)")
+    stats_parser.add_argument("--top", type=int, default=10,
+                              help="the number of top authors and borrowers listed (default is 10)")
+    args = parser.parse_args(argv)
+    if args.cache_size < 0:
+        parser.error("--cache-size must not be negative")
+    if args.shared and args.sqlite:
+        parser.error("--shared applies to data files, not SQLite databases")
+    if args.shared and args.write_behind:
+        parser.error("--shared cannot be combined with --write-behind")
+    return args
+
 if __name__ == "__main__":
-    library_system = LibraryManagementSystem()
-    library_system.run()
+    args = parse_args()
+    try:
+        if args.command == "convert":
+            convert_data(args.format, args.source, args.compress)
+            sys.exit(0)
+        if args.command == "build-map":
+            storage = create_storage(args)
+            build_mapped_catalog(storage, args.path)
+            storage.close()
+            sys.exit(0)
+        library_system = LibraryManagementSystem(create_storage(args), args.columnar, args.cache_size)
+        if args.command == "import":
+            library_system.import_file(args.kind, args.path)
+            library_system.storage.close()
+        elif args.command == "batch":
+            try:
+                script = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+            except OSError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            with script:
+                succeeded = library_system.run_batch(script, args.stop_on_error, not args.quiet)
+            library_system.storage.close()
+            sys.exit(0 if succeeded else 1)
+        elif args.command == "run":
+            succeeded = library_system.run_batch([shlex.join([args.operation, *args.arguments])])
+            library_system.storage.close()
+            sys.exit(0 if succeeded else 1)
+        elif args.command == "query":
+            valid = library_system.run_query(args.kind, args.where, args.order, args.limit, args.offset, args.explain)
+            library_system.storage.close()
+            sys.exit(0 if valid else 1)
+        elif args.command == "stats":
+            library_system.show_stats(args.authors, args.user_ids, args.top)
+            library_system.storage.close()
+        elif args.command == "serve":
+            LibraryServer(library_system.book_manager, library_system.user_manager, library_system.check_manager,
+                          library_system.storage, args.host, args.port, args.workers, args.wait_for_writes).run()
+            library_system.storage.flush()
+            library_system.storage.close()
+        else:
+            library_system.run()
+    except StorageError as e:
+        print(f"Error: {e.message}")
+        sys.exit(1)
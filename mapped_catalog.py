@@ -0,0 +1,201 @@
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from models import Book
+
+MAGIC = b"LIBMAP\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHII")
+RECORD = struct.Struct("<IIIHHHBx")
+RECORD_ISBN = struct.Struct("<I8xH")
+
+
+class MappedCatalogError(Exception):
+    """
+    Exception raised for unreadable mapped catalog files.
+
+    Attributes:
+    - message (str): Explanation of the error.
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+def write_mapped_catalog(file_path, books):
+    """
+    Writes books in the mapped catalog layout.
+
+    The file holds a header (magic bytes, format version, reserved flags, record count, and
+    the offset of the string heap), a table of fixed-width records sorted by ISBN, and a heap of UTF-8
+    strings. Each record holds the heap offsets and lengths of its ISBN, title, and author,
+    and the availability of the book. Authors are stored in the heap once.
+
+    The file is written next to its destination and then renamed over it, so processes
+    that have the previous catalog mapped keep reading a consistent copy.
+
+    Args:
+    - file_path (str): The file to write.
+    - books (iterable): The Book objects to write.
+    """
+    heap = bytearray()
+    authors = {}
+
+    def append(text):
+        data = text.encode("utf-8")
+        if len(data) > 0xFFFF:
+            raise ValueError(f"'{text[:40]}...' is too long for the mapped catalog.")
+        heap.extend(data)
+        return len(heap) - len(data), len(data)
+
+    records = []
+    for book in sorted(books, key=lambda book: book.isbn.encode("utf-8")):
+        isbn_offset, isbn_length = append(book.isbn)
+        title_offset, title_length = append(book.title)
+        if book.author not in authors:
+            authors[book.author] = append(book.author)
+        author_offset, author_length = authors[book.author]
+        records.append(RECORD.pack(isbn_offset, title_offset, author_offset,
+                                   isbn_length, title_length, author_length, book.available))
+    heap_offset = HEADER.size + RECORD.size * len(records)
+    if heap_offset + len(heap) > 0xFFFFFFFF:
+        raise ValueError("The catalog is too large for the mapped catalog layout.")
+
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(records), heap_offset))
+        file.write(b"".join(records))
+        file.write(heap)
+    os.replace(temporary_path, file_path)
+
+
+class MappedCatalog(Mapping):
+    """
+    A read-only catalog of books memory-mapped from a file written by write_mapped_catalog.
+
+    Opening the catalog only reads its header: nothing is parsed up front, and the pages of
+    the file are shared through the page cache by every process mapping it. The catalog is
+    a mapping from ISBN to Book, where each lookup is a binary search over the sorted record
+    table and returns a new Book object decoded from the mapped record.
+
+    Attributes:
+    - file_path (str): The mapped file.
+    """
+
+    def __init__(self, file_path):
+        """
+        Opens and maps a catalog file.
+
+        Args:
+        - file_path (str): The file to map.
+
+        Raises:
+        - MappedCatalogError: If the file is not a mapped catalog of a supported version.
+        """
+        self.file_path = file_path
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                raise MappedCatalogError("The catalog header is truncated.")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self._count, self._heap_offset = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise MappedCatalogError("The file is not a mapped catalog.")
+        if version != VERSION:
+            self.close()
+            raise MappedCatalogError(f"Unsupported mapped catalog version {version}.")
+        if HEADER.size + RECORD.size * self._count > self._heap_offset or self._heap_offset > len(self._map):
+            self.close()
+            raise MappedCatalogError("The mapped catalog is truncated.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._isbn(index)
+
+    def __contains__(self, isbn):
+        return self._find(isbn) is not None
+
+    def __getitem__(self, isbn):
+        index = self._find(isbn)
+        if index is None:
+            raise KeyError(isbn)
+        return self.book(index)
+
+    def books(self):
+        """
+        Iterates over the books in ISBN order.
+
+        Yields:
+        - Book: Each book of the catalog.
+        """
+        for index in range(self._count):
+            yield self.book(index)
+
+    def book(self, index):
+        """
+        Decodes the book stored in a record.
+
+        Args:
+        - index (int): The position of the record in ISBN order.
+
+        Returns:
+        - Book: A new Book object holding the record's values.
+        """
+        isbn_offset, title_offset, author_offset, isbn_length, title_length, author_length, available = \
+            RECORD.unpack_from(self._map, HEADER.size + RECORD.size * index)
+        return Book(self._string(title_offset, title_length), self._string(author_offset, author_length),
+                    self._string(isbn_offset, isbn_length), bool(available))
+
+    def close(self):
+        """
+        Unmaps the catalog file.
+        """
+        self._map.close()
+
+    def _find(self, isbn):
+        """
+        Binary searches the record table for an ISBN.
+
+        Args:
+        - isbn (str): The ISBN to find.
+
+        Returns:
+        - int or None: The position of the record, or None if the ISBN is not in the catalog.
+        """
+        key = isbn.encode("utf-8")
+        data, heap_offset = self._map, self._heap_offset
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length = RECORD_ISBN.unpack_from(data, HEADER.size + RECORD.size * middle)
+            start = heap_offset + offset
+            if data[start:start + length] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._isbn_bytes(low) == key:
+            return low
+        return None
+
+    def _isbn(self, index):
+        return self._isbn_bytes(index).decode("utf-8")
+
+    def _isbn_bytes(self, index):
+        offset, length = RECORD_ISBN.unpack_from(self._map, HEADER.size + RECORD.size * index)
+        start = self._heap_offset + offset
+        return self._map[start:start + length]
+
+    def _string(self, offset, length):
+        start = self._heap_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
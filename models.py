@@ -1,9 +1,9 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Optional
 
 
 
-@dataclass
+@dataclass(slots=True)
 class Book:
 
     """
@@ -86,7 +86,7 @@ class Book:
             self.isbn = isbn
         print(f"Book '{self.title}' updated successfully.")
 
-@dataclass
+@dataclass(slots=True)
 class User:
     """
     A class representing a user.
@@ -137,4 +137,18 @@ class User:
             print("No books borrowed.")
         else:
             for book in self.borrowed_books:
-                print(f"- {book.title} by {book.author} (ISBN: {book.isbn})")
\ No newline at end of file
+                print(f"- {book.title} by {book.author} (ISBN: {book.isbn})")
+
+@dataclass(slots=True)
+class Checkout:
+    """
+    A class representing a checkout of a book by a user.
+
+    Attributes:
+    - user_id (str): The ID of the user who checked out the book.
+    - isbn (str): The ISBN of the checked-out book.
+    - timestamp (str): When the book was checked out, in ISO 8601 format (None for legacy records).
+    """
+    user_id: str
+    isbn: str
+    timestamp: Optional[str] = None
@@ -0,0 +1,151 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+
+class SortedIndex:
+    """
+    The keys of a collection (ISBNs or user IDs) kept as an array sorted by a sort key
+    computed from each key, e.g. the lowercase title of the book with that ISBN. The array
+    holds only the keys themselves, and sort keys are computed during binary searches, so
+    the index costs one reference per record.
+
+    The sort key of a key must end with the key, so no two keys compare equal, and must not
+    change while the key is indexed: remove a key before its record changes and add it again
+    afterwards.
+
+    Attributes:
+    - sort_key (callable): Returns the sort key of a key.
+    - _keys (list): The keys, sorted by their sort keys.
+    """
+
+    def __init__(self, sort_key, keys=()):
+        """
+        Initializes a SortedIndex.
+
+        Args:
+        - sort_key (callable): Returns the sort key of a key.
+        - keys (iterable): The keys to index at once (default is none).
+        """
+        self.sort_key = sort_key
+        self._keys = sorted(keys, key=sort_key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        """
+        Adds a key.
+
+        Args:
+        - key (str): The key to add.
+        """
+        insort(self._keys, key, key=self.sort_key)
+
+    def add_many(self, keys):
+        """
+        Adds many keys, sorting the array once instead of inserting them one by one.
+
+        Args:
+        - keys (iterable): The keys to add.
+        """
+        self._keys.extend(keys)
+        self._keys.sort(key=self.sort_key)
+
+    def remove(self, key):
+        """
+        Removes a key, if it is indexed.
+
+        Args:
+        - key (str): The key to remove.
+        """
+        index = bisect_left(self._keys, self.sort_key(key), key=self.sort_key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def items(self, after=None):
+        """
+        Yields the keys in order with their sort keys, starting after a cursor. The index
+        must not change while the generator is advanced.
+
+        Args:
+        - after (tuple): The sort key to start after, or None to start at the first key (default is None).
+
+        Yields:
+        - tuple: The sort key and the key.
+        """
+        index = 0 if after is None else bisect_right(self._keys, after, key=self.sort_key)
+        while index < len(self._keys):
+            key = self._keys[index]
+            yield self.sort_key(key), key
+            index += 1
+
+    def count(self, low=None, high=None):
+        """
+        Counts the keys whose sort keys lie in a range, by two binary searches.
+
+        Args:
+        - low (tuple): The lowest sort key included, or None for no lower bound (default is None).
+        - high (tuple): The lowest sort key above the range, or None for no upper bound (default is None).
+
+        Returns:
+        - int: The number of keys in the range.
+        """
+        start, stop = self._span(low, high)
+        return max(stop - start, 0)
+
+    def range(self, low=None, high=None):
+        """
+        Yields the keys whose sort keys lie in a range, in order, with their sort keys.
+        The index must not change while the generator is advanced.
+
+        Args:
+        - low (tuple): The lowest sort key included, or None for no lower bound (default is None).
+        - high (tuple): The lowest sort key above the range, or None for no upper bound (default is None).
+
+        Yields:
+        - tuple: The sort key and the key.
+        """
+        start, stop = self._span(low, high)
+        for index in range(start, stop):
+            key = self._keys[index]
+            yield self.sort_key(key), key
+
+    def _span(self, low, high):
+        """
+        Returns the positions of the first key in a range and of the first key above it.
+
+        Args:
+        - low (tuple): The lowest sort key included, or None.
+        - high (tuple): The lowest sort key above the range, or None.
+
+        Returns:
+        - tuple: The start and stop positions.
+        """
+        start = 0 if low is None else bisect_left(self._keys, low, key=self.sort_key)
+        stop = len(self._keys) if high is None else bisect_left(self._keys, high, key=self.sort_key)
+        return start, stop
+
+
+def paginate(ordered, limit):
+    """
+    Takes one page from an ordered iterator of (sort key, item) pairs.
+
+    The cursor of the next page is the sort key of the last item of this page, so a page
+    taken with it starts after that item even if records were added or removed meanwhile.
+
+    Args:
+    - ordered (iterator): The (sort key, item) pairs, starting after the cursor of the page.
+    - limit (int): The maximum number of items on the page.
+
+    Returns:
+    - tuple: The items of the page, and the cursor of the next page, or None if this is the last page.
+
+    Raises:
+    - ValueError: If the limit is not positive.
+    """
+    if limit < 1:
+        raise ValueError("The page size must be at least 1.")
+    page = list(islice(ordered, limit + 1))
+    if len(page) > limit:
+        return [item for _, item in page[:limit]], page[limit - 1][0]
+    return [item for _, item in page], None
@@ -0,0 +1,689 @@
+import math
+import shlex
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, List, Optional
+
+MAX_CHAR = "\U0010ffff"
+SORT_WEIGHT = 0.1
+
+
+class QueryError(Exception):
+    """
+    Exception raised for a query naming an unknown field, operator, or order, or comparing
+    a field with a value of the wrong type.
+
+    Attributes:
+    - message (str): Explanation of the error.
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+@dataclass(slots=True)
+class Condition:
+    """
+    A predicate comparing a field of a record with a value.
+
+    "contains" and "prefix" compare text case-insensitively; the other operators compare
+    exactly, and "<", "<=", ">", and ">=" compare text by code point.
+
+    Attributes:
+    - field (str): The name of the field.
+    - operator (str): One of "=", "!=", "<", "<=", ">", ">=", "contains", or "prefix".
+    - value (str, bool, or int): The value compared with.
+    """
+
+    field: str
+    operator: str
+    value: object
+
+    def matches(self, value):
+        """
+        Tests a field value against the condition.
+
+        Args:
+        - value (str, bool, or int): The value of the field.
+
+        Returns:
+        - bool: Whether the value satisfies the condition.
+        """
+        operator = self.operator
+        if operator == "contains":
+            return self.value.lower() in value.lower()
+        if operator == "prefix":
+            return value.lower().startswith(self.value.lower())
+        if operator == "=":
+            return value == self.value
+        if operator == "!=":
+            return value != self.value
+        if operator == "<":
+            return value < self.value
+        if operator == "<=":
+            return value <= self.value
+        if operator == ">":
+            return value > self.value
+        return value >= self.value
+
+    def __str__(self):
+        return f"{self.field} {self.operator} {self.value!r}"
+
+
+@dataclass(slots=True)
+class AccessPath:
+    """
+    One way of reading the records a query may match.
+
+    Attributes:
+    - description (str): What the path reads, for explain().
+    - rows (int): The number of records the path reads, exact or an upper bound.
+    - read (callable): Returns an iterator of the records.
+    - order (str): The order the records are read in, or None if unordered.
+    """
+
+    description: str
+    rows: int
+    read: Callable
+    order: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Plan:
+    """
+    The access path chosen for a query, with the estimated cost of each path considered.
+
+    Attributes:
+    - path (AccessPath): The chosen path.
+    - sort (bool): Whether the matches are sorted after reading, because the path does not read them in order.
+    - cost (float): The estimated cost of the plan.
+    - matches (int): The estimated number of matching records.
+    - alternatives (list): (AccessPath, cost) pairs of the paths not chosen.
+    """
+
+    path: AccessPath
+    sort: bool
+    cost: float
+    matches: int
+    alternatives: List[tuple] = field(default_factory=list)
+
+
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=", "contains", "prefix")
+TEXT_OPERATORS = ("contains", "prefix")
+
+
+class Source:
+    """
+    The records of one manager that queries read, and the indexes they may read them through.
+
+    Subclasses describe their fields, the orders their sorted indexes provide, and the
+    access paths their other indexes offer for a set of conditions. Sources read the
+    managers' indexes directly, holding the manager locks while a query runs.
+
+    Attributes:
+    - name (str): The name of the records, for explain().
+    """
+
+    name = "records"
+    KEY_FIELD = None
+    FIELDS = {}
+    ORDERS = {}
+
+    def locked(self):
+        """
+        Returns a context manager holding the locks of the managers read.
+        """
+        raise NotImplementedError
+
+    def size(self):
+        """
+        Returns the number of records.
+        """
+        raise NotImplementedError
+
+    def scan(self):
+        """
+        Returns an iterator over all records, in no particular order.
+        """
+        raise NotImplementedError
+
+    def orderings(self):
+        """
+        Returns the sorted index of each order and a function resolving its keys to records.
+
+        Returns:
+        - tuple: The sorted indexes keyed by order, and the resolving function.
+        """
+        raise NotImplementedError
+
+    def value(self, record, name):
+        """
+        Returns the value of a field of a record.
+
+        Args:
+        - record: The record.
+        - name (str): The name of the field.
+
+        Returns:
+        - str, bool, or int: The value.
+        """
+        return getattr(record, name)
+
+    def index_paths(self, conditions):
+        """
+        Returns the access paths of the indexes other than the sorted indexes.
+
+        Args:
+        - conditions (list): The conditions of the query.
+
+        Returns:
+        - list: The AccessPath of each usable index.
+        """
+        return []
+
+    def access_paths(self, conditions):
+        """
+        Returns every access path usable for a set of conditions: the index paths, a range
+        of a sorted index for each condition on the leading field of its sort key, and a
+        full scan of each sorted index, which reads the records in order.
+
+        Args:
+        - conditions (list): The conditions of the query.
+
+        Returns:
+        - list: The AccessPath objects.
+        """
+        paths = self.index_paths(conditions)
+        orderings, resolve = self.orderings()
+        for order, index in orderings.items():
+            leading, folded = self.ORDERS[order]
+            for condition in conditions:
+                if condition.field != leading:
+                    continue
+                bounds = self._bounds(condition, folded)
+                if bounds is None:
+                    continue
+                low, high = bounds
+                paths.append(AccessPath(f"range of the {order} index: {condition}", index.count(low, high),
+                                        self._reader(index.range, resolve, low, high), order))
+            paths.append(AccessPath(f"ordered scan of the {order} index", len(index),
+                                    self._reader(index.range, resolve, None, None), order))
+        return paths
+
+    @staticmethod
+    def _reader(items, resolve, low, high):
+        """
+        Returns a function reading the records of a range of a sorted index.
+        """
+        return lambda: (resolve(key) for _, key in items(low, high))
+
+    @staticmethod
+    def _bounds(condition, folded):
+        """
+        Returns the range of leading sort keys a condition selects, or None if the index
+        cannot narrow it down. A prefix is matched case-insensitively, so it only selects a
+        range of an index sorted by the exact text if it has no letters with case.
+
+        Args:
+        - condition (Condition): A condition on the leading field of a sort key.
+        - folded (bool): Whether the index sorts the field in lowercase.
+
+        Returns:
+        - tuple or None: The lowest sort key included and the lowest above, each possibly None.
+        """
+        value = condition.value
+        if not isinstance(value, str):
+            return None
+        if condition.operator == "prefix":
+            if folded:
+                value = value.lower()
+            elif value.lower() != value.upper():
+                return None
+            return (value,), (value + MAX_CHAR,)
+        if condition.operator == "=":
+            value = value.lower() if folded else value
+            return (value,), (value + "\0",)
+        if folded:
+            return None
+        return {
+            ">=": ((value,), None),
+            ">": ((value + "\0",), None),
+            "<": (None, (value,)),
+            "<=": (None, (value + "\0",)),
+        }.get(condition.operator)
+
+    def sort_key(self, order):
+        """
+        Returns the function giving the sort key of a record in an order.
+
+        Args:
+        - order (str): The order.
+
+        Returns:
+        - callable: The sort key function.
+        """
+        orderings, _ = self.orderings()
+        index, key_field = orderings[order], self.KEY_FIELD
+        return lambda record: index.sort_key(getattr(record, key_field))
+
+
+class BookSource(Source):
+    """
+    The books of a BookManager. With a CheckManager, the books that are not available are
+    read from its checkouts.
+    """
+
+    name = "books"
+    KEY_FIELD = "isbn"
+    FIELDS = {"title": str, "author": str, "isbn": str, "available": bool}
+    ORDERS = {"title": ("title", True), "author": ("author", True), "isbn": ("isbn", False)}
+
+    def __init__(self, book_manager, check_manager=None):
+        self.book_manager = book_manager
+        self.check_manager = check_manager
+
+    @contextmanager
+    def locked(self):
+        if self.check_manager is None:
+            with self.book_manager._locked():
+                yield
+        else:
+            with self.check_manager._locked(), self.book_manager._locked():
+                yield
+
+    def size(self):
+        return len(self.book_manager._books_by_isbn)
+
+    def scan(self):
+        return iter(self.book_manager._books_by_isbn.values())
+
+    def orderings(self):
+        return self.book_manager._orderings, self.book_manager._books_by_isbn.__getitem__
+
+    def index_paths(self, conditions):
+        books_by_isbn = self.book_manager._books_by_isbn
+        paths = []
+        for condition in conditions:
+            if condition.field == "isbn" and condition.operator == "=":
+                book = books_by_isbn.get(condition.value)
+                paths.append(AccessPath(f"ISBN index: {condition}", int(book is not None),
+                                        lambda book=book: iter([book] if book is not None else [])))
+            elif (condition.field == "available" and self.check_manager is not None
+                  and (condition.operator, condition.value) in (("=", False), ("!=", True))):
+                checkouts = self.check_manager.checkouts
+                paths.append(AccessPath(f"checkouts: {condition}", len(checkouts),
+                                        lambda: (books_by_isbn[isbn] for isbn in checkouts if isbn in books_by_isbn)))
+
+        text_index = self.book_manager._text_index
+        searches = [(condition.field, condition.value) for condition in conditions
+                    if condition.field in text_index.fields and condition.operator == "contains"]
+        estimates = [text_index.estimate(name, text) for name, text in searches]
+        if searches and None not in estimates:
+            def read():
+                keys = None
+                for name, text in searches:
+                    field_keys = text_index.candidates(name, text)
+                    keys = field_keys if keys is None else keys & field_keys
+                return (books_by_isbn[key] for key in keys)
+
+            description = " and ".join(f"{name} contains {text!r}" for name, text in searches)
+            paths.append(AccessPath(f"text index: {description}", min(estimates), read))
+        return paths
+
+
+class UserSource(Source):
+    """
+    The users of a UserManager. The "loans" field is the number of books a user has borrowed.
+    """
+
+    name = "users"
+    KEY_FIELD = "user_id"
+    FIELDS = {"name": str, "user_id": str, "loans": int}
+    ORDERS = {"name": ("name", True), "user_id": ("user_id", False)}
+
+    def __init__(self, user_manager):
+        self.user_manager = user_manager
+
+    def locked(self):
+        return self.user_manager._locked()
+
+    def size(self):
+        return len(self.user_manager._users_by_id)
+
+    def scan(self):
+        return iter(self.user_manager._users_by_id.values())
+
+    def orderings(self):
+        return self.user_manager._orderings, self.user_manager._users_by_id.__getitem__
+
+    def value(self, record, name):
+        if name == "loans":
+            return len(record.borrowed_books)
+        return getattr(record, name)
+
+    def index_paths(self, conditions):
+        users_by_id = self.user_manager._users_by_id
+        paths = []
+        for condition in conditions:
+            if condition.field == "user_id" and condition.operator == "=":
+                user = users_by_id.get(condition.value)
+                paths.append(AccessPath(f"user ID index: {condition}", int(user is not None),
+                                        lambda user=user: iter([user] if user is not None else [])))
+        return paths
+
+
+class CheckoutSource(Source):
+    """
+    The checkouts of a CheckManager. The "date" field is the time a book was checked out,
+    or "" for legacy checkouts recorded without one, matching their place in the date order.
+    """
+
+    name = "checkouts"
+    KEY_FIELD = "isbn"
+    FIELDS = {"user_id": str, "isbn": str, "date": str}
+    ORDERS = {"date": ("date", False), "user": ("user_id", False), "isbn": ("isbn", False)}
+
+    def __init__(self, check_manager):
+        self.check_manager = check_manager
+
+    def locked(self):
+        return self.check_manager._locked()
+
+    def size(self):
+        return len(self.check_manager.checkouts)
+
+    def scan(self):
+        return iter(self.check_manager.checkouts.values())
+
+    def orderings(self):
+        return self.check_manager._orderings, self.check_manager.checkouts.__getitem__
+
+    def value(self, record, name):
+        if name == "date":
+            return record.timestamp or ""
+        return getattr(record, name)
+
+    def index_paths(self, conditions):
+        checkouts = self.check_manager.checkouts
+        paths = []
+        for condition in conditions:
+            if condition.operator != "=":
+                continue
+            if condition.field == "isbn":
+                checkout = checkouts.get(condition.value)
+                paths.append(AccessPath(f"ISBN index: {condition}", int(checkout is not None),
+                                        lambda checkout=checkout: iter([checkout] if checkout is not None else [])))
+            elif condition.field == "user_id":
+                user_checkouts = self.check_manager._checkouts_by_user.get(condition.value, {})
+                paths.append(AccessPath(f"user index: {condition}", len(user_checkouts),
+                                        lambda user_checkouts=user_checkouts: iter(user_checkouts.values())))
+        return paths
+
+
+class Query:
+    """
+    A query over the books, users, or checkouts: a conjunction of conditions, an optional
+    order, and a page given by an offset and a limit.
+
+    Each run plans the query against the current indexes. Every usable access path is
+    costed: an index lookup reads its candidates, a range of a sorted index reads the
+    records in the range, and a scan reads every record. A path reading the records in
+    the requested order stops as soon as the page is full; any other path reads all of its
+    records and sorts the matches. The cheapest path is used, and every record it reads
+    is checked against all conditions. explain() describes the plan without running it.
+
+    Attributes:
+    - source (Source): The records queried.
+    - conditions (list): The Condition objects all matching records satisfy.
+    - order (str): The order of the results, or None for the order of the chosen path.
+    """
+
+    def __init__(self, source):
+        """
+        Initializes a Query over all records of a source.
+
+        Args:
+        - source (Source): The records to query.
+        """
+        self.source = source
+        self.conditions = []
+        self.order = None
+
+    @classmethod
+    def books(cls, book_manager, check_manager=None):
+        """
+        Creates a query over the books.
+
+        Args:
+        - book_manager (BookManager): The books.
+        - check_manager (CheckManager): The checkouts, used to find the books that are not available (default is None).
+
+        Returns:
+        - Query: The query.
+        """
+        return cls(BookSource(book_manager, check_manager))
+
+    @classmethod
+    def users(cls, user_manager):
+        """
+        Creates a query over the users.
+
+        Args:
+        - user_manager (UserManager): The users.
+
+        Returns:
+        - Query: The query.
+        """
+        return cls(UserSource(user_manager))
+
+    @classmethod
+    def checkouts(cls, check_manager):
+        """
+        Creates a query over the checkouts.
+
+        Args:
+        - check_manager (CheckManager): The checkouts.
+
+        Returns:
+        - Query: The query.
+        """
+        return cls(CheckoutSource(check_manager))
+
+    def where(self, name, operator, value):
+        """
+        Adds a condition, converting a text value to the type of the field.
+
+        Args:
+        - name (str): The name of the field.
+        - operator (str): One of "=", "!=", "<", "<=", ">", ">=", "contains", or "prefix".
+        - value (str, bool, or int): The value compared with.
+
+        Returns:
+        - Query: The query itself, so calls can be chained.
+
+        Raises:
+        - QueryError: If the field or operator is unknown, or does not suit the value.
+        """
+        kind = self.source.FIELDS.get(name)
+        if kind is None:
+            raise QueryError(f"Unknown field '{name}'. Use {', '.join(self.source.FIELDS)}.")
+        if operator not in OPERATORS:
+            raise QueryError(f"Unknown operator '{operator}'. Use {', '.join(OPERATORS)}.")
+        if operator in TEXT_OPERATORS and kind is not str:
+            raise QueryError(f"The field '{name}' is not text, so '{operator}' cannot be used.")
+        if kind is bool and operator not in ("=", "!="):
+            raise QueryError(f"The field '{name}' is true or false, so only '=' and '!=' can be used.")
+        self.conditions.append(Condition(name, operator, self._convert(name, kind, value)))
+        return self
+
+    def order_by(self, order):
+        """
+        Sets the order of the results.
+
+        Args:
+        - order (str): One of the source's orders, e.g. "title" for books.
+
+        Returns:
+        - Query: The query itself, so calls can be chained.
+
+        Raises:
+        - QueryError: If the order is unknown.
+        """
+        if order not in self.source.ORDERS:
+            raise QueryError(f"Unknown order '{order}'. Use {', '.join(self.source.ORDERS)}.")
+        self.order = order
+        return self
+
+    def run(self, limit=None, offset=0):
+        """
+        Plans and runs the query.
+
+        Args:
+        - limit (int): The maximum number of results, or None for all (default is None).
+        - offset (int): The number of matching records skipped first (default is 0).
+
+        Returns:
+        - list: The matching records.
+        """
+        source = self.source
+        with source.locked():
+            plan = self._plan(limit, offset)
+            records = plan.path.read()
+            matches = (record for record in records
+                       if all(condition.matches(source.value(record, condition.field))
+                              for condition in self.conditions))
+            if plan.sort:
+                matches = sorted(matches, key=source.sort_key(self.order))
+            return list(islice(matches, offset, None if limit is None else offset + limit))
+
+    def explain(self, limit=None, offset=0):
+        """
+        Describes the plan chosen for the query, and the cost of the paths considered.
+
+        Args:
+        - limit (int): The maximum number of results, or None for all (default is None).
+        - offset (int): The number of matching records skipped first (default is 0).
+
+        Returns:
+        - str: The plan.
+        """
+        with self.source.locked():
+            plan = self._plan(limit, offset)
+        lines = [f"Query: {self}" + (f" offset {offset}" if offset else "")
+                 + (f" limit {limit}" if limit is not None else ""),
+                 f"Read: {plan.path.description} ({plan.path.rows} rows)"]
+        if self.conditions:
+            lines.append("Filter: " + " and ".join(str(condition) for condition in self.conditions))
+        if plan.sort:
+            lines.append(f"Sort: by {self.order} (about {plan.matches} matches)")
+        elif limit is not None:
+            lines.append(f"Stop: after {offset + limit} matches")
+        lines.append(f"Estimated cost: {plan.cost:.0f}")
+        if plan.alternatives:
+            lines.append("Other paths considered:")
+            lines.extend(f"- {path.description} ({path.rows} rows): cost {cost:.0f}"
+                         for path, cost in plan.alternatives)
+        return "\n".join(lines)
+
+    def __str__(self):
+        text = self.source.name
+        if self.conditions:
+            text += " where " + " and ".join(str(condition) for condition in self.conditions)
+        if self.order:
+            text += f" order by {self.order}"
+        return text
+
+    def _plan(self, limit, offset):
+        """
+        Chooses the cheapest access path. Must be called with the source locked.
+
+        A path's cost is the number of records it reads, plus the cost of sorting the
+        matches if it does not read them in the requested order. The number of matches is
+        estimated from the most selective index, or by halving the records per condition.
+
+        Args:
+        - limit (int): The maximum number of results, or None.
+        - offset (int): The number of matching records skipped.
+
+        Returns:
+        - Plan: The chosen plan.
+        """
+        source = self.source
+        size = source.size()
+        paths = source.access_paths(self.conditions)
+        paths.append(AccessPath("full scan", size, source.scan))
+        matches = min([path.rows for path in paths] + [size * 0.5 ** len(self.conditions)])
+        wanted = None if limit is None else offset + limit
+
+        costed = []
+        for path in paths:
+            in_order = self.order is None or path.order == self.order
+            rows = path.rows
+            if in_order and wanted is not None and rows:
+                rows = min(rows, wanted * rows / max(min(matches, rows), 1))
+            cost = rows
+            if not in_order:
+                found = min(matches, path.rows)
+                cost += SORT_WEIGHT * found * math.log2(found + 1)
+            costed.append((cost, path, not in_order))
+        best = min(range(len(costed)), key=lambda position: costed[position][0])
+        cost, path, sort = costed[best]
+        alternatives = [(other, other_cost) for position, (other_cost, other, _) in enumerate(costed)
+                        if position != best]
+        return Plan(path, sort, cost, round(matches), alternatives)
+
+    @staticmethod
+    def _convert(name, kind, value):
+        """
+        Converts a value to the type of a field.
+
+        Args:
+        - name (str): The name of the field.
+        - kind (type): The type of the field: str, bool, or int.
+        - value (str, bool, or int): The value.
+
+        Returns:
+        - str, bool, or int: The converted value.
+
+        Raises:
+        - QueryError: If the value cannot be converted.
+        """
+        if kind is bool:
+            if isinstance(value, bool):
+                return value
+            text = str(value).strip().lower()
+            if text in ("true", "yes", "1"):
+                return True
+            if text in ("false", "no", "0"):
+                return False
+            raise QueryError(f"The field '{name}' is true or false, not '{value}'.")
+        if kind is int:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise QueryError(f"The field '{name}' is a number, not '{value}'.")
+        return str(value)
+
+
+def parse_condition(text):
+    """
+    Parses a condition written as "FIELD OPERATOR VALUE", with the value quoted if it
+    contains spaces, e.g. "author contains 'le guin'".
+
+    Args:
+    - text (str): The condition.
+
+    Returns:
+    - tuple: The field, operator, and value.
+
+    Raises:
+    - QueryError: If the condition does not have three parts.
+    """
+    try:
+        words = shlex.split(text)
+    except ValueError as e:
+        raise QueryError(f"Invalid condition '{text}': {e}.")
+    if len(words) != 3:
+        raise QueryError(f"Invalid condition '{text}'. Write it as FIELD OPERATOR VALUE.")
+    return tuple(words)
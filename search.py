@@ -0,0 +1,345 @@
+import heapq
+import re
+
+
+class TextIndex:
+    """
+    An inverted index from the character trigrams of text fields to the keys of the records
+    containing them, used to answer case-insensitive substring queries without scanning
+    every record.
+
+    A query of three or more characters can only occur in a text containing all of its
+    trigrams, so the intersection of their postings is a small superset of the matches.
+    Shorter queries are answered from the trigrams containing them, and texts shorter than
+    three characters are indexed as a single gram. Callers verify candidates against the
+    record itself.
+
+    Attributes:
+    - fields (tuple): The names of the indexed fields.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, fields):
+        """
+        Initializes an empty TextIndex.
+
+        Args:
+        - fields (tuple): The names of the indexed fields.
+        """
+        self.fields = tuple(fields)
+        self._postings = {field: {} for field in self.fields}
+
+    @classmethod
+    def grams(cls, text):
+        """
+        Returns the set of lowercase grams of a text.
+
+        Args:
+        - text (str): The text to split.
+
+        Returns:
+        - set: The grams of the text.
+        """
+        text = text.lower()
+        if len(text) < cls.GRAM_SIZE:
+            return {text} if text else set()
+        return {text[i:i + cls.GRAM_SIZE] for i in range(len(text) - cls.GRAM_SIZE + 1)}
+
+    def add(self, key, values):
+        """
+        Indexes a record.
+
+        Args:
+        - key (str): The key of the record.
+        - values (dict): The text of each indexed field.
+        """
+        for field in self.fields:
+            postings = self._postings[field]
+            for gram in self.grams(values[field]):
+                postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key, values):
+        """
+        Removes a record from the index.
+
+        Args:
+        - key (str): The key of the record.
+        - values (dict): The text of each indexed field, as it was indexed.
+        """
+        for field in self.fields:
+            postings = self._postings[field]
+            for gram in self.grams(values[field]):
+                keys = postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del postings[gram]
+
+    def candidates(self, field, text):
+        """
+        Returns the keys of the records whose field may contain a text.
+
+        Args:
+        - field (str): The field to search.
+        - text (str): The text to search for.
+
+        Returns:
+        - set: A superset of the keys of the matching records.
+        """
+        postings = self._postings[field]
+        text = text.lower()
+        if len(text) < self.GRAM_SIZE:
+            keys = set()
+            for gram, gram_keys in postings.items():
+                if text in gram:
+                    keys |= gram_keys
+            return keys
+
+        lists = []
+        for gram in self.grams(text):
+            gram_keys = postings.get(gram)
+            if not gram_keys:
+                return set()
+            lists.append(gram_keys)
+        lists.sort(key=len)
+        keys = set(lists[0])
+        for gram_keys in lists[1:]:
+            keys &= gram_keys
+            if not keys:
+                break
+        return keys
+
+    def estimate(self, field, text):
+        """
+        Returns an upper bound on the number of candidates of a text without collecting
+        them: the size of the smallest posting of its grams.
+
+        Args:
+        - field (str): The field to search.
+        - text (str): The text to search for.
+
+        Returns:
+        - int or None: The bound, or None for a text shorter than a gram, whose candidates
+          can only be counted by collecting them.
+        """
+        text = text.lower()
+        if len(text) < self.GRAM_SIZE:
+            return None
+        postings = self._postings[field]
+        return min(len(postings.get(gram, ())) for gram in self.grams(text))
+
+
+class FuzzyIndex:
+    """
+    A typo-tolerant index of text fields.
+
+    Texts are split into word tokens. Each distinct token is indexed once by its padded
+    trigrams, so a query token is only compared (by edit distance) against the vocabulary
+    tokens sharing enough trigrams with it, never against every record. Records are then
+    ranked by the summed edit distance of their best match for each query token.
+
+    Attributes:
+    - fields (tuple): The names of the indexed fields.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, fields):
+        """
+        Initializes an empty FuzzyIndex.
+
+        Args:
+        - fields (tuple): The names of the indexed fields.
+        """
+        self.fields = tuple(fields)
+        self._postings = {field: {} for field in self.fields}
+        self._token_counts = {}
+        self._vocabulary = {}
+
+    @staticmethod
+    def tokens(text):
+        """
+        Splits a text into lowercase word tokens.
+
+        Args:
+        - text (str): The text to split.
+
+        Returns:
+        - set: The tokens of the text.
+        """
+        return set(re.findall(r"\w+", text.lower()))
+
+    @classmethod
+    def grams(cls, token):
+        """
+        Returns the trigrams of a token padded with two boundary markers on each side.
+
+        Args:
+        - token (str): The token.
+
+        Returns:
+        - set: The padded trigrams of the token.
+        """
+        padded = f"\0\0{token}\0\0"
+        return {padded[i:i + cls.GRAM_SIZE] for i in range(len(padded) - cls.GRAM_SIZE + 1)}
+
+    @staticmethod
+    def max_distance(token):
+        """
+        Returns the default edit distance tolerated for a query token: none for tokens of up
+        to two characters, one for up to five, and two for longer ones.
+
+        Args:
+        - token (str): The query token.
+
+        Returns:
+        - int: The tolerated edit distance.
+        """
+        if len(token) <= 2:
+            return 0
+        return 1 if len(token) <= 5 else 2
+
+    @staticmethod
+    def edit_distance(a, b, bound):
+        """
+        Computes the Levenshtein distance between two strings, giving up once it exceeds a bound.
+
+        Args:
+        - a (str): The first string.
+        - b (str): The second string.
+        - bound (int): The largest distance of interest.
+
+        Returns:
+        - int: The distance, or bound + 1 if it exceeds the bound.
+        """
+        if abs(len(a) - len(b)) > bound:
+            return bound + 1
+        previous = list(range(len(b) + 1))
+        for i, char_a in enumerate(a, start=1):
+            current = [i]
+            for j, char_b in enumerate(b, start=1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+            if min(current) > bound:
+                return bound + 1
+            previous = current
+        return min(previous[-1], bound + 1)
+
+    def add(self, key, values):
+        """
+        Indexes a record.
+
+        Args:
+        - key (str): The key of the record.
+        - values (dict): The text of each indexed field.
+        """
+        for field in self.fields:
+            postings = self._postings[field]
+            for token in self.tokens(values[field]):
+                keys = postings.setdefault(token, set())
+                if not keys:
+                    self._add_token(token)
+                keys.add(key)
+
+    def remove(self, key, values):
+        """
+        Removes a record from the index.
+
+        Args:
+        - key (str): The key of the record.
+        - values (dict): The text of each indexed field, as it was indexed.
+        """
+        for field in self.fields:
+            postings = self._postings[field]
+            for token in self.tokens(values[field]):
+                keys = postings.get(token)
+                if keys is not None and key in keys:
+                    keys.discard(key)
+                    if not keys:
+                        del postings[token]
+                        self._remove_token(token)
+
+    def _add_token(self, token):
+        """
+        Counts a field using a token, adding the token to the vocabulary on first use.
+        """
+        count = self._token_counts.get(token, 0)
+        self._token_counts[token] = count + 1
+        if not count:
+            for gram in self.grams(token):
+                self._vocabulary.setdefault(gram, set()).add(token)
+
+    def _remove_token(self, token):
+        """
+        Uncounts a field using a token, dropping the token from the vocabulary when unused.
+        """
+        count = self._token_counts.pop(token) - 1
+        if count:
+            self._token_counts[token] = count
+            return
+        for gram in self.grams(token):
+            tokens = self._vocabulary[gram]
+            tokens.discard(token)
+            if not tokens:
+                del self._vocabulary[gram]
+
+    def _similar_tokens(self, token, bound):
+        """
+        Finds the vocabulary tokens within an edit distance of a token.
+
+        An edit touches at most GRAM_SIZE trigrams, so a token within distance k shares all
+        but at most k * GRAM_SIZE of the query's trigrams. This prunes the candidates before
+        any distance is computed.
+
+        Args:
+        - token (str): The query token.
+        - bound (int): The largest edit distance accepted.
+
+        Returns:
+        - dict: The distance of each matching vocabulary token.
+        """
+        if not bound:
+            return {token: 0} if token in self._token_counts else {}
+        query_grams = self.grams(token)
+        shared = {}
+        for gram in query_grams:
+            for candidate in self._vocabulary.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        matches = {}
+        for candidate, count in shared.items():
+            if count < len(query_grams) - bound * self.GRAM_SIZE:
+                continue
+            distance = self.edit_distance(token, candidate, bound)
+            if distance <= bound:
+                matches[candidate] = distance
+        return matches
+
+    def search(self, text, fields=None, limit=10):
+        """
+        Finds the records best matching a text despite typos. Every query token must match
+        a token of one of the searched fields within its tolerated edit distance.
+
+        Args:
+        - text (str): The text to search for.
+        - fields (tuple): The fields to search (default is all indexed fields).
+        - limit (int): The maximum number of results (default is 10).
+
+        Returns:
+        - list: (key, distance) pairs of the best matches, closest first.
+        """
+        fields = fields or self.fields
+        scores = None
+        for query_token in self.tokens(text):
+            best = {}
+            for token, distance in self._similar_tokens(query_token, self.max_distance(query_token)).items():
+                for field in fields:
+                    for key in self._postings[field].get(token, ()):
+                        if distance < best.get(key, distance + 1):
+                            best[key] = distance
+            if scores is None:
+                scores = best
+            else:
+                scores = {key: scores[key] + distance for key, distance in best.items() if key in scores}
+            if not scores:
+                return []
+        return heapq.nsmallest(limit, (scores or {}).items(), key=lambda item: (item[1], item[0]))
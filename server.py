@@ -0,0 +1,706 @@
+import asyncio
+import base64
+import binascii
+import io
+import json
+import re
+import signal
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+from book import ValidationError as BookValidationError
+from models import Book
+from stats import collect_stats
+from user import ValidationError as UserValidationError
+
+MAX_LINE = 8192
+MAX_HEADERS = 100
+MAX_BODY = 1024 * 1024
+MAX_BATCH = 1000
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class HTTPError(Exception):
+    """
+    Exception raised to answer a request with an error status.
+
+    Attributes:
+    - status (int): The HTTP status code.
+    - message (str): Explanation of the error.
+    """
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    A stand-in for sys.stdout that sends what a thread prints to that thread's capture
+    buffer, if it has one, and everything else to the real stream. The managers print
+    their messages, and the server returns them in its responses.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextmanager
+    def capture(self):
+        """
+        Captures what the calling thread prints.
+
+        Returns:
+        - io.StringIO: The captured output.
+        """
+        buffer = self._local.buffer = io.StringIO()
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+
+def book_json(book):
+    """
+    Converts a managed book, or a view of one, to its JSON data.
+
+    Args:
+    - book (Book): The book.
+
+    Returns:
+    - dict: The title, author, ISBN, and availability of the book.
+    """
+    return {"title": book.title, "author": book.author, "isbn": book.isbn, "available": book.available}
+
+
+def user_json(user):
+    """
+    Converts a managed user to its JSON data.
+
+    Args:
+    - user (User): The user.
+
+    Returns:
+    - dict: The name, ID, and ISBNs of the borrowed books of the user.
+    """
+    return {"name": user.name, "user_id": user.user_id, "borrowed_books": [book.isbn for book in list(user.borrowed_books)]}
+
+
+def checkout_json(checkout):
+    """
+    Converts a checkout to its JSON data.
+
+    Args:
+    - checkout (Checkout): The checkout.
+
+    Returns:
+    - dict: The user ID, ISBN, and timestamp of the checkout.
+    """
+    return {"user_id": checkout.user_id, "isbn": checkout.isbn, "timestamp": checkout.timestamp}
+
+
+def stats_json(stats):
+    """
+    Converts the aggregate counts of the library to their JSON data.
+
+    Args:
+    - stats (LibraryStats): The counts.
+
+    Returns:
+    - dict: The counts, with the top authors and borrowers as lists of objects, and the
+      hit and miss counts of the search caches.
+    """
+    return {"books": stats.books, "available": stats.available, "checked_out": stats.checked_out,
+            "authors": stats.authors, "users": stats.users, "borrowers": stats.borrowers,
+            "top_authors": [{"author": author, "books": count} for author, count in stats.top_authors],
+            "top_borrowers": [{"user_id": user_id, "name": name, "books": count}
+                              for user_id, name, count in stats.top_borrowers],
+            "search_cache": {kind: {"size": cache.size, "capacity": cache.capacity, "hits": cache.hits,
+                                    "misses": cache.misses, "hit_rate": round(cache.hit_rate, 4),
+                                    "evictions": cache.evictions, "invalidations": cache.invalidations}
+                             for kind, cache in stats.search_caches.items()}}
+
+
+class LibraryServer:
+    """
+    An HTTP/JSON service in front of the book, user, and check managers, built on asyncio.
+
+    The event loop only parses requests and writes responses. Each request runs in a
+    pool of worker threads, which the managers' locks make safe, so a slow save never
+    holds up other connections. Connections are kept alive between requests (HTTP/1.1
+    by default, HTTP/1.0 with "Connection: keep-alive"), and pipelined requests are
+    answered in order. POST /batch runs many requests in one worker and one commit.
+
+    A change is answered once it has been written: the worker flushes the storage before
+    the response is sent, so with a BufferedStorage the changes of all requests in flight
+    are written and synced as one group. With wait_for_writes off, changes are answered
+    as soon as they are made, and a crash may lose the latest ones.
+
+    Routes (request and response bodies are JSON objects):
+    - GET /books?title=&author=&isbn=&fuzzy=&limit=, GET /books?sort=&cursor=&limit=, GET /books/{isbn}
+    - POST /books {title, author, isbn}, PUT /books/{isbn} {title, author, isbn}, DELETE /books/{isbn}
+    - GET /users?name=&user_id=&fuzzy=&limit=, GET /users?sort=&cursor=&limit=, GET /users/{user_id}
+    - GET /users/{user_id}/checkouts?sort=&cursor=&limit=
+    - POST /users {name, user_id}, PUT /users/{user_id} {name}, DELETE /users/{user_id}
+    - GET /checkouts?user_id=&sort=&cursor=&limit=, POST /checkouts {user_id, isbn}, POST /checkins {user_id, isbn}
+    - GET /stats?top=&author=&user_id=
+    - POST /batch {requests: [{method, path, body}]}
+
+    Listings without search criteria are paged: each page carries a "next" cursor, passed
+    as the "cursor" parameter to get the following page, or null after the last page.
+
+    Attributes:
+    - book_manager (BookManager): The books.
+    - user_manager (UserManager): The users.
+    - check_manager (CheckManager): The checkouts.
+    - storage (BaseStorage): The storage the managers save to, flushed to commit changes.
+    - host (str): The address to listen on.
+    - port (int): The port to listen on; 0 picks a free port, and the chosen one is set on start.
+    - workers (int): The number of worker threads running requests.
+    - wait_for_writes (bool): Whether changes are answered only once they have been written.
+    - request_timeout (float): The seconds a connection may take to send a request, idle time included.
+    """
+
+    def __init__(self, book_manager, user_manager, check_manager, storage, host="127.0.0.1", port=8080,
+                 workers=8, wait_for_writes=True, request_timeout=15.0):
+        """
+        Initializes a LibraryServer instance.
+
+        Args:
+        - book_manager (BookManager): The books.
+        - user_manager (UserManager): The users.
+        - check_manager (CheckManager): The checkouts.
+        - storage (BaseStorage): The storage the managers save to.
+        - host (str): The address to listen on (default is "127.0.0.1").
+        - port (int): The port to listen on (default is 8080).
+        - workers (int): The number of worker threads (default is 8).
+        - wait_for_writes (bool): Whether changes are answered only once written (default is True).
+        - request_timeout (float): The seconds a connection may take to send a request (default is 15.0).
+        """
+        self.book_manager = book_manager
+        self.user_manager = user_manager
+        self.check_manager = check_manager
+        self.storage = storage
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.wait_for_writes = wait_for_writes
+        self.request_timeout = request_timeout
+        self.started = threading.Event()
+        self._routes = [
+            ("GET", r"/books", self._find_books, False),
+            ("POST", r"/books", self._add_book, True),
+            ("GET", r"/books/(?P<isbn>[^/]+)", self._get_book, False),
+            ("PUT", r"/books/(?P<isbn>[^/]+)", self._update_book, True),
+            ("DELETE", r"/books/(?P<isbn>[^/]+)", self._delete_book, True),
+            ("GET", r"/users", self._find_users, False),
+            ("POST", r"/users", self._add_user, True),
+            ("GET", r"/users/(?P<user_id>[^/]+)", self._get_user, False),
+            ("PUT", r"/users/(?P<user_id>[^/]+)", self._update_user, True),
+            ("DELETE", r"/users/(?P<user_id>[^/]+)", self._delete_user, True),
+            ("GET", r"/users/(?P<user_id>[^/]+)/checkouts", self._list_checkouts, False),
+            ("GET", r"/checkouts", self._list_checkouts, False),
+            ("POST", r"/checkouts", self._checkout_book, True),
+            ("POST", r"/checkins", self._checkin_book, True),
+            ("GET", r"/stats", self._get_stats, False),
+            ("POST", r"/batch", None, True),
+        ]
+        self._routes = [(method, re.compile(pattern), handler, changes)
+                        for method, pattern, handler, changes in self._routes]
+        self._loop = None
+        self._server = None
+        self._executor = None
+        self._output = None
+        self._stopping = None
+        self._connections = set()
+
+    def run(self):
+        """
+        Serves requests until interrupted or shut down.
+        """
+        with suppress(KeyboardInterrupt):
+            asyncio.run(self.serve_forever())
+
+    async def serve_forever(self):
+        """
+        Starts the server and serves requests until shutdown() is called or the process is
+        asked to stop by SIGINT or SIGTERM.
+        """
+        await self.start()
+        try:
+            await self._stopping.wait()
+        finally:
+            await self.stop()
+
+    async def start(self):
+        """
+        Loads the library and starts listening.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="library-worker")
+        self._output = _ThreadOutput(sys.stdout)
+        sys.stdout = self._output
+        await self._loop.run_in_executor(self._executor, self._load)
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError, ValueError):
+                self._loop.add_signal_handler(signal_number, self._stopping.set)
+        print(f"Serving the library on http://{self.host}:{self.port}")
+        self.started.set()
+
+    async def stop(self):
+        """
+        Stops listening, closes the open connections, and waits for the running requests.
+        """
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        await self._loop.run_in_executor(None, self._executor.shutdown)
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError, ValueError):
+                self._loop.remove_signal_handler(signal_number)
+        sys.stdout = self._output.stream
+        self.started.clear()
+
+    def shutdown(self):
+        """
+        Asks a running server to stop. May be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def _load(self):
+        """
+        Loads the books, users, and checkouts of lazily created managers before the first request.
+        """
+        len(self.check_manager.checkouts)
+
+    async def _serve_connection(self, reader, writer):
+        """
+        Answers the requests of one connection in order until it is closed.
+
+        Args:
+        - reader (asyncio.StreamReader): The connection's input.
+        - writer (asyncio.StreamWriter): The connection's output.
+        """
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.request_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as error:
+                    self._write_response(writer, error.status, {"error": error.message}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, keep_alive, body = request
+                status, payload = await self._loop.run_in_executor(self._executor, self._handle, method, target, body)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def _read_request(reader):
+        """
+        Reads one request from a connection.
+
+        Args:
+        - reader (asyncio.StreamReader): The connection's input.
+
+        Returns:
+        - tuple: The method, target, whether to keep the connection alive, and the body
+          bytes; or None if the connection was closed.
+
+        Raises:
+        - HTTPError: If the request is malformed or too large.
+        """
+        try:
+            line = await reader.readline()
+            while line in (b"\r\n", b"\n"):
+                line = await reader.readline()
+            if not line:
+                return None
+            parts = line.decode("latin-1").split()
+            if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+                raise HTTPError(400, "Malformed request line.")
+            method, target, version = parts
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if len(headers) == MAX_HEADERS:
+                    raise HTTPError(431, "Too many headers.")
+                name, separator, value = line.decode("latin-1").partition(":")
+                if not separator:
+                    raise HTTPError(400, "Malformed header line.")
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            raise HTTPError(431, "A request line or header is too long.")
+
+        if "transfer-encoding" in headers:
+            raise HTTPError(501, "Chunked request bodies are not supported; send a Content-Length.")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length.")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length.")
+        if length > MAX_BODY:
+            raise HTTPError(413, f"Request bodies are limited to {MAX_BODY} bytes.")
+        body = await reader.readexactly(length) if length else b""
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return method.upper(), target, keep_alive, body
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        """
+        Writes a JSON response to a connection.
+
+        Args:
+        - writer (asyncio.StreamWriter): The connection's output.
+        - status (int): The HTTP status code.
+        - payload (dict): The response body.
+        - keep_alive (bool): Whether the connection stays open.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    def _handle(self, method, target, body):
+        """
+        Runs a request in a worker thread and commits its changes. A request that fails
+        unexpectedly, e.g. because its changes cannot be written, is answered with status
+        500 and the traceback is printed to the standard error.
+
+        Args:
+        - method (str): The HTTP method.
+        - target (str): The request target: a path with an optional query string.
+        - body (bytes): The request body.
+
+        Returns:
+        - tuple: The status code and the response body.
+        """
+        try:
+            data = json.loads(body) if body else None
+        except (ValueError, UnicodeDecodeError):
+            return 400, {"error": "The request body is not valid JSON."}
+        try:
+            status, payload, changed = self._dispatch(method, target, data)
+            if changed and self.wait_for_writes:
+                self.storage.flush()
+        except Exception as error:
+            # An unexpected failure is answered rather than dropping the connection.
+            traceback.print_exc(file=sys.stderr)
+            return 500, {"error": f"The request failed: {getattr(error, 'message', None) or repr(error)}"}
+        return status, payload
+
+    def _dispatch(self, method, target, data):
+        """
+        Routes a request to its handler, without committing its changes.
+
+        The message the managers print while handling the request is returned as the
+        "message" of a successful response or the "error" of a failed one.
+
+        Args:
+        - method (str): The HTTP method.
+        - target (str): The request target: a path with an optional query string.
+        - data: The parsed JSON body, or None.
+
+        Returns:
+        - tuple: The status code, the response body, and whether anything may have changed.
+        """
+        url = urlsplit(target)
+        route, allowed = None, []
+        for route_method, pattern, handler, changes in self._routes:
+            match = pattern.fullmatch(url.path)
+            if match:
+                allowed.append(route_method)
+                if route_method == method:
+                    route = handler, changes, {name: unquote(value) for name, value in match.groupdict().items()}
+                    break
+        if route is None:
+            if allowed:
+                return 405, {"error": f"Use {' or '.join(allowed)} for {url.path}."}, False
+            return 404, {"error": f"No route for {url.path}."}, False
+        handler, changes, params = route
+        if handler is None:
+            return self._batch(data)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        self.check_manager.refresh()
+        with self._output.capture() as output:
+            try:
+                status, payload = handler(params, query, data)
+            except HTTPError as error:
+                status, payload = error.status, {"error": error.message}
+            except (BookValidationError, UserValidationError) as error:
+                status, payload = 400, {"error": error.message}
+        lines = output.getvalue().strip().splitlines()
+        if lines and "message" not in payload and "error" not in payload:
+            payload["message" if status < 400 else "error"] = lines[-1]
+        return status, payload, changes and status < 400
+
+    def _batch(self, data):
+        """
+        Runs the requests of a batch in order. Their changes are committed together.
+
+        Args:
+        - data (dict): {"requests": [{"method": ..., "path": ..., "body": ...}, ...]}.
+
+        Returns:
+        - tuple: The status code, the responses of the requests, and whether anything may have changed.
+        """
+        requests = data.get("requests") if isinstance(data, dict) else None
+        if not isinstance(requests, list):
+            return 400, {"error": "A batch needs a list of requests."}, False
+        if len(requests) > MAX_BATCH:
+            return 413, {"error": f"Batches are limited to {MAX_BATCH} requests."}, False
+        responses, changed = [], False
+        for request in requests:
+            if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+                responses.append({"status": 400, "body": {"error": "A request needs a method and a path."}})
+                continue
+            method = str(request.get("method", "GET")).upper()
+            if urlsplit(request["path"]).path == "/batch":
+                responses.append({"status": 400, "body": {"error": "Batches cannot be nested."}})
+                continue
+            status, payload, request_changed = self._dispatch(method, request["path"], request.get("body"))
+            responses.append({"status": status, "body": payload})
+            changed = changed or request_changed
+        return 200, {"responses": responses}, changed
+
+    @staticmethod
+    def _fields(data, *names):
+        """
+        Returns the string fields of a request body.
+
+        Args:
+        - data (dict): The request body.
+        - names (str): The required fields.
+
+        Returns:
+        - list: The values of the fields, stripped.
+
+        Raises:
+        - HTTPError: If the body is not an object or a field is missing or empty.
+        """
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The request body must be a JSON object.")
+        values = [str(data.get(name) or "").strip() for name in names]
+        missing = [name for name, value in zip(names, values) if not value]
+        if missing:
+            raise HTTPError(400, f"Missing {', '.join(missing)}.")
+        return values
+
+    @staticmethod
+    def _limit(query):
+        """
+        Returns the number of results a search may return.
+
+        Args:
+        - query (dict): The query parameters.
+
+        Returns:
+        - int: The "limit" parameter, DEFAULT_LIMIT if absent.
+
+        Raises:
+        - HTTPError: If the limit is not a number between 1 and MAX_LIMIT.
+        """
+        try:
+            limit = int(query.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            raise HTTPError(400, "The limit must be a number.")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise HTTPError(400, f"The limit must be between 1 and {MAX_LIMIT}.")
+        return limit
+
+    @staticmethod
+    def _page(page, query, sort_keys, cursor_types):
+        """
+        Takes one page of a listing.
+
+        Args:
+        - page (callable): Takes a sort key, a cursor, and a limit, and returns the page and the next cursor.
+        - query (dict): The query parameters: "sort", "cursor", and "limit".
+        - sort_keys (tuple): The sort keys of the listing; the first is the default.
+        - cursor_types (dict): The types of the values of a cursor in each sort order.
+
+        Returns:
+        - tuple: The items of the page, and the token of the next cursor, or None after the last page.
+
+        Raises:
+        - HTTPError: If the sort key, cursor, or limit is not valid.
+        """
+        sort = query.get("sort", sort_keys[0])
+        if sort not in sort_keys:
+            raise HTTPError(400, f"Unknown sort key '{sort}'. Use {', '.join(sort_keys)}.")
+        cursor = None
+        if query.get("cursor"):
+            try:
+                cursor = tuple(json.loads(base64.urlsafe_b64decode(query["cursor"].encode("ascii"))))
+            except (ValueError, TypeError, binascii.Error):
+                raise HTTPError(400, "The cursor is not valid.")
+            types = cursor_types[sort]
+            if len(cursor) != len(types) or any(type(value) is not kind for value, kind in zip(cursor, types)):
+                raise HTTPError(400, "The cursor does not belong to this listing.")
+        items, cursor = page(sort, cursor, LibraryServer._limit(query))
+        token = None if cursor is None else base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+        return items, token
+
+    def _book(self, isbn):
+        book = self.book_manager.get_book_by_isbn(isbn)
+        if book is None:
+            raise HTTPError(404, f"Book with ISBN '{isbn}' not found.")
+        return book
+
+    def _user(self, user_id):
+        user = self.user_manager.get_user_by_id(user_id)
+        if user is None:
+            raise HTTPError(404, f"User with ID '{user_id}' not found.")
+        return user
+
+    def _find_books(self, params, query, data):
+        title, author, isbn = (query.get(name) for name in ("title", "author", "isbn"))
+        if not (title or author or isbn):
+            books, cursor = self._page(self.book_manager.page_books, query, self.book_manager.SORT_KEYS,
+                                       self.book_manager.CURSOR_TYPES)
+            return 200, {"books": [book_json(book) for book in books], "next": cursor}
+        limit = self._limit(query)
+        books = self.book_manager.find_books(title, author, isbn)
+        if not books and query.get("fuzzy") in ("1", "true") and not isbn and (title or author):
+            fields = tuple(field for field, text in (("title", title), ("author", author)) if text)
+            books = self.book_manager.fuzzy_find_books(" ".join(filter(None, (title, author))), fields, limit)
+        return 200, {"books": [book_json(book) for book in books[:limit]], "total": len(books)}
+
+    def _get_book(self, params, query, data):
+        return 200, {"book": book_json(self._book(params["isbn"]))}
+
+    def _add_book(self, params, query, data):
+        title, author, isbn = self._fields(data, "title", "author", "isbn")
+        if self.book_manager.get_book_by_isbn(isbn) is not None:
+            raise HTTPError(409, "A book with the same ISBN already exists.")
+        self.book_manager.add_book(title, author, isbn)
+        return 201, {"book": book_json(self._book(isbn))}
+
+    def _update_book(self, params, query, data):
+        book = self._book(params["isbn"])
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The request body must be a JSON object.")
+        title, author, isbn = (str(data.get(name) or "").strip() or getattr(book, name)
+                               for name in ("title", "author", "isbn"))
+        try:
+            updated = self.book_manager.update_book(book, Book(title, author, isbn))
+        except BookValidationError as error:
+            raise HTTPError(409, error.message)
+        if not updated:
+            return 409, {}
+        return 200, {"book": book_json(self._book(isbn))}
+
+    def _delete_book(self, params, query, data):
+        self._book(params["isbn"])
+        return (200, {}) if self.book_manager.delete_book(params["isbn"]) else (409, {})
+
+    def _find_users(self, params, query, data):
+        name, user_id = query.get("name"), query.get("user_id")
+        if not (name or user_id):
+            users, cursor = self._page(self.user_manager.page_users, query, self.user_manager.SORT_KEYS,
+                                       self.user_manager.CURSOR_TYPES)
+            return 200, {"users": [user_json(user) for user in users], "next": cursor}
+        limit = self._limit(query)
+        users = self.user_manager.find_users(name, user_id)
+        if not users and query.get("fuzzy") in ("1", "true") and name and not user_id:
+            users = self.user_manager.fuzzy_find_users(name, limit)
+        return 200, {"users": [user_json(user) for user in users[:limit]], "total": len(users)}
+
+    def _get_user(self, params, query, data):
+        return 200, {"user": user_json(self._user(params["user_id"]))}
+
+    def _add_user(self, params, query, data):
+        name, user_id = self._fields(data, "name", "user_id")
+        if self.user_manager.get_user_by_id(user_id) is not None:
+            raise HTTPError(409, "A user with the same User ID already exists.")
+        self.user_manager.add_user(name, user_id)
+        return 201, {"user": user_json(self._user(user_id))}
+
+    def _update_user(self, params, query, data):
+        self._user(params["user_id"])
+        (name,) = self._fields(data, "name")
+        if not self.user_manager.update_user(params["user_id"], name):
+            return 409, {}
+        return 200, {"user": user_json(self._user(params["user_id"]))}
+
+    def _delete_user(self, params, query, data):
+        self._user(params["user_id"])
+        return (200, {}) if self.user_manager.delete_user(params["user_id"]) else (409, {})
+
+    def _list_checkouts(self, params, query, data):
+        user_id = params.get("user_id") or query.get("user_id")
+        if user_id:
+            self._user(user_id)
+        checkouts, cursor = self._page(
+            lambda sort, cursor, limit: self.check_manager.page_checkouts(user_id or None, sort, cursor, limit),
+            query, self.check_manager.SORT_KEYS, self.check_manager.CURSOR_TYPES)
+        return 200, {"checkouts": [checkout_json(checkout) for checkout in checkouts], "next": cursor}
+
+    def _checkout_book(self, params, query, data):
+        user_id, isbn = self._fields(data, "user_id", "isbn")
+        self._user(user_id)
+        self._book(isbn)
+        if not self.check_manager.checkout_book(user_id, isbn):
+            return 409, {}
+        checkout = self.check_manager.get_checkout_by_isbn(isbn)
+        return 201, {"checkout": checkout_json(checkout)} if checkout else {}
+
+    def _checkin_book(self, params, query, data):
+        user_id, isbn = self._fields(data, "user_id", "isbn")
+        self._user(user_id)
+        self._book(isbn)
+        return (200, {}) if self.check_manager.checkin_book(user_id, isbn) else (409, {})
+
+    def _get_stats(self, params, query, data):
+        try:
+            top = int(query.get("top", 10))
+        except ValueError:
+            raise HTTPError(400, "The top must be a number.")
+        if not 0 <= top <= MAX_LIMIT:
+            raise HTTPError(400, f"The top must be between 0 and {MAX_LIMIT}.")
+        result = stats_json(collect_stats(self.book_manager, self.user_manager, self.check_manager, top))
+        if query.get("author"):
+            result["author_books"] = self.book_manager.count_books(query["author"])
+        if query.get("user_id"):
+            self._user(query["user_id"])
+            result["user_loans"] = self.check_manager.count_loans(query["user_id"])
+        return 200, result
@@ -0,0 +1,151 @@
+import json
+import os
+import zlib
+from storage import Storage, StorageError
+
+
+class ShardedStorage(Storage):
+    """
+    A storage backend partitioning each collection into many small data files.
+
+    Books and checkouts are assigned to a shard by the CRC-32 of their ISBN, users by the
+    CRC-32 of their user ID, and each shard is a line-delimited JSON file or a binary
+    snapshot in the collection's directory. A save that names its changes only rewrites
+    the shards holding them, by reading those shards, applying the changes, and writing
+    them back, so the data written is proportional to the change rather than to the
+    collection. A save without changes rewrites every shard.
+
+    The number of shards is recorded in "<directory>/layout.json" when the directory is
+    created; an existing directory keeps its recorded number of shards.
+
+    Attributes:
+    - directory (str): The directory holding the books, users, and checkouts shard directories.
+    - shards (int): The number of shards per collection.
+    """
+
+    LAYOUT_FILE = "layout.json"
+
+    def __init__(self, directory="library_data", shards=64, binary=False, compress=False, fsync="batched",
+                 shared=False):
+        """
+        Initializes a ShardedStorage instance, creating its directories if needed.
+
+        Args:
+        - directory (str): The directory holding the shards (default is "library_data").
+        - shards (int): The number of shards per collection for a new directory (default is 64).
+        - binary (bool): Whether shards are written as binary snapshots (default is False).
+        - compress (bool): Whether binary snapshots are compressed (default is False).
+        - fsync (str): When writes are synced to disk: "always", "batched", or "never" (default is "batched").
+        - shared (bool): Whether several processes may use the shards at once (default is False).
+        """
+        super().__init__(*(os.path.join(directory, kind) for kind in ("books", "users", "checkouts")),
+                         line_delimited=True, binary=binary, compress=compress, fsync=fsync, shared=shared)
+        self.directory = directory
+        for path in (self.books_file_path, self.users_file_path, self.checkouts_file_path):
+            os.makedirs(path, exist_ok=True)
+        layout_path = os.path.join(directory, self.LAYOUT_FILE)
+        try:
+            with open(layout_path, "r") as file:
+                shards = json.load(file)["shards"]
+        except FileNotFoundError:
+            with open(layout_path, "w") as file:
+                json.dump({"shards": shards}, file)
+        self.shards = shards
+
+    def shard_of(self, key):
+        """
+        Returns the shard holding a key.
+
+        Args:
+        - key (str): An ISBN or user ID.
+
+        Returns:
+        - int: The shard number.
+        """
+        return zlib.crc32(key.encode("utf-8")) % self.shards
+
+    def _shard_path(self, directory, shard):
+        """
+        Returns the data file of a shard.
+
+        Args:
+        - directory (str): The directory of the collection.
+        - shard (int): The shard number.
+
+        Returns:
+        - str: The shard file path.
+        """
+        return os.path.join(directory, f"{shard:04d}")
+
+    def _load_collection(self, kind, directory, key, convert, convert_columns):
+        """
+        Loads the objects of a collection from all of its shards.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - directory (str): The directory of the collection.
+        - key (callable): Returns the key of a JSON record.
+        - convert (callable): Converts a JSON record to an object.
+        - convert_columns (callable): Converts the columns of a snapshot to a list of objects.
+
+        Returns:
+        - list: The objects of the collection.
+        """
+        objects = []
+        with self._lock:
+            for shard in range(self.shards):
+                objects.extend(super()._load_collection(kind, self._shard_path(directory, shard), key,
+                                                        convert, convert_columns))
+        return objects
+
+    def _save_collection(self, kind, directory, items, convert, key, upserts, deletes, version=None):
+        """
+        Saves a collection by rewriting the shards holding its changes, or every shard if
+        no changes are named.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - directory (str): The directory of the collection.
+        - items (list): All objects of the collection.
+        - convert (callable): Converts an object to its JSON data.
+        - key (callable): Returns the key of an object's JSON data.
+        - upserts (list): The objects added or changed since the last save, or None.
+        - deletes (list): The keys of the objects deleted since the last save, or None.
+        - version (int): Unused, as shards have no journal (default is None).
+
+        Returns:
+        - bool: Whether shards were rewritten, which is always the case.
+        """
+        if upserts is None and deletes is None:
+            shards = {shard: {} for shard in range(self.shards)}
+            for item in items:
+                data = convert(item)
+                shards[self.shard_of(key(data))][key(data)] = data
+        else:
+            shards = {}
+            try:
+                for item_key in deletes or ():
+                    shard = self.shard_of(item_key)
+                    if shard not in shards:
+                        shards[shard] = self._read_records(kind, self._shard_path(directory, shard), key)
+                    shards[shard].pop(item_key, None)
+                for item in upserts or ():
+                    data = convert(item)
+                    shard = self.shard_of(key(data))
+                    if shard not in shards:
+                        shards[shard] = self._read_records(kind, self._shard_path(directory, shard), key)
+                    shards[shard][key(data)] = data
+            except StorageError as error:
+                print(f"Error: Unable to save {kind}: {error.message}")
+                return False
+
+        for shard, records in shards.items():
+            path = self._shard_path(directory, shard)
+            try:
+                if records:
+                    self._write_collection(kind, path, records.values())
+                elif os.path.exists(path):
+                    os.remove(path)
+            except IOError:
+                print(f"Error: Unable to write to {path}")
+        return True
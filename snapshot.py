@@ -0,0 +1,233 @@
+import array
+import itertools
+import struct
+import sys
+import zlib
+
+MAGIC = b"LIBSNAP\0"
+VERSION = 1
+FLAG_COMPRESSED = 1
+KINDS = ("books", "users", "checkouts")
+KEY_COLUMNS = {"books": "isbn", "users": "user_id", "checkouts": "isbn"}
+HEADER = struct.Struct("<8sHHBII")
+LENGTH = struct.Struct("<I")
+NO_STRING = 0xFFFFFFFF
+UINT32 = "I" if array.array("I").itemsize == 4 else "L"
+
+
+class SnapshotError(Exception):
+    """
+    Exception raised for unreadable snapshot files.
+
+    Attributes:
+    - message (str): Explanation of the error.
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+def is_snapshot(file_path):
+    """
+    Checks whether a file is a binary snapshot.
+
+    Args:
+    - file_path (str): The file to check.
+
+    Returns:
+    - bool: True if the file starts with the snapshot magic bytes.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def write_snapshot(file_path, kind, records, compress=False):
+    """
+    Writes the JSON records of a collection as a binary snapshot.
+
+    A snapshot is a header followed by a payload. The header holds the magic bytes, the
+    format version, the flags, the collection kind, the record count, and the CRC-32 of
+    the payload. The payload holds a table of the distinct strings and then the records
+    column by column, as little-endian arrays of 32-bit string table indexes; the
+    availability of books is one byte per book. The payload is optionally zlib-compressed.
+
+    Args:
+    - file_path (str): The file to write.
+    - kind (str): The collection: "books", "users", or "checkouts".
+    - records (iterable): The JSON records of the collection, as written to the JSON data files.
+    - compress (bool): Whether to compress the payload (default is False).
+    """
+    strings = {}
+
+    def string_index(text):
+        if text is None:
+            return NO_STRING
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    records = list(records)
+    if kind == "books":
+        sections = [_column(string_index(record[name]) for record in records)
+                    for name in ("title", "author", "isbn")]
+        sections.append(bytes(bool(record["available"]) for record in records))
+    elif kind == "users":
+        sections = [_column(string_index(record[name]) for record in records) for name in ("name", "user_id")]
+        sections.append(_column(len(record["borrowed_books"]) for record in records))
+        sections.append(_column(string_index(isbn) for record in records for isbn in record["borrowed_books"]))
+    elif kind == "checkouts":
+        sections = [_column(string_index(record.get(name)) for record in records)
+                    for name in ("user_id", "isbn", "timestamp")]
+    else:
+        raise ValueError(f"Unknown snapshot kind '{kind}'.")
+
+    text = "".join(strings)
+    payload = b"".join(LENGTH.pack(len(section)) + section for section in
+                       [_column(len(string) for string in strings), text.encode("utf-8")] + sections)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_COMPRESSED
+    with open(file_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, KINDS.index(kind), len(records), zlib.crc32(payload)))
+        file.write(payload)
+
+
+def read_snapshot(file_path):
+    """
+    Reads the columns of a collection from a binary snapshot.
+
+    The columns are named after the fields of the JSON records and hold one value per
+    record: "available" holds bools and "borrowed_books" lists of ISBNs. Building objects
+    straight from the columns avoids creating a dictionary per record.
+
+    Args:
+    - file_path (str): The file to read.
+
+    Returns:
+    - tuple: The collection kind and a dictionary of its columns.
+
+    Raises:
+    - SnapshotError: If the file is not a snapshot of a supported version or is corrupt.
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise SnapshotError("The snapshot header is truncated.")
+    magic, version, flags, kind_index, count, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("The file is not a snapshot.")
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}.")
+    if kind_index >= len(KINDS):
+        raise SnapshotError(f"Unknown snapshot kind {kind_index}.")
+    payload = data[HEADER.size:]
+    if zlib.crc32(payload) != checksum:
+        raise SnapshotError("The snapshot checksum does not match.")
+    try:
+        if flags & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        sections = _Sections(payload)
+        lengths = sections.column()
+        text = sections.next().decode("utf-8")
+    except (zlib.error, UnicodeDecodeError):
+        raise SnapshotError("The snapshot payload is corrupt.")
+    offsets = list(itertools.accumulate(lengths, initial=0))
+    strings = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def resolve(column):
+        return [strings[index] if index != NO_STRING else None for index in column]
+
+    kind = KINDS[kind_index]
+    try:
+        if kind == "books":
+            columns = {name: resolve(sections.column()) for name in ("title", "author", "isbn")}
+            columns["available"] = list(map(bool, sections.next()))
+        elif kind == "users":
+            columns = {name: resolve(sections.column()) for name in ("name", "user_id")}
+            counts = sections.column()
+            borrowed = iter(resolve(sections.column()))
+            columns["borrowed_books"] = [list(itertools.islice(borrowed, n)) for n in counts]
+        else:
+            columns = {name: resolve(sections.column()) for name in ("user_id", "isbn", "timestamp")}
+    except IndexError:
+        raise SnapshotError("The snapshot refers to a missing string.")
+    if any(len(column) != count for column in columns.values()):
+        raise SnapshotError(f"The snapshot does not hold {count} records.")
+    return kind, columns
+
+
+def columns_to_records(columns):
+    """
+    Converts the columns read from a snapshot back to JSON records.
+
+    Args:
+    - columns (dict): The columns, as returned by read_snapshot.
+
+    Returns:
+    - list: The JSON records, one dictionary per record.
+    """
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def _column(values):
+    """
+    Packs integers as a little-endian array of 32-bit unsigned integers.
+
+    Args:
+    - values (iterable): The integers.
+
+    Returns:
+    - bytes: The packed array.
+    """
+    column = array.array(UINT32, values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+class _Sections:
+    """
+    Reads the length-prefixed sections of a snapshot payload in order.
+    """
+
+    def __init__(self, payload):
+        self._payload = memoryview(payload)
+        self._offset = 0
+
+    def next(self):
+        """
+        Returns the bytes of the next section.
+
+        Raises:
+        - SnapshotError: If the payload is truncated.
+        """
+        if self._offset + LENGTH.size > len(self._payload):
+            raise SnapshotError("The snapshot payload is truncated.")
+        (length,) = LENGTH.unpack_from(self._payload, self._offset)
+        start = self._offset + LENGTH.size
+        self._offset = start + length
+        if self._offset > len(self._payload):
+            raise SnapshotError("The snapshot payload is truncated.")
+        return self._payload[start:self._offset].tobytes()
+
+    def column(self):
+        """
+        Returns the next section unpacked as an array of 32-bit unsigned integers.
+
+        Raises:
+        - SnapshotError: If the payload is truncated or the section is not an array.
+        """
+        section = self.next()
+        if len(section) % 4:
+            raise SnapshotError("The snapshot payload is corrupt.")
+        column = array.array(UINT32)
+        column.frombytes(section)
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column
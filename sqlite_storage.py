@@ -0,0 +1,276 @@
+import functools
+import sqlite3
+import threading
+from models import Book, Checkout, User
+from storage import FSYNC_POLICIES, BaseStorage
+
+
+def synchronized(method):
+    """
+    Makes a method of SQLiteStorage hold the connection lock while it runs.
+
+    Args:
+    - method (callable): The method to wrap.
+
+    Returns:
+    - callable: The wrapped method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    A storage backend keeping books, users, and checkouts in a SQLite database.
+
+    Books are keyed by ISBN and users by user ID, and checkouts are indexed on both, so
+    single-record lookups and saves that name their changes touch only the affected rows.
+    The database runs in WAL mode so readers are not blocked by a writer. The fsync
+    policy maps to SQLite's synchronous setting: "always" is FULL, which syncs every
+    commit, "batched" is NORMAL, which syncs the WAL at checkpoints, and "never" is OFF.
+
+    Attributes:
+    - db_path (str): The file path of the SQLite database.
+    - connection (sqlite3.Connection): The open database connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            isbn TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            available INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS checkouts (
+            isbn TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            timestamp TEXT
+        );
+        CREATE INDEX IF NOT EXISTS checkouts_user_id ON checkouts (user_id);
+    """
+
+    SYNCHRONOUS = {"always": "FULL", "batched": "NORMAL", "never": "OFF"}
+
+    def __init__(self, db_path="library.db", fsync="batched"):
+        """
+        Initializes a SQLiteStorage instance and creates the schema if needed.
+
+        Args:
+        - db_path (str): The file path of the SQLite database.
+        - fsync (str): When commits are synced to disk: "always", "batched", or "never" (default is "batched").
+
+        The connection may be used from any thread: every load and save holds a lock on
+        it, so the backend can be shared by threads and a BufferedStorage writer.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'.")
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={self.SYNCHRONOUS[fsync]}")
+        self.connection.executescript(self.SCHEMA)
+
+    @synchronized
+    def load_books(self):
+        """
+        Loads all books from the database.
+
+        Returns:
+        - list: A list of Book objects.
+        """
+        rows = self.connection.execute("SELECT title, author, isbn, available FROM books ORDER BY rowid")
+        return [self._convert_book_row(row) for row in rows]
+
+    @synchronized
+    def save_books(self, books, upserts=None, deletes=None):
+        """
+        Saves books to the database.
+
+        Args:
+        - books (list): A list of Book objects to be saved.
+        - upserts (list): The Book objects added or changed since the last save (default is None).
+        - deletes (list): The ISBNs of the books deleted since the last save (default is None).
+        """
+        with self.connection:
+            if upserts is None and deletes is None:
+                self.connection.execute("DELETE FROM books")
+                upserts = books
+            self.connection.executemany("DELETE FROM books WHERE isbn = ?",
+                                        [(isbn,) for isbn in deletes or ()])
+            self.connection.executemany(
+                "INSERT INTO books (isbn, title, author, available) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, "
+                "available = excluded.available",
+                [(book.isbn, book.title, book.author, int(book.available)) for book in upserts or ()])
+
+    @synchronized
+    def load_users(self, books=None):
+        """
+        Loads all users from the database. A user's borrowed books are the books they have checked out.
+
+        Args:
+        - books (dict): An identity map of the loaded books keyed by ISBN, used to resolve
+          the users' borrowed books (default is None).
+
+        Returns:
+        - list: A list of User objects.
+        """
+        books = books or {}
+        borrowed_books = {}
+        rows = self.connection.execute(
+            "SELECT c.user_id, b.title, b.author, b.isbn, b.available FROM checkouts c "
+            "JOIN books b ON b.isbn = c.isbn ORDER BY c.rowid")
+        for row in rows:
+            book = books.get(row["isbn"]) or self._convert_book_row(row)
+            borrowed_books.setdefault(row["user_id"], []).append(book)
+        rows = self.connection.execute("SELECT name, user_id FROM users ORDER BY rowid")
+        return [User(row["name"], row["user_id"], borrowed_books.get(row["user_id"], [])) for row in rows]
+
+    @synchronized
+    def save_users(self, users, upserts=None, deletes=None):
+        """
+        Saves users to the database.
+
+        Args:
+        - users (list): A list of User objects to be saved.
+        - upserts (list): The User objects added or changed since the last save (default is None).
+        - deletes (list): The IDs of the users deleted since the last save (default is None).
+        """
+        with self.connection:
+            if upserts is None and deletes is None:
+                self.connection.execute("DELETE FROM users")
+                upserts = users
+            self.connection.executemany("DELETE FROM users WHERE user_id = ?",
+                                        [(user_id,) for user_id in deletes or ()])
+            self.connection.executemany(
+                "INSERT INTO users (user_id, name) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET name = excluded.name",
+                [(user.user_id, user.name) for user in upserts or ()])
+
+    @synchronized
+    def load_checkouts(self):
+        """
+        Loads all checkouts from the database.
+
+        Returns:
+        - list: A list of Checkout objects.
+        """
+        rows = self.connection.execute("SELECT user_id, isbn, timestamp FROM checkouts ORDER BY rowid")
+        return [Checkout(row["user_id"], row["isbn"], row["timestamp"]) for row in rows]
+
+    @synchronized
+    def save_checkouts(self, checkouts, upserts=None, deletes=None):
+        """
+        Saves checkouts to the database. The checked-out books are stored as unavailable.
+
+        Args:
+        - checkouts (list): A list of Checkout objects to be saved.
+        - upserts (list): The checkouts added since the last save (default is None).
+        - deletes (list): The ISBNs of the books checked in since the last save (default is None).
+        """
+        with self.connection:
+            if upserts is None and deletes is None:
+                self.connection.execute("DELETE FROM checkouts")
+                self.connection.execute("UPDATE books SET available = 1 WHERE available = 0")
+                upserts = checkouts
+            self.connection.executemany("DELETE FROM checkouts WHERE isbn = ?",
+                                        [(isbn,) for isbn in deletes or ()])
+            self.connection.executemany("UPDATE books SET available = 1 WHERE isbn = ?",
+                                        [(isbn,) for isbn in deletes or ()])
+            rows = [(checkout.isbn, checkout.user_id, checkout.timestamp) for checkout in upserts or ()]
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO checkouts (isbn, user_id, timestamp) VALUES (?, ?, ?)", rows)
+            self.connection.executemany("UPDATE books SET available = 0 WHERE isbn = ?",
+                                        [(row[0],) for row in rows])
+
+    @synchronized
+    def get_book(self, isbn):
+        """
+        Retrieves a single book by its primary key.
+
+        Args:
+        - isbn (str): The ISBN of the book.
+
+        Returns:
+        - Book or None: The stored book if found, None otherwise.
+        """
+        row = self.connection.execute(
+            "SELECT title, author, isbn, available FROM books WHERE isbn = ?", (isbn,)).fetchone()
+        return self._convert_book_row(row) if row else None
+
+    @synchronized
+    def get_user(self, user_id):
+        """
+        Retrieves a single user by its primary key.
+
+        Args:
+        - user_id (str): The ID of the user.
+
+        Returns:
+        - User or None: The stored user if found, None otherwise.
+        """
+        row = self.connection.execute("SELECT name, user_id FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return None
+        rows = self.connection.execute(
+            "SELECT b.title, b.author, b.isbn, b.available FROM checkouts c "
+            "JOIN books b ON b.isbn = c.isbn WHERE c.user_id = ? ORDER BY c.rowid", (user_id,))
+        return User(row["name"], row["user_id"], [self._convert_book_row(book_row) for book_row in rows])
+
+    @synchronized
+    def find_books(self, title=None, author=None, isbn=None):
+        """
+        Searches the books in the database. Title and author match case-insensitive substrings,
+        ISBN matches exactly, and all given criteria must match.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+
+        Returns:
+        - list: The matching Book objects.
+        """
+        clauses, params = [], []
+        if isbn:
+            clauses.append("isbn = ?")
+            params.append(isbn)
+        if title:
+            clauses.append("instr(lower(title), ?) > 0")
+            params.append(title.lower())
+        if author:
+            clauses.append("instr(lower(author), ?) > 0")
+            params.append(author.lower())
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self.connection.execute(
+            "SELECT title, author, isbn, available FROM books" + where + " ORDER BY rowid", params)
+        return [self._convert_book_row(row) for row in rows]
+
+    @synchronized
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
+
+    @staticmethod
+    def _convert_book_row(row):
+        """
+        Converts a database row to a Book object.
+
+        Args:
+        - row (sqlite3.Row): A row with title, author, isbn, and available columns.
+
+        Returns:
+        - Book: A Book object created from the row.
+        """
+        return Book(row["title"], row["author"], row["isbn"], bool(row["available"]))
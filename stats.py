@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from cache import CacheStats
+
+
+@dataclass(slots=True)
+class LibraryStats:
+    """
+    A snapshot of the library's aggregate counts.
+
+    Attributes:
+    - books (int): The number of books.
+    - available (int): The number of books available for checkout.
+    - checked_out (int): The number of books lent out.
+    - authors (int): The number of distinct authors.
+    - users (int): The number of users.
+    - borrowers (int): The number of users holding at least one book.
+    - top_authors (list): (author, number of books) pairs of the authors with the most books.
+    - top_borrowers (list): (user ID, name, number of books) triples of the users holding the most books.
+    - search_caches (dict): The CacheStats of the book and user search caches, keyed by "books" and "users".
+    """
+
+    books: int = 0
+    available: int = 0
+    checked_out: int = 0
+    authors: int = 0
+    users: int = 0
+    borrowers: int = 0
+    top_authors: List[Tuple[str, int]] = field(default_factory=list)
+    top_borrowers: List[Tuple[str, str, int]] = field(default_factory=list)
+    search_caches: Dict[str, CacheStats] = field(default_factory=dict)
+
+
+def collect_stats(book_manager, user_manager, check_manager, top=10):
+    """
+    Collects the aggregate counts of the library.
+
+    The counts are kept up to date by the managers as books are added, deleted, checked
+    out, and checked in, so collecting them reads no books or users beyond those listed
+    in the top authors and borrowers. The managers' locks are held throughout, so the
+    counts agree with each other.
+
+    Args:
+    - book_manager (BookManager): The manager of the books.
+    - user_manager (UserManager): The manager of the users.
+    - check_manager (CheckManager): The manager of the checkouts.
+    - top (int): The number of top authors and borrowers listed (default is 10).
+
+    Returns:
+    - LibraryStats: The counts.
+    """
+    check_manager.refresh()
+    with check_manager._locked(), user_manager._locked(), book_manager._locked():
+        books = book_manager.count_books()
+        checked_out = check_manager.count_loans()
+        top_borrowers = []
+        for user_id, count in check_manager.top_borrowers(top):
+            user = user_manager.get_user_by_id(user_id)
+            top_borrowers.append((user_id, user.name if user else "", count))
+        return LibraryStats(books=books, available=books - checked_out, checked_out=checked_out,
+                            authors=book_manager.count_authors(), users=len(user_manager.users),
+                            borrowers=check_manager.count_borrowers(),
+                            top_authors=book_manager.top_authors(top), top_borrowers=top_borrowers,
+                            search_caches={"books": book_manager.search_cache.stats(),
+                                           "users": user_manager.search_cache.stats()})
+
+
+def print_stats(stats):
+    """
+    Prints the aggregate counts of the library as a dashboard.
+
+    Args:
+    - stats (LibraryStats): The counts.
+    """
+    share = stats.checked_out / stats.books * 100 if stats.books else 0
+    print(f"Books: {stats.books} ({stats.available} available, {stats.checked_out} checked out, {share:.1f}% lent)")
+    print(f"Authors: {stats.authors}")
+    print(f"Users: {stats.users} ({stats.borrowers} holding books)")
+    if stats.top_authors:
+        print("Authors with the most books:")
+        for author, count in stats.top_authors:
+            print(f"- {author}: {count}")
+    if stats.top_borrowers:
+        print("Users holding the most books:")
+        for user_id, name, count in stats.top_borrowers:
+            print(f"- {name} (ID: {user_id}): {count}")
+    for kind, cache in stats.search_caches.items():
+        if cache.hits or cache.misses:
+            print(f"Search cache ({kind}): {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.0%} hit rate), "
+                  f"{cache.size} of {cache.capacity} results cached, {cache.evictions} evicted, "
+                  f"{cache.invalidations} invalidated")
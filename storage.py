@@ -1,16 +1,289 @@
+import gc
+import itertools
 import json
-from models import Book, User
+import os
+import shutil
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from models import Book, Checkout, User
+from locks import FileLock
+from snapshot import KEY_COLUMNS, SnapshotError, columns_to_records, is_snapshot, read_snapshot, write_snapshot
 
-class Storage:
+CHECKSUM_PREFIX = "#crc32:"
+FSYNC_POLICIES = ("always", "batched", "never")
+
+
+class StorageError(Exception):
+    """
+    Exception raised when a data file is corrupt and cannot be restored.
+
+    Attributes:
+    - message (str): Explanation of the error.
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses the cyclic garbage collector while many objects are created at once, e.g. while
+    loading a collection. The loaded objects form no reference cycles, so collection passes
+    triggered by the allocations would only spend time scanning them.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class BaseStorage(ABC):
+    """
+        The interface implemented by the storage backends.
+
+        Every save method receives the whole collection, plus the records changed since the
+        previous save when the caller knows them: upserts holds the added or changed objects
+        and deletes the keys (ISBN, user ID, ISBN of the checked-out book) of removed ones.
+        Backends that can apply single-record changes use them; a save with neither replaces
+        the stored collection.
+    """
+
+    @abstractmethod
+    def load_books(self):
+        """
+        Loads all books.
+
+        Returns:
+        - list: A list of Book objects.
+        """
+
+    @abstractmethod
+    def save_books(self, books, upserts=None, deletes=None):
+        """
+        Saves books.
+
+        Args:
+        - books (list): A list of Book objects to be saved.
+        - upserts (list): The Book objects added or changed since the last save (default is None).
+        - deletes (list): The ISBNs of the books deleted since the last save (default is None).
+        """
+
+    @abstractmethod
+    def load_users(self, books=None):
+        """
+        Loads all users.
+
+        Args:
+        - books (dict): An identity map of the loaded books keyed by ISBN. Borrowed books are
+          resolved through it so that they are the same objects as the loaded books (default is None).
+
+        Returns:
+        - list: A list of User objects.
+        """
+
+    @abstractmethod
+    def save_users(self, users, upserts=None, deletes=None):
+        """
+        Saves users.
+
+        Args:
+        - users (list): A list of User objects to be saved.
+        - upserts (list): The User objects added or changed since the last save (default is None).
+        - deletes (list): The IDs of the users deleted since the last save (default is None).
+        """
+
+    @abstractmethod
+    def load_checkouts(self):
+        """
+        Loads all checkouts.
+
+        Returns:
+        - list: A list of Checkout objects.
+        """
+
+    @abstractmethod
+    def save_checkouts(self, checkouts, upserts=None, deletes=None):
+        """
+        Saves checkouts.
+
+        Args:
+        - checkouts (list): A list of Checkout objects to be saved.
+        - upserts (list): The checkouts added since the last save (default is None).
+        - deletes (list): The ISBNs of the books checked in since the last save (default is None).
+        """
+
+    def get_book(self, isbn):
+        """
+        Retrieves a single stored book.
+
+        Args:
+        - isbn (str): The ISBN of the book.
+
+        Returns:
+        - Book or None: The stored book if found, None otherwise.
+        """
+        return next((book for book in self.load_books() if book.isbn == isbn), None)
+
+    def get_user(self, user_id):
+        """
+        Retrieves a single stored user.
+
+        Args:
+        - user_id (str): The ID of the user.
+
+        Returns:
+        - User or None: The stored user if found, None otherwise.
+        """
+        return next((user for user in self.load_users() if user.user_id == user_id), None)
+
+    def find_books(self, title=None, author=None, isbn=None):
+        """
+        Searches the stored books. Title and author match case-insensitive substrings,
+        ISBN matches exactly, and all given criteria must match.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+
+        Returns:
+        - list: The matching Book objects.
+        """
+        return [book for book in self.load_books()
+                if (not title or title.lower() in book.title.lower())
+                and (not author or author.lower() in book.author.lower())
+                and (not isbn or isbn == book.isbn)]
+
+    def copy_to(self, target):
+        """
+        Copies all books, users, and checkouts to another backend, replacing its data.
+
+        Args:
+        - target (BaseStorage): The backend to copy to.
+
+        Returns:
+        - tuple: The numbers of copied books, users, and checkouts.
+        """
+        books = self.load_books()
+        users = self.load_users({book.isbn: book for book in books})
+        checkouts = self.load_checkouts()
+        target.save_books(books)
+        target.save_users(users)
+        target.save_checkouts(checkouts)
+        return len(books), len(users), len(checkouts)
+
+    def version(self, kind):
+        """
+        Returns the version stamp of a collection, which changes with every save to it by
+        any process. Backends that do not track versions return None.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+
+        Returns:
+        - int or None: The version of the collection.
+        """
+        return None
+
+    def changes_since(self, kind, version, books=None):
+        """
+        Returns the records of a collection saved since a version. Backends that cannot
+        list the changes return None, and the caller reloads the collection instead.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - version (int): The version the caller has.
+        - books (dict): An identity map of the loaded books keyed by ISBN, used to resolve
+          the borrowed books of users (default is None).
+
+        Returns:
+        - tuple or None: The current version, the added or changed objects, and the keys of the deleted ones.
+        """
+        return None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the backend's lock, if it has one, so the reads and saves made inside the
+        block are not interleaved with those of other processes. Transactions nest.
+        """
+        yield
+
+    def flush(self):
+        """
+        Makes every save made so far durable: waits for queued writes and syncs buffered
+        ones to disk. Backends that write and sync each save before returning have nothing to do.
+        """
+
+    def close(self):
+        """
+        Releases any resources held by the backend.
+        """
+
+
+class Storage(BaseStorage):
     """
-        A class to manage loading and saving data for books, users, and checkouts.
+        A class to manage loading and saving data for books, users, and checkouts in JSON files.
 
         Attributes:
         - books_file_path (str): The file path for storing books data.
         - users_file_path (str): The file path for storing users data.
         - checkouts_file_path (str): The file path for storing checkouts data.
+        - journaled (bool): Whether changes are appended to a journal instead of rewriting the data files.
+        - compact_threshold (int): The number of journal entries after which a data file is rewritten.
+        - line_delimited (bool): Whether data files are written with one JSON record per line instead of as a JSON array.
+        - binary (bool): Whether data files are written as binary snapshots (see snapshot.py) instead of JSON.
+        - compress (bool): Whether binary snapshots are zlib-compressed.
+        - fsync (str): When writes are synced to disk: "always", "batched", or "never".
+        - fsync_interval (float): The longest time in seconds between journal syncs under the "batched" policy.
+        - shared (bool): Whether several processes may use the data files at once.
+        - lock_file_path (str): The lock file guarding the data files in shared mode.
+
+        Data files are read in any of these layouts; line-delimited files are parsed in batches of
+        PARSE_BATCH_SIZE lines, so only one batch of the parsed file is held in memory at a time.
+        In journaled mode every save that names the changed records appends them to
+        "<data file>.log"; the data file itself is only rewritten once its journal holds
+        compact_threshold entries, or when a save is made without naming changes.
+        Journals are replayed on load in both modes.
+
+        Data files are never written in place: each rewrite goes to a temporary file that
+        is renamed over the data file, and the replaced file is kept as "<data file>.bak".
+        JSON data files end with a CRC-32 trailer line. A data file that fails its checksum
+        or cannot be parsed is moved to "<data file>.corrupt" and replaced by its .bak copy;
+        if there is none, loading raises StorageError rather than returning an empty
+        collection that the next save would write back. An incomplete last journal entry,
+        left by a crash during an append, is discarded.
+
+        The fsync policy trades durability for write throughput. "always" syncs every
+        rewrite and journal append before the save returns. "batched" syncs every rewrite,
+        but syncs the journals at most once per fsync_interval seconds, and on flush() and
+        close(). "never" leaves syncing to the operating system: a crash of the program
+        loses nothing, but a power failure may lose the latest saves.
+
+        In shared mode every load and save holds an inter-process lock, and every save
+        stamps its collection with a new version in "<data file>.version"; journal entries
+        carry the version of their save, so changes_since() can list the records other
+        processes changed. A save that rewrites a data file to apply named changes reads
+        the file back first instead of writing out the caller's collection, so a process
+        holding stale objects cannot overwrite the changes of others. All processes sharing
+        the files must use shared mode.
+
+        Loads and saves hold a lock, so one Storage may be used by several threads; in
+        shared mode that lock is the inter-process one.
     """
-    def __init__(self, books_file_path="books.json", users_file_path="users.json", checkouts_file_path="checkouts.json"):
+
+    PARSE_BATCH_SIZE = 1000
+
+    def __init__(self, books_file_path="books.json", users_file_path="users.json", checkouts_file_path="checkouts.json",
+                 journaled=False, compact_threshold=1000, line_delimited=False, binary=False, compress=False,
+                 fsync="batched", fsync_interval=1.0, shared=False, lock_file_path=None):
         
         """
             Initializes a Storage instance with file paths for books, users, and checkouts.
@@ -19,11 +292,35 @@ class Storage:
             - books_file_path (str): The file path for storing books data.
             - users_file_path (str): The file path for storing users data.
             - checkouts_file_path (str): The file path for storing checkouts data.
+            - journaled (bool): Whether changes are appended to a journal (default is False).
+            - compact_threshold (int): The journal size that triggers a rewrite of the data file (default is 1000).
+            - line_delimited (bool): Whether data files are written one JSON record per line (default is False).
+            - binary (bool): Whether data files are written as binary snapshots (default is False).
+            - compress (bool): Whether binary snapshots are compressed (default is False).
+            - fsync (str): When writes are synced to disk: "always", "batched", or "never" (default is "batched").
+            - fsync_interval (float): The longest time in seconds between batched journal syncs (default is 1.0).
+            - shared (bool): Whether several processes may use the data files at once (default is False).
+            - lock_file_path (str): The lock file used in shared mode (default is "library.lock" next to the books file).
         """
-        
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'.")
+
         self.books_file_path = books_file_path
         self.users_file_path = users_file_path
         self.checkouts_file_path = checkouts_file_path
+        self.journaled = journaled
+        self.compact_threshold = compact_threshold
+        self.line_delimited = line_delimited
+        self.binary = binary
+        self.compress = compress
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._journal_sizes = {}
+        self._unsynced = set()
+        self._last_sync = 0.0
+        self.shared = shared
+        self.lock_file_path = lock_file_path or os.path.join(os.path.dirname(books_file_path), "library.lock")
+        self._lock = FileLock(self.lock_file_path) if shared else threading.RLock()
 
     def load_books(self):
 
@@ -35,102 +332,811 @@ class Storage:
             - list: A list of Book objects loaded from the file.
         """
         
-        try:
-            with open(self.books_file_path, "r") as file:
-                books_data = json.load(file)
-            books = [self._convert_book_data(book_data) for book_data in books_data]
-            return books
-        except FileNotFoundError:
-            return []
-        except json.JSONDecodeError:
-            print(f"Error: Invalid JSON data in {self.books_file_path}")
-            return []
+        return self._load_collection("books", self.books_file_path, self._book_key,
+                                     self._convert_book_data, self._convert_book_columns)
 
-    def save_books(self, books):
+    def save_books(self, books, upserts=None, deletes=None):
         """
         Saves books data to the specified file path.
 
         Args:
         - books (list): A list of Book objects to be saved.
+        - upserts (list): The Book objects added or changed since the last save (default is None).
+        - deletes (list): The ISBNs of the books deleted since the last save (default is None).
         """
 
+        self._save_versioned("books", self.books_file_path, books, self._convert_book_object, self._book_key,
+                             upserts, deletes)
 
-        books_data = [self._convert_book_object(book) for book in books]
-        try:
-            with open(self.books_file_path, "w") as file:
-                json.dump(books_data, file, indent=4)
-        except IOError:
-            print(f"Error: Unable to write to {self.books_file_path}")
-
-    def load_users(self):
+    def load_users(self, books=None):
         """
         Loads users data from the specified file path.
 
+        Args:
+        - books (dict): An identity map of the loaded books keyed by ISBN, used to resolve
+          the users' borrowed books (default is None).
+
         Returns:
         - list: A list of User objects loaded from the file.
         """
 
-        try:
-            with open(self.users_file_path, "r") as file:
-                users_data = json.load(file)
-            users = [self._convert_user_data(user_data) for user_data in users_data]
-            return users
-        except FileNotFoundError:
-            return []
-        except json.JSONDecodeError:
-            print(f"Error: Invalid JSON data in {self.users_file_path}")
-            return []
+        books = books or {}
+        return self._load_collection("users", self.users_file_path, self._user_key,
+                                     lambda user_data: self._convert_user_data(user_data, books),
+                                     lambda columns: self._convert_user_columns(columns, books))
 
-    def save_users(self, users):
+    def save_users(self, users, upserts=None, deletes=None):
 
         """
         Saves users data to the specified file path.
 
         Args:
         - users (list): A list of User objects to be saved.
+        - upserts (list): The User objects added or changed since the last save (default is None).
+        - deletes (list): The IDs of the users deleted since the last save (default is None).
         """
 
-        users_data = [self._convert_user_object(user) for user in users]
-        try:
-            with open(self.users_file_path, "w") as file:
-                json.dump(users_data, file, indent=4)
-        except IOError:
-            print(f"Error: Unable to write to {self.users_file_path}")
+        self._save_versioned("users", self.users_file_path, users, self._convert_user_object, self._user_key,
+                             upserts, deletes)
 
     def load_checkouts(self):
         """
         Loads checkouts data from the specified file path.
 
         Returns:
-        - list: A list of tuples containing User and Book objects loaded from the file.
+        - list: A list of Checkout objects loaded from the file.
+        """
+
+        return self._load_collection("checkouts", self.checkouts_file_path, self._checkout_key,
+                                     self._convert_checkout_data, self._convert_checkout_columns)
+
+    def save_checkouts(self, checkouts, upserts=None, deletes=None):
+        """
+        Saves checkouts data to the specified file path.
+
+        Args:
+        - checkouts (list): A list of Checkout objects to be saved.
+        - upserts (list): The checkouts added since the last save (default is None).
+        - deletes (list): The ISBNs of the books checked in since the last save (default is None).
+        """
+
+        self._save_versioned("checkouts", self.checkouts_file_path, checkouts, self._convert_checkout_object, self._checkout_key,
+                             upserts, deletes)
+
+    def version(self, kind):
+        """
+        Returns the version stamp of a collection in shared mode.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+
+        Returns:
+        - int or None: The version of the collection, or None if the storage is not shared.
+        """
+        if not self.shared:
+            return None
+        return self._read_version(getattr(self, f"{kind}_file_path"))[0]
+
+    def changes_since(self, kind, version, books=None):
+        """
+        Returns the records of a collection saved since a version, read from its journal.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - version (int): The version the caller has.
+        - books (dict): An identity map of the loaded books keyed by ISBN, used to resolve
+          the borrowed books of users (default is None).
+
+        Returns:
+        - tuple or None: The current version, the added or changed objects, and the keys of
+          the deleted ones; or None if the storage is not shared or the changes have been
+          compacted out of the journal.
+        """
+        if not self.shared or version is None:
+            return None
+        file_path = getattr(self, f"{kind}_file_path")
+        convert = {
+            "books": self._convert_book_data,
+            "users": lambda user_data: self._convert_user_data(user_data, books or {}),
+            "checkouts": self._convert_checkout_data,
+        }[kind]
+        with self.transaction():
+            current, base = self._read_version(file_path)
+            if current == version:
+                return current, [], []
+            if not self.journaled or version < base:
+                return None
+            journal = self._read_journal(file_path, since=version)
+        upserts = [convert(record) for record in journal.values() if record is not None]
+        deletes = [item_key for item_key, record in journal.items() if record is None]
+        return current, upserts, deletes
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the inter-process lock of the data files in shared mode. Transactions nest.
+        """
+        if not self.shared:
+            yield
+            return
+        with self._lock:
+            yield
+
+    def flush(self):
+        """
+        Syncs the journal appends not yet synced to disk under the "batched" fsync policy.
+        """
+        with self._lock:
+            for journal_path in self._unsynced:
+                try:
+                    self._sync_file(journal_path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    print(f"Error: Unable to sync {journal_path}")
+            self._unsynced.clear()
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        """
+        Syncs the journal appends not yet synced to disk.
+        """
+        self.flush()
+
+    def _load_collection(self, kind, file_path, key, convert, convert_columns):
+        """
+        Loads the objects of a collection from its data file, with its journal applied,
+        restoring the last good copy of the data file if it is corrupt.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file of the collection.
+        - key (callable): Returns the key of a JSON record.
+        - convert (callable): Converts a JSON record to an object.
+        - convert_columns (callable): Converts the columns of a snapshot to a list of objects.
+
+        Returns:
+        - list: The objects of the collection.
+
+        Raises:
+        - StorageError: If the data file and its last good copy are unreadable.
         """
+        with self._lock:
+            return self._read_with_recovery(
+                file_path, lambda: self._read_collection(kind, file_path, key, convert, convert_columns))
 
+    def _read_collection(self, kind, file_path, key, convert, convert_columns):
+        """
+        Reads the objects of a collection from its data file, with its journal applied.
+
+        The journal is read first; a JSON data file is then read one record at a time, so
+        only the journal and the converted objects are held in memory, not the parsed file.
+        A binary snapshot is converted column by column, without a dictionary per record.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file of the collection.
+        - key (callable): Returns the key of a JSON record.
+        - convert (callable): Converts a JSON record to an object.
+        - convert_columns (callable): Converts the columns of a snapshot to a list of objects.
+
+        Returns:
+        - list: The objects of the collection.
+
+        Raises:
+        - StorageError: If the data file is corrupt or holds a record that cannot be converted.
+        """
+        with paused_gc():
+            journal = self._read_journal(file_path)
+            if is_snapshot(file_path):
+                columns = self._read_snapshot(kind, file_path)
+                rows = zip(columns[KEY_COLUMNS[kind]], convert_columns(columns))
+            else:
+                rows = ((key(record), convert(record)) for record in self._iter_records(file_path))
+            objects = []
+            try:
+                for row_key, item in rows:
+                    if row_key in journal:
+                        record = journal.pop(row_key)
+                        if record is None:
+                            continue
+                        item = convert(record)
+                    objects.append(item)
+                objects.extend(convert(record) for record in journal.values() if record is not None)
+            except (KeyError, TypeError, AttributeError) as error:
+                raise StorageError(f"Invalid {kind} record in {file_path}: {error!r}.")
+            return objects
+
+    def _read_with_recovery(self, file_path, read):
+        """
+        Reads a data file, and if it is corrupt, moves it to "<data file>.corrupt", restores
+        its last good copy, and reads again. Changes that were compacted into the corrupt file
+        after the copy was made are lost.
+
+        Args:
+        - file_path (str): The data file.
+        - read (callable): Reads the data file and returns its contents.
+
+        Returns:
+        - The contents returned by read.
+
+        Raises:
+        - StorageError: If the data file is corrupt and its last good copy is missing or corrupt.
+        """
+        backup_path = self._backup_path(file_path)
         try:
-            with open(self.checkouts_file_path, "r") as file:
-                checkouts_data = json.load(file)
-            checkouts = [(self._convert_user_data(checkout[0]), self._convert_book_data(checkout[1])) for checkout in checkouts_data]
-            return checkouts
+            return read()
+        except StorageError as error:
+            if not os.path.exists(backup_path):
+                raise StorageError(f"{error.message} There is no last good copy to restore.")
+            print(f"Error: {error.message} Restoring the last good copy from {backup_path}.")
+            try:
+                os.replace(file_path, f"{file_path}.corrupt")
+                shutil.copyfile(backup_path, f"{file_path}.tmp")
+                os.replace(f"{file_path}.tmp", file_path)
+            except OSError as os_error:
+                raise StorageError(f"Unable to restore {file_path} from {backup_path}: {os_error}")
+        try:
+            return read()
+        except StorageError as error:
+            raise StorageError(f"{error.message} The last good copy is corrupt as well.")
+
+    @staticmethod
+    def _read_snapshot(kind, file_path):
+        """
+        Reads the columns of a collection from a binary snapshot.
+
+        Args:
+        - kind (str): The expected collection.
+        - file_path (str): The snapshot file path.
+
+        Returns:
+        - dict: The columns of the snapshot, as returned by read_snapshot.
+
+        Raises:
+        - StorageError: If the snapshot is corrupt or holds another collection.
+        """
+        try:
+            snapshot_kind, columns = read_snapshot(file_path)
+        except SnapshotError as error:
+            raise StorageError(f"Invalid snapshot data in {file_path}: {error.message}")
+        if snapshot_kind != kind:
+            raise StorageError(f"{file_path} is a snapshot of {snapshot_kind}, not {kind}.")
+        return columns
+
+    def _iter_records(self, file_path):
+        """
+        Streams the JSON records of a data file. Files holding a JSON array are parsed
+        whole; files holding one JSON record per line are parsed in batches. The checksum
+        trailer of a line-delimited file is verified after its last record has been
+        yielded, so the records of a file that raises must be discarded. Files without
+        a trailer, written by earlier versions or edited by hand, are not verified.
+
+        Args:
+        - file_path (str): The data file path.
+
+        Yields:
+        - dict: The JSON records of the file.
+
+        Raises:
+        - StorageError: If the file does not match its checksum or is not a valid JSON array.
+        """
+        try:
+            with open(file_path, "r") as file:
+                first_line = file.readline()
+                if first_line.lstrip().startswith("["):
+                    text = first_line + file.read()
+                    index = text.rfind("\n" + CHECKSUM_PREFIX)
+                    if index != -1:
+                        text, trailer = text[:index + 1], text[index + 1:]
+                        self._verify_checksum(file_path, zlib.crc32(text.encode("utf-8")), trailer)
+                    try:
+                        records = json.loads(text)
+                    except json.JSONDecodeError:
+                        raise StorageError(f"Invalid JSON data in {file_path}.")
+                    yield from records
+                    return
+                lines = itertools.chain([first_line], file)
+                line_number = 1
+                checksum = 0
+                trailer = None
+                while True:
+                    batch = list(itertools.islice(lines, self.PARSE_BATCH_SIZE))
+                    if not batch:
+                        break
+                    if batch[-1].startswith(CHECKSUM_PREFIX):
+                        trailer = batch.pop()
+                    checksum = zlib.crc32("".join(batch).encode("utf-8"), checksum)
+                    yield from self._parse_lines(file_path, batch, line_number)
+                    line_number += len(batch)
+                if trailer is not None:
+                    self._verify_checksum(file_path, checksum, trailer)
         except FileNotFoundError:
-            return []
+            return
+
+    @staticmethod
+    def _verify_checksum(file_path, checksum, trailer):
+        """
+        Compares the CRC-32 of a data file's contents with the value in its trailer line.
+
+        Args:
+        - file_path (str): The data file path, for error messages.
+        - checksum (int): The CRC-32 of the contents before the trailer.
+        - trailer (str): The trailer line.
+
+        Raises:
+        - StorageError: If the checksums differ or the trailer is malformed.
+        """
+        try:
+            expected = int(trailer[len(CHECKSUM_PREFIX):], 16)
+        except ValueError:
+            expected = None
+        if checksum != expected:
+            raise StorageError(f"The checksum of {file_path} does not match its contents.")
+
+    @staticmethod
+    def _parse_lines(file_path, lines, first_line_number):
+        """
+        Parses a batch of line-delimited JSON records. The batch is parsed as a single JSON
+        array, which is much cheaper than one json.loads call per line; only a batch holding
+        an invalid line is parsed line by line, reporting and skipping the invalid lines.
+
+        Args:
+        - file_path (str): The data file path, for error messages.
+        - lines (list): The lines of the batch.
+        - first_line_number (int): The line number of the first line of the batch.
+
+        Returns:
+        - list: The JSON records of the batch.
+        """
+        numbered = [(number, line) for number, line in enumerate(lines, start=first_line_number) if line.strip()]
+        try:
+            return json.loads("[" + ",".join(line for _, line in numbered) + "]")
         except json.JSONDecodeError:
-            print(f"Error: Invalid JSON data in {self.checkouts_file_path}")
-            return []
+            pass
+        records = []
+        for line_number, line in numbered:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Error: Invalid JSON data in {file_path} on line {line_number}")
+        return records
 
-    def save_checkouts(self, checkouts):
+    def _save_versioned(self, kind, file_path, items, convert, key, upserts, deletes):
         """
-        Saves checkouts data to the specified file path.
+        Saves a collection holding the lock, and stamps it with a new version in shared mode.
 
         Args:
-        - checkouts (list): A list of tuples containing User and Book objects to be saved.
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file of the collection.
+        - items (list): All objects of the collection.
+        - convert (callable): Converts an object to its JSON data.
+        - key (callable): Returns the key of an object's JSON data.
+        - upserts (list): The objects added or changed since the last save, or None.
+        - deletes (list): The keys of the objects deleted since the last save, or None.
+        """
+        with self._lock:
+            if not self.shared:
+                self._save_collection(kind, file_path, items, convert, key, upserts, deletes)
+                return
+            version, base = self._read_version(file_path)
+            version += 1
+            if self._save_collection(kind, file_path, items, convert, key, upserts, deletes, version):
+                base = version
+            self._write_version(file_path, version, base)
+
+    def _save_collection(self, kind, file_path, items, convert, key, upserts, deletes, version=None):
         """
+        Saves a collection either by appending its changes to the journal or by rewriting its data file.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file of the collection.
+        - items (list): All objects of the collection.
+        - convert (callable): Converts an object to its JSON data.
+        - key (callable): Returns the key of an object's JSON data.
+        - upserts (list): The objects added or changed since the last save, or None.
+        - deletes (list): The keys of the objects deleted since the last save, or None.
+        - version (int): The version stamped on the journal entries in shared mode (default is None).
 
+        Returns:
+        - bool: Whether the data file was rewritten.
+        """
+        changes = len(upserts or ()) + len(deletes or ())
+        delta = upserts is not None or deletes is not None
+        if self.shared:
+            self._journal_sizes.pop(file_path, None)
+        if self.journaled and delta and self._journal_size(file_path) + changes < self.compact_threshold:
+            entries = [{"op": "delete", "key": item_key} for item_key in deletes or ()]
+            for item in upserts or ():
+                data = convert(item)
+                entries.append({"op": "put", "key": key(data), "data": data})
+            if not entries:
+                return False
+            if version is not None:
+                for entry in entries:
+                    entry["version"] = version
+            journal_path = self._journal_path(file_path)
+            try:
+                with open(journal_path, "a") as file:
+                    file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+                    if self.fsync == "always":
+                        file.flush()
+                        os.fsync(file.fileno())
+                    elif self.fsync == "batched":
+                        self._unsynced.add(journal_path)
+                self._journal_sizes[file_path] += len(entries)
+            except IOError:
+                print(f"Error: Unable to write to {journal_path}")
+            if self._unsynced and time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.flush()
+            return False
 
-        checkouts_data = [(self._convert_user_object(checkout[0]), self._convert_book_object(checkout[1])) for checkout in checkouts]
+        if delta and self.shared:
+            try:
+                records = self._read_records(kind, file_path, key)
+            except StorageError as error:
+                print(f"Error: Unable to save {kind}: {error.message}")
+                return False
+            for item_key, record in self._read_journal(file_path).items():
+                if record is None:
+                    records.pop(item_key, None)
+                else:
+                    records[item_key] = record
+            for item_key in deletes or ():
+                records.pop(item_key, None)
+            for item in upserts or ():
+                data = convert(item)
+                records[key(data)] = data
+            records = records.values()
+        else:
+            records = (convert(item) for item in items)
         try:
-            with open(self.checkouts_file_path, "w") as file:
-                json.dump(checkouts_data, file, indent=4)
+            self._write_collection(kind, file_path, records)
         except IOError:
-            print(f"Error: Unable to write to {self.checkouts_file_path}")
+            print(f"Error: Unable to write to {file_path}")
+            return False
+        self._clear_journal(file_path)
+        return True
+
+    def _read_records(self, kind, file_path, key):
+        """
+        Reads the JSON records of a data file, without its journal, restoring its last good
+        copy if it is corrupt.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file path.
+        - key (callable): Returns the key of a JSON record.
+
+        Returns:
+        - dict: The JSON records of the file keyed by their key, in file order.
+
+        Raises:
+        - StorageError: If the data file and its last good copy are unreadable.
+        """
+        def read():
+            if is_snapshot(file_path):
+                records = columns_to_records(self._read_snapshot(kind, file_path))
+            else:
+                records = self._iter_records(file_path)
+            try:
+                return {key(record): record for record in records}
+            except (KeyError, TypeError) as error:
+                raise StorageError(f"Invalid {kind} record in {file_path}: {error!r}.")
+
+        return self._read_with_recovery(file_path, read)
+
+    def _read_version(self, file_path):
+        """
+        Reads the version stamp of a data file.
+
+        Args:
+        - file_path (str): The data file path.
+
+        Returns:
+        - tuple: The version of the collection, and the version its data file was last rewritten at.
+
+        Raises:
+        - StorageError: If the version file is unreadable.
+        """
+        try:
+            with open(f"{file_path}.version", "r") as file:
+                data = json.load(file)
+            return data["version"], data["base"]
+        except FileNotFoundError:
+            return 0, 0
+        except (ValueError, KeyError, TypeError):
+            raise StorageError(f"Invalid version data in {file_path}.version.")
+
+    @staticmethod
+    def _write_version(file_path, version, base):
+        """
+        Writes the version stamp of a data file, replacing the previous one atomically.
+
+        Args:
+        - file_path (str): The data file path.
+        - version (int): The version of the collection.
+        - base (int): The version the data file was last rewritten at.
+        """
+        version_path = f"{file_path}.version"
+        try:
+            with open(f"{version_path}.tmp", "w") as file:
+                json.dump({"version": version, "base": base}, file)
+            os.replace(f"{version_path}.tmp", version_path)
+        except OSError:
+            print(f"Error: Unable to write to {version_path}")
+
+    def _write_collection(self, kind, file_path, records):
+        """
+        Writes the JSON records of a collection to a data file, in the configured layout.
+
+        The records are written to "<data file>.tmp", which is synced to disk unless the
+        fsync policy is "never" and then renamed over the data file, so a crash leaves the
+        previous or the new data file, never a partial one. The replaced data file is kept
+        as "<data file>.bak". JSON files end with a trailer line holding the CRC-32 of the
+        lines before it; snapshots carry a checksum in their header.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - file_path (str): The data file.
+        - records (iterable): The JSON records to write.
+
+        Raises:
+        - IOError: If the file cannot be written.
+        """
+        temporary_path = f"{file_path}.tmp"
+        try:
+            if self.binary:
+                write_snapshot(temporary_path, kind, records, self.compress)
+            else:
+                with open(temporary_path, "w") as file:
+                    checksum = 0
+                    if self.line_delimited:
+                        records = iter(records)
+                        while True:
+                            chunk = "".join(json.dumps(record) + "\n"
+                                            for record in itertools.islice(records, self.PARSE_BATCH_SIZE))
+                            if not chunk:
+                                break
+                            checksum = zlib.crc32(chunk.encode("utf-8"), checksum)
+                            file.write(chunk)
+                    else:
+                        text = json.dumps(list(records), indent=4) + "\n"
+                        checksum = zlib.crc32(text.encode("utf-8"))
+                        file.write(text)
+                    file.write(f"{CHECKSUM_PREFIX}{checksum:08x}\n")
+            if self.fsync != "never":
+                self._sync_file(temporary_path)
+            if os.path.exists(file_path):
+                self._keep_backup(file_path)
+            os.replace(temporary_path, file_path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+        if self.fsync != "never":
+            self._sync_directory(file_path)
+
+    @staticmethod
+    def _backup_path(file_path):
+        """
+        Returns the path of the last good copy of a data file.
+
+        Args:
+        - file_path (str): The data file path.
+
+        Returns:
+        - str: The backup file path.
+        """
+        return file_path + ".bak"
+
+    def _keep_backup(self, file_path):
+        """
+        Keeps the current data file as its last good copy before it is replaced, by
+        hard-linking it, or by copying it where hard links are not supported.
+
+        Args:
+        - file_path (str): The data file path.
+        """
+        backup_path = self._backup_path(file_path)
+        temporary_path = f"{backup_path}.tmp"
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(file_path, temporary_path)
+        except OSError:
+            shutil.copyfile(file_path, temporary_path)
+        os.replace(temporary_path, backup_path)
+
+    @staticmethod
+    def _sync_file(file_path):
+        """
+        Syncs the contents of a file to disk.
+
+        Args:
+        - file_path (str): The file path.
+        """
+        with open(file_path, "rb+") as file:
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _sync_directory(file_path):
+        """
+        Syncs the directory holding a renamed file to disk, so the rename itself survives a
+        power failure. Platforms that cannot open directories skip this.
+
+        Args:
+        - file_path (str): The renamed file path.
+        """
+        try:
+            descriptor = os.open(os.path.dirname(file_path) or ".", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+    @staticmethod
+    def _journal_path(file_path):
+        """
+        Returns the journal file path of a data file.
+
+        Args:
+        - file_path (str): The data file path.
+
+        Returns:
+        - str: The journal file path.
+        """
+        return file_path + ".log"
+
+    def _journal_size(self, file_path):
+        """
+        Returns the number of entries in the journal of a data file.
+
+        Args:
+        - file_path (str): The data file path.
+
+        Returns:
+        - int: The number of journal entries.
+        """
+        if file_path not in self._journal_sizes:
+            try:
+                with open(self._journal_path(file_path), "r") as file:
+                    self._journal_sizes[file_path] = sum(1 for _ in file)
+            except FileNotFoundError:
+                self._journal_sizes[file_path] = 0
+        return self._journal_sizes[file_path]
+
+    def _clear_journal(self, file_path):
+        """
+        Removes the journal of a data file after the data file has been rewritten.
+
+        Args:
+        - file_path (str): The data file path.
+        """
+        journal_path = self._journal_path(file_path)
+        try:
+            os.remove(journal_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            print(f"Error: Unable to remove {journal_path}")
+            return
+        self._unsynced.discard(journal_path)
+        self._journal_sizes[file_path] = 0
+
+    def _read_journal(self, file_path, since=None):
+        """
+        Reads the journal of a data file into the latest state of each changed record.
+
+        A last entry without its line break was cut short by a crash during the append,
+        so its save never completed: it is discarded and truncated from the journal, so
+        the next append starts on a new line.
+
+        Args:
+        - file_path (str): The data file path.
+        - since (int): Only read the entries saved after this version (default is None, all entries).
+
+        Returns:
+        - dict: The latest JSON data of each journaled key, or None for deleted keys.
+        """
+        journal_path = self._journal_path(file_path)
+        journal = {}
+        size = 0
+        offset = 0
+        torn = False
+        try:
+            with open(journal_path, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        torn = True
+                        break
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    size += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Error: Invalid JSON data in {journal_path}")
+                        continue
+                    if since is not None and entry.get("version", 0) <= since:
+                        continue
+                    journal[entry["key"]] = entry["data"] if entry["op"] == "put" else None
+        except FileNotFoundError:
+            pass
+        if torn:
+            print(f"Discarded an incomplete change at the end of {journal_path}.")
+            try:
+                os.truncate(journal_path, offset)
+            except OSError:
+                print(f"Error: Unable to truncate {journal_path}")
+        self._journal_sizes[file_path] = size
+        return journal
+
+    @staticmethod
+    def _book_key(book_data):
+        """
+        Returns the key (ISBN) of a book's JSON data.
+        """
+        return book_data["isbn"]
+
+    @staticmethod
+    def _user_key(user_data):
+        """
+        Returns the key (user ID) of a user's JSON data.
+        """
+        return user_data["user_id"]
+
+    @staticmethod
+    def _checkout_key(checkout_data):
+        """
+        Returns the key (ISBN of the checked-out book) of a checkout's JSON data.
+        """
+        if isinstance(checkout_data, list):
+            return checkout_data[1]["isbn"]
+        return checkout_data["isbn"]
+
+    @staticmethod
+    def _convert_checkout_data(checkout_data):
+        """
+        Converts checkout data to a Checkout object. Checkouts stored as a
+        [user data, book data] pair by earlier versions are accepted as well.
+
+        Args:
+        - checkout_data (dict): A dictionary containing checkout data.
+
+        Returns:
+        - Checkout: A Checkout object created from the checkout data.
+        """
+        if isinstance(checkout_data, list):
+            return Checkout(checkout_data[0]["user_id"], checkout_data[1]["isbn"])
+        return Checkout(**checkout_data)
+
+    @staticmethod
+    def _convert_checkout_object(checkout):
+        """
+        Converts a Checkout object to a dictionary.
+
+        Args:
+        - checkout (Checkout): The Checkout object to be converted.
+
+        Returns:
+        - dict: A dictionary containing the checkout data.
+        """
+        return {
+            "user_id": checkout.user_id,
+            "isbn": checkout.isbn,
+            "timestamp": checkout.timestamp
+        }
 
     @staticmethod
     def _convert_book_data(book_data):
@@ -168,22 +1174,32 @@ class Storage:
         }
 
     @staticmethod
-    def _convert_user_data(user_data):
+    def _convert_user_data(user_data, books):
 
         """
         Converts user data from a dictionary to a User object.
 
+        Borrowed books are stored as ISBNs and resolved through the books identity map;
+        ISBNs missing from it are skipped. Borrowed books stored as full dictionaries by
+        earlier versions are resolved by their ISBN as well, and only copied when unknown.
+
         Args:
         - user_data (dict): A dictionary containing user data.
+        - books (dict): An identity map of the loaded books keyed by ISBN.
 
         Returns:
         - User: A User object created from the user data.
         """
 
-        borrowed_books_data = user_data.pop('borrowed_books', [])
-        borrowed_books = [Book(**book_data) for book_data in borrowed_books_data]
-        user_data['borrowed_books'] = borrowed_books
-        return User(**user_data)
+        borrowed_books = []
+        for entry in user_data.get('borrowed_books', []):
+            isbn = entry["isbn"] if isinstance(entry, dict) else entry
+            book = books.get(isbn)
+            if book is None and isinstance(entry, dict):
+                book = Book(**entry)
+            if book is not None:
+                borrowed_books.append(book)
+        return User(user_data["name"], user_data["user_id"], borrowed_books)
 
     @staticmethod
     def _convert_user_object(user):
@@ -198,9 +1214,52 @@ class Storage:
         - dict: A dictionary containing the user data.
         """
 
-        borrowed_books_data = [book.__dict__ for book in user.borrowed_books]
-        user_data = user.__dict__.copy()
-        user_data['borrowed_books'] = borrowed_books_data
-        return user_data
+        return {
+            "name": user.name,
+            "user_id": user.user_id,
+            "borrowed_books": [book.isbn for book in user.borrowed_books]
+        }
+
+    @staticmethod
+    def _convert_book_columns(columns):
+        """
+        Converts the columns of a books snapshot to Book objects.
+
+        Args:
+        - columns (dict): The title, author, isbn, and available columns.
+
+        Returns:
+        - list: The Book objects.
+        """
+        return list(map(Book, columns["title"], columns["author"], columns["isbn"], columns["available"]))
+
+    @staticmethod
+    def _convert_user_columns(columns, books):
+        """
+        Converts the columns of a users snapshot to User objects, resolving the borrowed
+        books through the books identity map and skipping unknown ISBNs.
 
+        Args:
+        - columns (dict): The name, user_id, and borrowed_books columns.
+        - books (dict): An identity map of the loaded books keyed by ISBN.
+
+        Returns:
+        - list: The User objects.
+        """
+        return [User(name, user_id, [books[isbn] for isbn in borrowed_books if isbn in books])
+                for name, user_id, borrowed_books in
+                zip(columns["name"], columns["user_id"], columns["borrowed_books"])]
+
+    @staticmethod
+    def _convert_checkout_columns(columns):
+        """
+        Converts the columns of a checkouts snapshot to Checkout objects.
+
+        Args:
+        - columns (dict): The user_id, isbn, and timestamp columns.
+
+        Returns:
+        - list: The Checkout objects.
+        """
+        return list(map(Checkout, columns["user_id"], columns["isbn"], columns["timestamp"]))
 
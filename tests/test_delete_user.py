@@ -0,0 +1,57 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import LibraryManagementSystem
+from storage import Storage
+
+
+class DeleteUserWithLoansTest(unittest.TestCase):
+    """
+    A user holding a book must not be deleted by a later run of the program, whose lazily
+    created managers have not loaded the checkouts yet.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open_library(self):
+        paths = (os.path.join(self.directory, name) for name in ("books.json", "users.json", "checkouts.json"))
+        return LibraryManagementSystem(Storage(*paths, journaled=True, line_delimited=True))
+
+    def test_user_with_a_loan_from_an_earlier_run_is_kept(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            first = self.open_library()
+            first.book_manager.add_book("Dune", "Frank Herbert", "111")
+            first.user_manager.add_user("Ann", "u1")
+            self.assertTrue(first.check_manager.checkout_book("u1", "111"))
+            first.storage.close()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            second = self.open_library()
+            deleted = second.user_manager.delete_user("u1")
+            second.check_manager.refresh()
+            checkout = second.check_manager.get_checkout_by_isbn("111")
+            second.storage.close()
+
+        self.assertFalse(deleted)
+        self.assertIn("has checked out books and cannot be deleted", output.getvalue())
+        self.assertNotIn("Warning", output.getvalue())
+        self.assertIsNotNone(second.user_manager.get_user_by_id("u1"))
+        self.assertIsNotNone(checkout)
+        self.assertEqual(checkout.user_id, "u1")
+        self.assertFalse(second.book_manager.get_book_by_isbn("111").available)
+
+
+if __name__ == "__main__":
+    unittest.main()
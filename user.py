@@ -10,7 +10,14 @@ class ValidationError(Exception):
         super().__init__(message)
 
 
+import threading
+from contextlib import contextmanager
+from cache import ResultCache
+from completion import PrefixIndex
+from locks import StripedLock
 from models import User
+from ordering import SortedIndex, paginate
+from search import FuzzyIndex
 
 class UserManager:
     """
@@ -18,17 +25,216 @@ class UserManager:
 
     Attributes:
     - storage (Storage): An instance of the Storage class for data storage.
+    - book_manager (BookManager): The BookManager whose books the users borrow, or None.
+    - check_manager (CheckManager): The CheckManager recording the users' loans, or None. A
+      CheckManager sets itself here when it is created.
     - users (List[User]): A list of users managed by the UserManager.
+    - _users_by_id (Dict[str, User]): An index of the managed users keyed by user ID.
+    - _name_index (FuzzyIndex): A typo-tolerant index of the user names.
+    - _completions (Dict[str, PrefixIndex]): Prefix-completion indexes of the user IDs and names.
+    - _orderings (Dict[str, SortedIndex]): The user IDs sorted by name and by user ID, for listing.
+    - _version (int): The storage version of the managed users, or None if the storage does not track versions.
+    - search_cache (ResultCache): The results of recent searches, dropped when the users they may contain change.
+    - locks (StripedLock): The per-user locks, held while a user is checked for and changed.
+    - _lock (RLock): The lock of the managed collections and indexes.
+
+    A lazily created UserManager loads the users on the first access to any of these collections.
+    Changes refresh the users from the storage first, so with a shared storage the manager
+    picks up the changes saved by other processes before making its own.
+
+    A UserManager may be used by several threads. Changes to a user hold the user's lock,
+    which CheckManager also holds while lending to the user, and every change to the
+    collections and indexes holds the manager lock.
     """
-    def __init__(self, storage):
+
+    COMPLETION_FIELDS = ("user_id", "name")
+    SORT_KEYS = ("name", "user_id")
+    CURSOR_TYPES = {"name": (str, str), "user_id": (str,)}
+    LAZY_ATTRIBUTES = ("users", "_users_by_id", "_name_index", "_completions", "_orderings")
+
+    def __init__(self, storage, book_manager=None, lazy=False, cache_size=256):
         """
         Initializes a UserManager object.
 
         Args:
         - storage (Storage): An instance of the Storage class for data storage.
+        - book_manager (BookManager): The BookManager whose books the users borrow. When given,
+          borrowed books are loaded as the very objects held by the BookManager (default is None).
+        - lazy (bool): Whether to defer loading the users until they are first used (default is False).
+        - cache_size (int): The number of search results cached; 0 disables the cache (default is 256).
         """
         self.storage = storage
-        self.users = self.storage.load_users()
+        self.book_manager = book_manager
+        self.check_manager = None
+        self.search_cache = ResultCache(cache_size)
+        self.locks = StripedLock()
+        self._lock = threading.RLock()
+        if not lazy:
+            self.load_users()
+
+    def __getattr__(self, name):
+        """
+        Loads the users when a collection of a lazily created UserManager is first accessed.
+        """
+        if name in UserManager.LAZY_ATTRIBUTES and name not in self.__dict__:
+            with self.storage.transaction(), self._lock:
+                if name not in self.__dict__:
+                    self.load_users()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the manager lock, loading the users first if they are not loaded yet, so
+        the storage is never waited for while the lock is held.
+        """
+        if "users" not in self.__dict__:
+            self.__getattr__("users")
+        with self._lock:
+            yield
+
+    def load_users(self):
+        """
+        Loads users from storage and rebuilds the indexes. The new collections are built
+        first and then replace the old ones, so threads reading without the manager lock
+        never see them half loaded.
+        """
+        books = self.book_manager.get_books_by_isbn() if self.book_manager else None
+        with self.storage.transaction(), self._lock:
+            self._version = self.storage.version("users")
+            users = self.storage.load_users(books)
+            users_by_id = {}
+            name_index = FuzzyIndex(("name",))
+            for user in users:
+                users_by_id[user.user_id] = user
+                name_index.add(user.user_id, {"name": user.name})
+            completions = {field: PrefixIndex() for field in self.COMPLETION_FIELDS}
+            for field, index in completions.items():
+                index.add_many(getattr(user, field) for user in users)
+            orderings = self._create_orderings(users_by_id)
+            self._name_index, self._completions, self._orderings = name_index, completions, orderings
+            self._users_by_id = users_by_id
+            self.users = users
+            self.search_cache.clear()
+
+    def refresh(self):
+        """
+        Applies the changes other processes saved to the users since they were loaded or
+        last refreshed. Only the changed users are reloaded when the storage can list them;
+        managed users are updated in place. Their borrowed books are left to the checkouts,
+        which are the record of what is lent out.
+
+        Returns:
+        - bool: Whether the users had changed.
+        """
+        if "users" not in self.__dict__:
+            return False
+        books = self.book_manager.get_books_by_isbn() if self.book_manager else None
+        with self.storage.transaction(), self._lock:
+            version = self.storage.version("users")
+            if version == self._version:
+                return False
+            changes = self.storage.changes_since("users", self._version, books)
+            if changes is None:
+                users = self.storage.load_users(books)
+                user_ids = {user.user_id for user in users}
+                changes = version, users, [user_id for user_id in self._users_by_id if user_id not in user_ids]
+            self._version, upserts, deletes = changes
+            for user_id in deletes:
+                user = self._users_by_id.get(user_id)
+                if user is not None:
+                    self._unindex_user(user)
+                    self.users.remove(user)
+            for new_user in upserts:
+                user = self._users_by_id.get(new_user.user_id)
+                if user is None:
+                    self.users.append(new_user)
+                    self._index_user(new_user)
+                    continue
+                if user.name != new_user.name:
+                    self._unindex_user(user)
+                    user.name = new_user.name
+                    self._index_user(user)
+            return True
+
+    def _save_users(self, upserts=None, deletes=None):
+        """
+        Saves the changed users and records the storage version of the save. Must be
+        called with the manager lock held, as the storage may read the whole collection.
+
+        Args:
+        - upserts (list): The users added or changed (default is None).
+        - deletes (list): The IDs of the users deleted (default is None).
+        """
+        self.storage.save_users(self.users, upserts=upserts, deletes=deletes)
+        self._version = self.storage.version("users")
+
+    def _index_user(self, user, bulk=False):
+        """
+        Adds a user to the indexes.
+
+        Args:
+        - user (User): The user to index.
+        - bulk (bool): Whether the user is part of a bulk load, which fills the completion
+          and sorted indexes and clears the search cache separately (default is False).
+        """
+        self._users_by_id[user.user_id] = user
+        self._name_index.add(user.user_id, {"name": user.name})
+        if not bulk:
+            for field, index in self._completions.items():
+                index.add(getattr(user, field))
+            for ordering in self._orderings.values():
+                ordering.add(user.user_id)
+            self._invalidate_searches(user)
+
+    def _unindex_user(self, user):
+        """
+        Removes a user from the indexes. Must be called before the user's name changes.
+
+        Args:
+        - user (User): The user to remove.
+        """
+        for ordering in self._orderings.values():
+            ordering.remove(user.user_id)
+        del self._users_by_id[user.user_id]
+        self._name_index.remove(user.user_id, {"name": user.name})
+        for field, index in self._completions.items():
+            index.remove(getattr(user, field))
+        self._invalidate_searches(user)
+
+    def _invalidate_searches(self, user):
+        """
+        Drops the cached searches whose results may include a user, as they are or as they
+        were before a change. Must be called after the user is added to or removed from the indexes.
+
+        Fuzzy searches rank every user, so any change drops them all.
+
+        Args:
+        - user (User): The user added, removed, or about to change.
+        """
+        name, user_id = user.name.lower(), user.user_id
+        self.search_cache.invalidate(lambda key: key[0] == "fuzzy" or (
+            (not key[2] or key[2] == user_id) and (not key[1] or key[1] in name)))
+
+    @staticmethod
+    def _create_orderings(users_by_id):
+        """
+        Creates the sorted indexes of the users.
+
+        Args:
+        - users_by_id (Dict[str, User]): The user ID index the sort keys are read from.
+
+        Returns:
+        - Dict[str, SortedIndex]: The user IDs sorted by name and by user ID.
+        """
+        def by_name(user_id):
+            return users_by_id[user_id].name.lower(), user_id
+
+        def by_user_id(user_id):
+            return user_id,
+
+        return {"name": SortedIndex(by_name, users_by_id), "user_id": SortedIndex(by_user_id, users_by_id)}
 
     def add_user(self, name, user_id):
 
@@ -43,16 +249,60 @@ class UserManager:
         - ValidationError: If name or user_id is empty or if a user with the same ID already exists.
         """
 
-        if not name.strip() or not user_id.strip():
-            raise ValidationError("Name and User ID are required.")
-        
-        if any(user.user_id == user_id.strip() for user in self.users):
-            raise ValidationError("A user with the same User ID already exists.")
-        
-        user = User(name, user_id)
-        self.users.append(user)
-        self.storage.save_users(self.users)
-        print(f"User '{name}' with ID '{user_id}' added successfully.")
+        with self.storage.transaction(), self._locked():
+            self.refresh()
+            if not name.strip() or not user_id.strip():
+                raise ValidationError("Name and User ID are required.")
+
+            if user_id.strip() in self._users_by_id:
+                raise ValidationError("A user with the same User ID already exists.")
+
+            user = User(name, user_id)
+            self.users.append(user)
+            self._index_user(user)
+            self._save_users(upserts=[user])
+            print(f"User '{name}' with ID '{user_id}' added successfully.")
+
+    def add_users(self, records):
+        """
+        Adds many users in one pass and saves them once.
+
+        Each record is validated like in add_user; invalid records and records whose user ID
+        is already in the library (or earlier in the same input) are rejected.
+
+        Args:
+        - records (iterable): Dictionaries with "name" and "user_id" keys.
+
+        Returns:
+        - tuple: The added users, and (row number, reason) pairs of the rejected records.
+        """
+        with self.storage.transaction(), self._locked():
+            self.refresh()
+            added, rejected = [], []
+            for row, record in enumerate(records, start=1):
+                if not isinstance(record, dict):
+                    rejected.append((row, "Malformed record."))
+                    continue
+                name, user_id = (str(record.get(key) or "").strip() for key in ("name", "user_id"))
+                if not name or not user_id:
+                    rejected.append((row, "Name and User ID are required."))
+                    continue
+                if user_id in self._users_by_id:
+                    rejected.append((row, "A user with the same User ID already exists."))
+                    continue
+                user = User(name, user_id)
+                self.users.append(user)
+                self._index_user(user, bulk=True)
+                added.append(user)
+
+            if added:
+                for field, completions in self._completions.items():
+                    completions.add_many(getattr(user, field) for user in added)
+                for ordering in self._orderings.values():
+                    ordering.add_many(user.user_id for user in added)
+                self.search_cache.clear()
+                self._save_users(upserts=added)
+            return added, rejected
 
     def update_user(self, user_id, new_name):
         """
@@ -62,67 +312,217 @@ class UserManager:
         - user_id (str): The ID of the user to update.
         - new_name (str): The new name for the user.
 
-        Raises:
-        - ValidationError: If the user is not found.
+        Returns:
+        - bool: Whether the user was updated.
         """
-        user = self.get_user_by_id(user_id)
-        if user:
-            user.name = new_name
-            self.storage.save_users(self.users)
-            print(f"User with ID '{user_id}' updated successfully. New name: '{new_name}'.")
-        else:
+        with self.storage.transaction(), self.locks.locked(user_id), self._locked():
+            self.refresh()
+            user = self.get_user_by_id(user_id)
+            if user:
+                self._unindex_user(user)
+                user.name = new_name
+                self._index_user(user)
+                self._save_users(upserts=[user])
+                print(f"User with ID '{user_id}' updated successfully. New name: '{new_name}'.")
+                return True
             print(f"User with ID '{user_id}' not found.")
+            return False
 
     def delete_user(self, user_id):
         """
-        Deletes a user from the library.
+        Deletes a user from the library, unless they hold books.
+
+        With a CheckManager, the user's loans are read from its checkouts, which are loaded
+        or refreshed first: the users' borrowed books are only rebuilt from the checkouts
+        when those are loaded, and are not saved when books are checked out.
 
         Args:
         - user_id (str): The ID of the user to delete.
+
+        Returns:
+        - bool: Whether the user was deleted.
+        """
+        with self.storage.transaction():
+            if self.check_manager is not None:
+                # The CheckManager lock comes before the user locks, so the checkouts are
+                # loaded or refreshed before those are taken.
+                self.check_manager.refresh()
+                len(self.check_manager.checkouts)
+            with self.locks.locked(user_id), self._locked():
+                return self._delete_user(user_id)
+
+    def _delete_user(self, user_id):
+        """
+        Deletes a user unless they hold books. Must be called with the user's lock and the manager lock held.
+
+        Args:
+        - user_id (str): The ID of the user to delete.
+
+        Returns:
+        - bool: Whether the user was deleted.
         """
+        self.refresh()
         user = self.get_user_by_id(user_id)
         if not user:
             print(f"User with ID '{user_id}' not found.")
-            return
+            return False
 
-        if any(book.available == False for book in user.borrowed_books):
+        if self.check_manager is not None:
+            has_loans = self.check_manager.count_loans(user_id) > 0
+        else:
+            has_loans = any(book.available == False for book in user.borrowed_books)
+        if has_loans:
             print(f"User '{user.name}' (ID: {user_id}) has checked out books and cannot be deleted.")
-            return
+            return False
 
         self.users.remove(user)
-        self.storage.save_users(self.users)
+        self._unindex_user(user)
+        self._save_users(deletes=[user.user_id])
         print(f"User '{user.name}' (ID: {user_id}) deleted successfully.")
+        return True
+
+    def page_users(self, sort="name", cursor=None, limit=20):
+        """
+        Returns one page of the users, in the order of a sort key, from the sorted indexes.
+
+        Args:
+        - sort (str): "name" or "user_id" (default is "name").
+        - cursor (tuple): The cursor returned with the previous page, or None for the first page.
+        - limit (int): The maximum number of users on the page (default is 20).
+
+        Returns:
+        - tuple: The users of the page, and the cursor of the next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the sort key is unknown or the limit is not positive.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'. Use {', '.join(self.SORT_KEYS)}.")
+        with self._locked():
+            users_by_id = self._users_by_id
+            return paginate(((key, users_by_id[user_id]) for key, user_id in self._orderings[sort].items(cursor)),
+                            limit)
+
+    def iter_users(self, sort="name", page_size=256):
+        """
+        Iterates over all the users in the order of a sort key, taking them a page at a
+        time, so the manager lock is only held while a page is taken.
+
+        Args:
+        - sort (str): The sort key, as for page_users (default is "name").
+        - page_size (int): The number of users taken at a time (default is 256).
 
-    def list_users(self):
+        Yields:
+        - User: Each user.
+        """
+        cursor = None
+        while True:
+            users, cursor = self.page_users(sort, cursor, page_size)
+            yield from users
+            if cursor is None:
+                return
+
+    def list_users(self, sort="name"):
         """
         Lists all the users in the library.
+
+        Args:
+        - sort (str): The sort key, as for page_users (default is "name").
         """
         print("List of users:")
-        if not self.users:
+        found = False
+        for user in self.iter_users(sort):
+            print(f"- {user.name} (ID: {user.user_id})")
+            found = True
+        if not found:
             print("No users found.")
+
+    def fuzzy_find_users(self, name, limit=10):
+        """
+        Finds the users whose names best match a text, tolerating typos.
+
+        Args:
+        - name (str): The name to search for.
+        - limit (int): The maximum number of results (default is 10).
+
+        Returns:
+        - List[User]: The best matching users, closest first.
+        """
+        key = ("fuzzy", name.lower(), limit)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        with self._locked():
+            users = [self._users_by_id[user_id] for user_id, _ in self._name_index.search(name, limit=limit)]
+            self.search_cache.put(key, tuple(users), self.search_cache.generation)
+            return users
+
+    def find_users(self, name=None, user_id=None):
+        """
+        Finds the users matching all of the given criteria. The name matches a
+        case-insensitive substring and the user ID matches exactly. Repeated searches
+        are answered from the search cache.
+
+        Args:
+        - name (str): The name to search for.
+        - user_id (str): The user ID to search for.
+
+        Returns:
+        - List[User]: The matching users, in the order they were added.
+        """
+        key = ("find", name.lower() if name else None, user_id or None)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        generation = self.search_cache.generation
+        if user_id:
+            user = self._users_by_id.get(user_id)
+            candidates = [user] if user else []
         else:
-            for user in self.users:
-                print(f"- {user.name} (ID: {user.user_id})")
+            with self._locked():
+                candidates = list(self.users)
+        matching_users = [user for user in candidates if not name or name.lower() in user.name.lower()]
+        self.search_cache.put(key, tuple(matching_users), generation)
+        return matching_users
 
-    def search_users(self, name=None, user_id=None):
+    def search_users(self, name=None, user_id=None, fuzzy=False):
         """
         Searches for users in the library based on name or user ID.
 
         Args:
         - name (str): The name to search for.
         - user_id (str): The user ID to search for.
+        - fuzzy (bool): Whether to print the closest name matches when nothing matches exactly (default is False).
         """
-        matching_users = [user for user in self.users
-                          if (not name or name.lower() in user.name.lower())
-                          and (not user_id or user_id == user.user_id)]
+        matching_users = self.find_users(name, user_id)
 
         if not matching_users:
             print("No users found.")
+            closest_users = self.fuzzy_find_users(name) if fuzzy and name and not user_id else []
+            if closest_users:
+                print("Closest matches:")
+                for user in closest_users:
+                    print(f"- {user.name} (ID: {user.user_id})")
         else:
             print("Matching users:")
             for user in matching_users:
                 print(f"- {user.name} (ID: {user.user_id})")
 
+    def complete(self, field, prefix, limit=10):
+        """
+        Completes a prefix of a user ID or name.
+
+        Args:
+        - field (str): One of "user_id" or "name".
+        - prefix (str): The prefix typed so far.
+        - limit (int): The maximum number of completions (default is 10).
+
+        Returns:
+        - List[str]: The matching values in alphabetical order.
+        """
+        with self._locked():
+            return self._completions[field].complete(prefix, limit)
+
     def get_user_by_id(self, user_id):
         """
         Retrieves a user from the library based on their ID.
@@ -133,8 +533,5 @@ class UserManager:
         Returns:
         - User or None: The user object if found, None otherwise.
         """
-        for user in self.users:
-            if user.user_id == user_id:
-                return user
-        return None
+        return self._users_by_id.get(user_id)
 
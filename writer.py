@@ -0,0 +1,428 @@
+import atexit
+import threading
+import time
+from operator import attrgetter
+from storage import BaseStorage, StorageError
+
+
+class _Batch:
+    """
+    The changes to one collection queued since the last write.
+
+    Attributes:
+    - items (iterable): The whole collection, as passed to the latest save.
+    - full (bool): Whether the collection must be rewritten as a whole.
+    - upserts (dict): The added or changed objects keyed by their key.
+    - deletes (dict): The deleted keys, used as an ordered set.
+    """
+
+    def __init__(self):
+        self.items = ()
+        self.full = False
+        self.upserts = {}
+        self.deletes = {}
+
+    def merge(self, key, upserts, deletes):
+        """
+        Merges named changes into the batch, so a later change to a record replaces an earlier one.
+
+        Args:
+        - key (callable): Returns the key of an object of the collection.
+        - upserts (list): The objects added or changed, or None.
+        - deletes (list): The keys of the objects deleted, or None.
+        """
+        for item_key in deletes or ():
+            self.upserts.pop(item_key, None)
+            self.deletes[item_key] = None
+        for item in upserts or ():
+            item_key = key(item)
+            self.deletes.pop(item_key, None)
+            self.upserts[item_key] = item
+
+
+class PendingSaves:
+    """
+    The changes to one collection that a manager made but has not saved yet, so that the
+    manager lock is not held while they are written.
+
+    A thread records its changes with add() while holding the manager lock, and calls
+    save() once it has released it. save() holds the save lock while it writes, so saves
+    reach the storage in order, and it writes every change recorded so far: a thread whose
+    changes another thread is already writing only waits for that write, so changes made
+    at the same time are written as one group. Other operations that save the collection
+    hold the save lock too, before the manager lock, so the collection can be read while
+    it is written.
+
+    Attributes:
+    - key (callable): Returns the key of an object of the collection.
+    - lock (RLock): The save lock, held while the collection is written.
+    """
+
+    def __init__(self, key):
+        """
+        Initializes a PendingSaves object without changes.
+
+        Args:
+        - key (callable): Returns the key of an object of the collection.
+        """
+        self.key = key
+        self.lock = threading.RLock()
+        self._batch = _Batch()
+        self._batch_lock = threading.Lock()
+
+    def add(self, upserts=None, deletes=None):
+        """
+        Records changes to be written by the next save().
+
+        Args:
+        - upserts (list): The objects added or changed (default is None).
+        - deletes (list): The keys of the objects deleted (default is None).
+        """
+        with self._batch_lock:
+            self._batch.merge(self.key, upserts, deletes)
+
+    def save(self, save):
+        """
+        Writes the recorded changes, or returns once the save writing them is done.
+        Must be called without the manager lock held.
+
+        Args:
+        - save (callable): Writes the changes, given the lists of upserts and deletes as keywords.
+        """
+        with self.lock:
+            with self._batch_lock:
+                batch, self._batch = self._batch, _Batch()
+            if batch.upserts or batch.deletes:
+                save(upserts=list(batch.upserts.values()), deletes=list(batch.deletes))
+
+
+class BufferedStorage(BaseStorage):
+    """
+    A storage backend that queues saves to a background writer thread in front of another backend.
+
+    Saves return at once. The writer waits until max_delay seconds have passed since the
+    first queued change, or until max_batch changes are queued, and then writes them as one
+    group: the changes to each collection are coalesced, so a record changed many times is
+    written once, and a save without named changes turns the group into a single rewrite
+    of the collection. Objects are converted when the group is written, so each write
+    stores their latest state.
+
+    flush() is the durability barrier: it returns once every save queued before the call
+    has been written and the backend has been flushed, which under the "batched" fsync
+    policy syncs the whole group to disk at once. If a write fails, its changes stay
+    queued and are retried with the next group, and flush() raises a StorageError until a
+    retry succeeds, so a caller never takes a failed save for a committed one. Loads and lookups flush first, so they always see the queued
+    changes. close() flushes and stops the writer; it also runs at interpreter exit. With neither a
+    max_delay nor a max_batch, changes are only written by flush() and close(), so a whole batch
+    of operations is committed as one group. close() raises a StorageError if the last
+    group could not be written.
+
+    Attributes:
+    - storage (BaseStorage): The backend the changes are written to.
+    - max_delay (float): The longest time in seconds a change waits before it is written, or None for no limit.
+    - max_batch (int): The number of queued changes that triggers a write at once, or None for no limit.
+    """
+
+    KEYS = {"books": attrgetter("isbn"), "users": attrgetter("user_id"), "checkouts": attrgetter("isbn")}
+
+    def __init__(self, storage, max_delay=0.5, max_batch=1000):
+        """
+        Initializes a BufferedStorage instance and starts its writer thread.
+
+        Args:
+        - storage (BaseStorage): The backend the changes are written to.
+        - max_delay (float): The longest time in seconds a change waits before it is written, or None
+          for no limit (default is 0.5).
+        - max_batch (int): The number of queued changes that triggers a write at once, or None for no
+          limit (default is 1000).
+        """
+        self.storage = storage
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._condition = threading.Condition()
+        self._storage_lock = threading.Lock()
+        self._pending = {}
+        self._pending_changes = 0
+        self._first_change = None
+        self._queued = 0
+        self._written = 0
+        self._flush_target = 0
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def load_books(self):
+        """
+        Flushes the queued changes and loads all books from the backend.
+
+        Returns:
+        - list: A list of Book objects.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.load_books()
+
+    def save_books(self, books, upserts=None, deletes=None):
+        """
+        Queues a save of the books.
+
+        Args:
+        - books (list): A list of Book objects to be saved.
+        - upserts (list): The Book objects added or changed since the last save (default is None).
+        - deletes (list): The ISBNs of the books deleted since the last save (default is None).
+        """
+        self._queue("books", books, upserts, deletes)
+
+    def load_users(self, books=None):
+        """
+        Flushes the queued changes and loads all users from the backend.
+
+        Args:
+        - books (dict): An identity map of the loaded books keyed by ISBN (default is None).
+
+        Returns:
+        - list: A list of User objects.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.load_users(books)
+
+    def save_users(self, users, upserts=None, deletes=None):
+        """
+        Queues a save of the users.
+
+        Args:
+        - users (list): A list of User objects to be saved.
+        - upserts (list): The User objects added or changed since the last save (default is None).
+        - deletes (list): The IDs of the users deleted since the last save (default is None).
+        """
+        self._queue("users", users, upserts, deletes)
+
+    def load_checkouts(self):
+        """
+        Flushes the queued changes and loads all checkouts from the backend.
+
+        Returns:
+        - list: A list of Checkout objects.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.load_checkouts()
+
+    def save_checkouts(self, checkouts, upserts=None, deletes=None):
+        """
+        Queues a save of the checkouts.
+
+        Args:
+        - checkouts (list): A list of Checkout objects to be saved.
+        - upserts (list): The checkouts added since the last save (default is None).
+        - deletes (list): The ISBNs of the books checked in since the last save (default is None).
+        """
+        self._queue("checkouts", checkouts, upserts, deletes)
+
+    def get_book(self, isbn):
+        """
+        Flushes the queued changes and retrieves a single book from the backend.
+
+        Args:
+        - isbn (str): The ISBN of the book.
+
+        Returns:
+        - Book or None: The stored book if found, None otherwise.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.get_book(isbn)
+
+    def get_user(self, user_id):
+        """
+        Flushes the queued changes and retrieves a single user from the backend.
+
+        Args:
+        - user_id (str): The ID of the user.
+
+        Returns:
+        - User or None: The stored user if found, None otherwise.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.get_user(user_id)
+
+    def find_books(self, title=None, author=None, isbn=None):
+        """
+        Flushes the queued changes and searches the books of the backend.
+
+        Args:
+        - title (str): The title to search for.
+        - author (str): The author to search for.
+        - isbn (str): The ISBN to search for.
+
+        Returns:
+        - list: The matching Book objects.
+        """
+        self.flush()
+        with self._storage_lock:
+            return self.storage.find_books(title, author, isbn)
+
+    def flush(self):
+        """
+        Blocks until every save queued before the call has been written to the backend.
+
+        Raises:
+        - StorageError: If a write failed and has not been retried successfully since.
+        """
+        with self._condition:
+            target = self._queued
+            if self._written < target:
+                self._flush_target = max(self._flush_target, target)
+                self._condition.notify_all()
+                while self._written < target:
+                    self._condition.wait()
+            error = self._error
+        if error is not None:
+            raise error
+
+    def close(self):
+        """
+        Writes the queued changes, stops the writer thread, and closes the backend.
+
+        Raises:
+        - StorageError: If the queued changes could not be written.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        self.storage.close()
+        if self._error is not None:
+            raise self._error
+
+    def _queue(self, kind, items, upserts, deletes):
+        """
+        Adds a save to the pending changes of a collection, or writes it at once after close().
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - items (iterable): The whole collection.
+        - upserts (list): The objects added or changed, or None.
+        - deletes (list): The keys of the objects deleted, or None.
+        """
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._coalesce(kind, items, upserts, deletes)
+        if closed:
+            with self._storage_lock:
+                getattr(self.storage, f"save_{kind}")(items, upserts=upserts, deletes=deletes)
+
+    def _coalesce(self, kind, items, upserts, deletes):
+        """
+        Merges a save into the pending changes of a collection. Must be called with the condition held.
+
+        Args:
+        - kind (str): The collection: "books", "users", or "checkouts".
+        - items (iterable): The whole collection.
+        - upserts (list): The objects added or changed, or None.
+        - deletes (list): The keys of the objects deleted, or None.
+        """
+        batch = self._pending.setdefault(kind, _Batch())
+        batch.items = items
+        if upserts is None and deletes is None:
+            batch.full = True
+            batch.upserts.clear()
+            batch.deletes.clear()
+            self._pending_changes += 1
+        elif not batch.full:
+            batch.merge(self.KEYS[kind], upserts, deletes)
+            self._pending_changes += len(upserts or ()) + len(deletes or ())
+        self._queued += 1
+        if self._first_change is None:
+            self._first_change = time.monotonic()
+        self._condition.notify_all()
+
+    def _run(self):
+        """
+        The writer thread: waits for a group of changes to be due and writes it.
+        """
+        while True:
+            with self._condition:
+                while True:
+                    if self._pending:
+                        remaining = None
+                        if self.max_delay is not None:
+                            remaining = self._first_change + self.max_delay - time.monotonic()
+                        if ((remaining is not None and remaining <= 0) or self._closed
+                                or (self.max_batch is not None and self._pending_changes >= self.max_batch)
+                                or self._flush_target > self._written):
+                            break
+                        self._condition.wait(remaining)
+                    elif self._closed:
+                        return
+                    else:
+                        self._condition.wait()
+                pending, self._pending = self._pending, {}
+                queued = self._queued
+                self._pending_changes = 0
+                self._first_change = None
+            failed, error = self._write(pending)
+            with self._condition:
+                self._error = error
+                if failed and not self._closed:
+                    self._requeue(failed)
+                self._written = queued
+                self._condition.notify_all()
+
+    def _requeue(self, failed):
+        """
+        Puts the changes of failed writes back in front of the changes queued since, so
+        the next group retries them. Must be called with the condition held.
+
+        Args:
+        - failed (dict): The _Batch of each collection that could not be written.
+        """
+        for kind, batch in failed.items():
+            newer = self._pending.get(kind)
+            if newer is not None:
+                if newer.full:
+                    continue
+                batch.items = newer.items
+                if not batch.full:
+                    batch.merge(self.KEYS[kind], newer.upserts.values(), newer.deletes)
+            self._pending[kind] = batch
+        self._queued += 1
+        if self._first_change is None:
+            self._first_change = time.monotonic()
+
+    def _write(self, pending):
+        """
+        Writes a group of coalesced changes to the backend and flushes it.
+
+        Args:
+        - pending (dict): The _Batch of each changed collection.
+
+        Returns:
+        - tuple: The _Batch of each collection that could not be written, and the StorageError
+          of the last failure, or None if every write succeeded.
+        """
+        failed, error = {}, None
+        with self._storage_lock:
+            for kind, batch in pending.items():
+                save = getattr(self.storage, f"save_{kind}")
+                try:
+                    if batch.full:
+                        save(list(batch.items))
+                    else:
+                        save(list(batch.items), upserts=list(batch.upserts.values()), deletes=list(batch.deletes))
+                except Exception as e:
+                    failed[kind] = batch
+                    error = StorageError(f"Unable to save {kind}: {e}")
+            try:
+                self.storage.flush()
+            except Exception as e:
+                error = StorageError(f"Unable to flush the saves: {e}")
+        return failed, error